@@ -10,7 +10,8 @@ const router = createRouter({
   routes: [
     { path: '/', name: 'home', component: Home, meta: { title: 'Home' } },
     { path: '/quiz/:slug', name: 'quiz', component: Quiz, meta: { title: 'Quiz' } },
-    { path: '/results', name: 'results', component: Results, meta: { title: 'Resultados' } },
+    // back_urls do Mercado Pago (preferences.py) caem na página de resultado
+    { path: '/results', name: 'results', component: Results, alias: ['/quiz/sucesso', '/quiz/aguardando', '/quiz/erro'], meta: { title: 'Resultados' } },
     { path: '/:pathMatch(.*)*', name: '404', component: NotFound, meta: { title: 'Não encontrado' } },
   ],
 })
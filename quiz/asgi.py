@@ -13,4 +13,33 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quiz.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402  (depois do setup)
+
+if settings.QUIZ_ASYNC_VIEWS:
+    # sem o WhiteNoiseMiddleware (ver settings): os estáticos são servidos aqui, antes do
+    # Django, pelo WhiteNoise WSGI numa thread; o resto das requisições segue 100% async
+    from asgiref.wsgi import WsgiToAsgi
+    from whitenoise import WhiteNoise
+
+    def _not_found(environ, start_response):
+        start_response("404 Not Found", [("Content-Type", "text/plain")])
+        return [b"Not Found"]
+
+    static_prefix = "/" + settings.STATIC_URL.strip("/") + "/"
+    static_application = WsgiToAsgi(WhiteNoise(
+        _not_found,
+        root=settings.STATIC_ROOT,
+        prefix=static_prefix,
+        max_age=60,
+        # nomes com hash do ManifestStaticFilesStorage: cache "para sempre"
+        immutable_file_test=r"^.+\.[0-9a-f]{12}\..+$",
+    ))
+
+    async def application(scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(static_prefix):
+            return await static_application(scope, receive, send)
+        return await django_application(scope, receive, send)
+else:
+    application = django_application
@@ -26,6 +26,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "quizapp.metrics.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -104,3 +105,75 @@ QUIZ_PRICE        = float(os.getenv("QUIZ_PRICE", "1.00"))
 CURRENCY          = os.getenv("CURRENCY", "BRL")
 API_BASE_URL      = os.getenv("API_BASE_URL", "http://localhost:3000")
 APP_BASE_URL      = os.getenv("APP_BASE_URL", "http://localhost:5173")
+MP_API_BASE_URL   = os.getenv("MP_API_BASE_URL", "https://api.mercadopago.com")
+MP_TIMEOUT        = float(os.getenv("MP_TIMEOUT", "5"))   # segundos
+MP_POOL_SIZE      = int(os.getenv("MP_POOL_SIZE", "10"))
+MP_BREAKER_THRESHOLD = int(os.getenv("MP_BREAKER_THRESHOLD", "5"))    # falhas seguidas até abrir o circuito
+MP_BREAKER_RESET     = float(os.getenv("MP_BREAKER_RESET", "30"))     # segundos até a chamada de teste
+PAYMENT_GATEWAY   = os.getenv("PAYMENT_GATEWAY", "quizapp.payments.MercadoPagoGateway")  # ou quizapp.payments.StubGateway
+# sync: finish espera o MP | background: cria após o finish | prefetch: cria já no start
+MP_PREFERENCE_MODE    = os.getenv("MP_PREFERENCE_MODE", "sync")
+MP_PREFERENCE_WORKERS = int(os.getenv("MP_PREFERENCE_WORKERS", "4"))
+
+# snapshots/gabaritos compilados por versão do quiz
+QUIZ_CACHE_LRU_SIZE = int(os.getenv("QUIZ_CACHE_LRU_SIZE", "128"))
+QUIZ_SHARED_CACHE = os.getenv("QUIZ_SHARED_CACHE") or None   # alias em CACHES, ex: "default"; guarda também a versão do catálogo (ETag sem query)
+# "rows": uma linha de Answer por resposta | "packed": bytes compactos em QuizSession.packed_answers
+QUIZ_ANSWER_STORAGE = os.getenv("QUIZ_ANSWER_STORAGE", "rows")
+
+# funil start/answer/finish/result/webhook em views async (exige servidor ASGI)
+QUIZ_ASYNC_VIEWS = os.getenv("QUIZ_ASYNC_VIEWS", "").lower() in ("1", "true", "yes")
+if QUIZ_ASYNC_VIEWS:
+    # WhiteNoise é só sync e obrigaria o Django a rodar toda a cadeia em thread (sync_to_async);
+    # no ASGI os estáticos saem antes do Django (quiz/asgi.py) e a cadeia fica toda async
+    MIDDLEWARE.remove("whitenoise.middleware.WhiteNoiseMiddleware")
+
+# /metrics (Prometheus): diretório compartilhado entre os workers do gunicorn
+METRICS_DIR = os.getenv("METRICS_DIR") or None
+# exige "Authorization: Bearer <token>" no /metrics; vazio = 404 (aberto só com DEBUG)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Cache-Control das rotas de catálogo/perguntas (com ETag; o CDN revalida com If-None-Match)
+QUIZ_CATALOG_CACHE_CONTROL = {"public": True, "max_age": 60, "s_maxage": 300, "stale_while_revalidate": 600}
+QUIZ_QUESTIONS_CACHE_CONTROL = {"public": True, "max_age": 300, "s_maxage": 3600, "stale_while_revalidate": 86400}
+
+# capas: variantes WebP/JPEG por largura, geradas no upload (background | sync)
+QUIZ_COVER_WIDTHS     = tuple(int(w) for w in os.getenv("QUIZ_COVER_WIDTHS", "320,640,1280").split(","))
+QUIZ_COVER_QUALITY    = int(os.getenv("QUIZ_COVER_QUALITY", "80"))
+QUIZ_COVER_PROCESSING = os.getenv("QUIZ_COVER_PROCESSING", "background")
+QUIZ_COVER_WORKERS    = int(os.getenv("QUIZ_COVER_WORKERS", "2"))
+
+# mídia: accel (nginx X-Accel-Redirect) | sendfile (X-Sendfile) | stream (FileResponse + Range) | off
+MEDIA_SERVE_MODE    = os.getenv("MEDIA_SERVE_MODE", "stream")
+MEDIA_ACCEL_PREFIX  = os.getenv("MEDIA_ACCEL_PREFIX", "/protected-media/")
+MEDIA_CACHE_CONTROL = os.getenv("MEDIA_CACHE_CONTROL", "public, max-age=3600")
+
+# tokens de resultado assinados (GetResult sem banco); trocar SECRET_KEY revoga todos
+RESULT_TOKEN_MAX_AGE = int(os.getenv("RESULT_TOKEN_MAX_AGE", str(7 * 24 * 3600)))
+
+# db: start grava a sessão | stateless: token assinado no start, tudo gravado só no finish
+QUIZ_SESSION_MODE = os.getenv("QUIZ_SESSION_MODE", "db")
+QUIZ_SESSION_TOKEN_MAX_AGE = int(os.getenv("QUIZ_SESSION_TOKEN_MAX_AGE", str(24 * 3600)))
+
+# pontuação: exact (tudo ou nada por pergunta) | partial (crédito parcial nas de várias corretas)
+QUIZ_SCORING = os.getenv("QUIZ_SCORING", "exact")
+
+# banco de questões: segundos até recompilar os estratos com as taxas de acerto atuais
+QUIZ_POOL_REFRESH = int(os.getenv("QUIZ_POOL_REFRESH", "600"))
+
+# admin: acima disso (estimativa do postgres) a paginação mostra o total estimado em vez do COUNT(*)
+ADMIN_EXACT_COUNT_BELOW = int(os.getenv("ADMIN_EXACT_COUNT_BELOW", "10000"))
+
+# limite de taxa do funil por rota e escopo ("N/s|m|h|d"; vazio = sem limite), 429 + Retry-After.
+# Desligado por padrão: só ligue com cache compartilhado (redis/memcached) em RATE_LIMIT_CACHE e,
+# atrás de proxy (Render), RATE_LIMIT_NUM_PROXIES > 0 — senão todos os visitantes dividem o mesmo IP.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "").lower() in ("1", "true", "yes")
+RATE_LIMIT_CACHE = os.getenv("RATE_LIMIT_CACHE", "default")   # alias em CACHES
+RATE_LIMIT_NUM_PROXIES = int(os.getenv("RATE_LIMIT_NUM_PROXIES", "0"))   # proxies confiáveis à frente (X-Forwarded-For)
+QUIZ_RATE_LIMITS = {
+    "start": {"ip": os.getenv("RATE_LIMIT_START_IP", "30/m")},
+    "answer": {
+        "ip": os.getenv("RATE_LIMIT_ANSWER_IP", "600/m"),
+        "session": os.getenv("RATE_LIMIT_ANSWER_SESSION", "120/m"),
+    },
+} if RATE_LIMIT_ENABLED else {}
@@ -1,5 +1,35 @@
+import uuid
+
 from django.contrib import admin
-from .models import Quiz, QuizSession, Question, Choice, Answer
+from django.db.models import Q
+from .models import Quiz, QuizSession, Question, Choice, Answer, PaymentNotification
+from .cache import bump_quiz_version
+from .covers import schedule_cover_processing
+from .paginators import EstimatedCountPaginator
+
+
+def parse_uuid(value):
+    try:
+        return uuid.UUID(value.strip())
+    except (AttributeError, ValueError):
+        return None
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist de tabela grande: total estimado, sem o segundo COUNT(*) do
+    "x de y" e só as colunas de list_only (o formulário de edição carrega tudo).
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_only = ()
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        match = request.resolver_match
+        if self.list_only and match and match.url_name.endswith("_changelist"):
+            qs = qs.only(*self.list_only)
+        return qs
 
 class ChoiceInline(admin.TabularInline):
     model = Choice
@@ -9,23 +39,68 @@ class ChoiceInline(admin.TabularInline):
 
 @admin.register(Quiz)
 class QuizAdmin(admin.ModelAdmin):
-    list_display = ("slug", "title", "is_active")
+    list_display = ("slug", "title", "is_active", "sample_size")
     search_fields = ("slug", "title")
     list_filter = ("is_active",)
 
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # sem version/cover_variants (não editáveis): o valor lido antes da edição
+        # desfaria um bump concorrente e reaproveitaria o número da versão
+        obj.save(update_fields=[f.name for f in obj._meta.concrete_fields if f.editable and not f.primary_key])
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        bump_quiz_version(form.instance)
+        if "cover" in form.changed_data:
+            schedule_cover_processing(form.instance)
+
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
     list_display = ("quiz", "order", "slug", "title", "kind", "weight", "required")
+    list_select_related = ("quiz",)
     list_filter = ("quiz", "kind", "required")
     search_fields = ("slug", "title")
     ordering = ("quiz", "order")
     inlines = [ChoiceInline]
 
+    # qualquer alteração de pergunta/alternativas invalida o snapshot do quiz
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        bump_quiz_version(form.instance.quiz)
+
+    def delete_model(self, request, obj):
+        quiz = obj.quiz
+        super().delete_model(request, obj)
+        bump_quiz_version(quiz)
+
+    def delete_queryset(self, request, queryset):
+        quizzes = list(Quiz.objects.filter(questions__in=queryset).distinct())
+        super().delete_queryset(request, queryset)
+        for quiz in quizzes:
+            bump_quiz_version(quiz)
+
 @admin.register(QuizSession)
-class QuizSessionAdmin(admin.ModelAdmin):
+class QuizSessionAdmin(LargeTableAdmin):
     list_display = ("id", "quiz", "created_at", "paid_display", "mp_pref_display", "mp_payment_display")
+    # created_at: faixas fixas (hoje, 7 dias, mês, ano) pelo índice; sem date_hierarchy,
+    # que roda um SELECT DISTINCT de datas sobre a tabela inteira a cada carga da lista
     list_filter = ("quiz", "created_at")  # remova 'paid' daqui pois não é Field
-    search_fields = ("id",)
+    list_select_related = ("quiz",)
+    list_only = ("id", "quiz__title", "created_at", "paid", "mp_pref_id", "mp_payment_id")
+    ordering = ("-created_at",)
+    search_fields = ("id", "mp_pref_id", "mp_payment_id")   # busca exata, ver get_search_results
+
+    def get_search_results(self, request, queryset, search_term):
+        # igualdade nos campos indexados em vez de icontains (full scan)
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        session_id = parse_uuid(term)
+        if session_id is not None:
+            return queryset.filter(pk=session_id), False
+        return queryset.filter(Q(mp_pref_id=term) | Q(mp_payment_id=term)), False
 
     def paid_display(self, obj):
         if hasattr(obj, "paid"):
@@ -43,6 +118,25 @@ class QuizSessionAdmin(admin.ModelAdmin):
     mp_payment_display.short_description = "MP Payment ID"
 
 @admin.register(Answer)
-class AnswerAdmin(admin.ModelAdmin):
-    list_display = ("session", "question")
-    search_fields = ("session__id", "question__slug")
\ No newline at end of file
+class AnswerAdmin(LargeTableAdmin):
+    list_display = ("session_id", "question")
+    list_select_related = ("question__quiz",)
+    list_only = ("id", "session_id", "question__order", "question__title", "question__quiz__slug")
+    raw_id_fields = ("session", "question")
+    search_fields = ("session__id", "question__slug")   # busca exata, ver get_search_results
+
+    def get_search_results(self, request, queryset, search_term):
+        # UUID → respostas da sessão (índice de session); senão slug exato da pergunta
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        session_id = parse_uuid(term)
+        if session_id is not None:
+            return queryset.filter(session_id=session_id), False
+        return queryset.filter(question__slug=term), False
+
+@admin.register(PaymentNotification)
+class PaymentNotificationAdmin(LargeTableAdmin):
+    list_display = ("payment_id", "status", "payment_status", "attempts", "next_attempt_at", "processed_at")
+    list_filter = ("status", "payment_status")
+    search_fields = ("payment_id",)
@@ -0,0 +1,193 @@
+"""
+Estatísticas por pergunta mantidas incrementalmente.
+
+Na primeira correção de cada sessão (FinishQuiz) as respostas viram deltas
+somados no banco com INSERT ... ON CONFLICT DO UPDATE SET n = n + excluded.n:
+uma query por tabela, atômica, sem ler as linhas antes. A leitura (endpoint de
+analytics) custa O(perguntas), independente do número de sessões.
+O histograma de notas (ScoreBucket, 0..100) segue a mesma regra e dá o
+percentil de qualquer resultado sem varrer as sessões.
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+
+from .answer_key import LETTERS
+from .models import QuestionStats, ChoiceStats, QuizSession, ScoreBucket
+
+
+def answer_deltas(key, pairs, attempts=None, correct=None, letters=None):
+    """
+    Acumula os deltas de uma sessão: pares (question_id, bitmask) → contadores
+    attempts/correct por pergunta e letters por (pergunta, letra).
+    Só conta perguntas do gabarito atual que foram respondidas.
+    """
+    attempts = Counter() if attempts is None else attempts
+    correct = Counter() if correct is None else correct
+    letters = Counter() if letters is None else letters
+    for question_id, mask in pairs:
+        pos = key.pos_by_id.get(question_id)
+        if pos is None or not mask:
+            continue
+        attempts[question_id] += 1
+        if key.masks[pos] and mask == key.masks[pos]:
+            correct[question_id] += 1
+        for i, letter in enumerate(LETTERS):
+            if mask & (1 << i):
+                letters[(question_id, letter)] += 1
+    return attempts, correct, letters
+
+
+def _upsert_add(model, conflict, columns, rows):
+    """INSERT ... ON CONFLICT (conflict) DO UPDATE SET c = c + excluded.c (sqlite ≥ 3.24 e postgres)."""
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    placeholders = ", ".join(["(" + ", ".join(["%s"] * len(columns)) + ")"] * len(rows))
+    increments = [c for c in columns if c not in conflict and not c.endswith("_id")]
+    sql = (
+        f"INSERT INTO {table} ({', '.join(qn(c) for c in columns)}) VALUES {placeholders} "
+        f"ON CONFLICT ({', '.join(qn(c) for c in conflict)}) DO UPDATE SET "
+        + ", ".join(f"{qn(c)} = {table}.{qn(c)} + excluded.{qn(c)}" for c in increments)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [v for row in rows for v in row])
+
+
+def apply_deltas(quiz_id, attempts, correct, letters):
+    # linhas ordenadas pela chave: sessões concorrentes travam na mesma ordem (sem deadlock)
+    _upsert_add(
+        QuestionStats, ["question_id"], ["question_id", "quiz_id", "attempts", "correct"],
+        [(qid, quiz_id, n, correct.get(qid, 0)) for qid, n in sorted(attempts.items())],
+    )
+    _upsert_add(
+        ChoiceStats, ["question_id", "letter"], ["question_id", "quiz_id", "letter", "count"],
+        [(qid, quiz_id, letter, n) for (qid, letter), n in sorted(letters.items())],
+    )
+
+
+def score_bucket(result):
+    """Percentual inteiro (0..100) do resultado, ou None se não houver."""
+    percent = (result or {}).get("percent")
+    if percent is None:
+        return None
+    return min(max(int(round(percent)), 0), 100)
+
+
+def add_scores(quiz_id, counts):
+    """Soma {percent: n} ao histograma do quiz."""
+    _upsert_add(
+        ScoreBucket, ["quiz_id", "percent"], ["quiz_id", "percent", "count"],
+        [(quiz_id, p, n) for p, n in sorted(counts.items()) if p is not None],
+    )
+
+
+def _aggregates(percent):
+    return {
+        "below": Sum("count", filter=Q(percent__lt=percent)),
+        "equal": Sum("count", filter=Q(percent=percent)),
+        "total": Sum("count"),
+    }
+
+
+def _percentile(agg):
+    # posição média: metade dos empatados conta como "abaixo"
+    total = agg["total"] or 0
+    if not total:
+        return None
+    return round(((agg["below"] or 0) + (agg["equal"] or 0) / 2) / total * 100, 1)
+
+
+def with_percentile(quiz_id, result):
+    """Resultado + percentil da nota entre as sessões do quiz (uma query sobre ≤ 101 linhas)."""
+    p = score_bucket(result)
+    if p is None or quiz_id is None:
+        return result
+    agg = ScoreBucket.objects.filter(quiz_id=quiz_id).aggregate(**_aggregates(p))
+    return {**result, "percentile": _percentile(agg)}
+
+
+async def awith_percentile(quiz_id, result):
+    p = score_bucket(result)
+    if p is None or quiz_id is None:
+        return result
+    agg = await ScoreBucket.objects.filter(quiz_id=quiz_id).aaggregate(**_aggregates(p))
+    return {**result, "percentile": _percentile(agg)}
+
+
+def count_graded(quiz_id, result, key, pairs):
+    """Soma uma sessão recém-corrigida às estatísticas e ao histograma do quiz."""
+    apply_deltas(quiz_id, *answer_deltas(key, pairs))
+    add_scores(quiz_id, Counter([score_bucket(result)]))
+
+
+def missing_sessions(quiz_ids) -> dict:
+    """
+    {quiz_id: n} de sessões corrigidas que o histograma conta mas que não estão mais
+    no banco (archive_sessions). Reconstruir as estatísticas só a partir do banco
+    apagaria esse histórico.
+    """
+    counted = (
+        ScoreBucket.objects.filter(quiz_id__in=quiz_ids).order_by()
+        .values("quiz_id").annotate(n=Sum("count")).values_list("quiz_id", "n")
+    )
+    present = dict(
+        QuizSession.objects.filter(quiz_id__in=quiz_ids, result__isnull=False).order_by()
+        .values("quiz_id").annotate(n=Count("id")).values_list("quiz_id", "n")
+    )
+    return {qid: n - present.get(qid, 0) for qid, n in counted if n > present.get(qid, 0)}
+
+
+def record_result(session, result, key, pairs) -> bool:
+    """
+    Persiste o resultado da sessão. Na primeira correção (result ainda nulo)
+    a gravação é um UPDATE condicional e as respostas entram nas estatísticas;
+    correções repetidas só regravam o resultado. Devolve True se foi a primeira.
+    """
+    first = False
+    if session.result is None:
+        with transaction.atomic():
+            first = bool(QuizSession.objects.filter(pk=session.pk, result__isnull=True).update(result=result))
+            if first:
+                count_graded(session.quiz_id, result, key, pairs)
+    session.result = result
+    if not first:
+        session.save(update_fields=["result"])
+    return first
+
+
+def quiz_analytics(quiz, key, snapshot) -> dict:
+    """Distribuição de escolhas e dificuldade por pergunta, na ordem do quiz."""
+    rows = QuestionStats.objects.filter(quiz=quiz).values_list("question_id", "attempts", "correct")
+    stats = {qid: (attempts, correct) for qid, attempts, correct in rows}
+    choices = {}
+    for qid, letter, count in ChoiceStats.objects.filter(quiz=quiz).values_list("question_id", "letter", "count"):
+        choices.setdefault(qid, {})[letter] = count
+
+    questions = []
+    for item in snapshot["questions"]:
+        pos = key.pos_by_slug.get(item["slug"])
+        if pos is None:
+            continue   # snapshot e gabarito de versões diferentes (edição em andamento)
+        qid = key.ids[pos]
+        attempts, correct = stats.get(qid, (0, 0))
+        counts = choices.get(qid, {})
+        questions.append({
+            "slug": item["slug"],
+            "title": item["title"],
+            "attempts": attempts,
+            "correct": correct,
+            "correct_rate": round(correct / attempts, 4) if attempts else None,
+            "difficulty": round(1 - correct / attempts, 4) if attempts else None,
+            "choices": {
+                letter: {
+                    "label": label,
+                    "count": counts.get(letter, 0),
+                    "share": round(counts.get(letter, 0) / attempts, 4) if attempts else None,
+                }
+                for letter, label in item["options"].items()
+            },
+        })
+    return {"quiz": quiz.slug, "version": key.version, "questions": questions}
@@ -0,0 +1,67 @@
+from .cache import get_versioned, aget_versioned
+
+LETTERS = ("a", "b", "c", "d")
+_LETTER_BIT = {letter: 1 << i for i, letter in enumerate(LETTERS)}
+_INVALID_BIT = 1 << len(LETTERS)   # marca escolhas fora de a..d (nunca batem com o gabarito)
+
+
+def letters_mask(selected) -> int:
+    """Converte uma lista de letras ("a".."d") em bitmask."""
+    if isinstance(selected, str):
+        selected = [selected]
+    mask = 0
+    for letter in selected or ():
+        mask |= _LETTER_BIT.get(letter, _INVALID_BIT)
+    return mask
+
+
+class AnswerKey:
+    """
+    Gabarito compilado e imutável de uma versão do quiz.
+    Vetores paralelos indexados pela posição da pergunta no quiz:
+      - slugs / ids / weights / required
+      - masks: bitmask das letras corretas (a=1, b=2, c=4, d=8; 0 = sem gabarito)
+      - values: frozenset com os `value` das alternativas corretas
+    """
+    __slots__ = ("version", "slugs", "ids", "weights", "required", "masks", "values",
+                 "pos_by_slug", "pos_by_id")
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.slugs = tuple(r[0] for r in rows)
+        self.ids = tuple(r[1] for r in rows)
+        self.weights = tuple(r[2] for r in rows)
+        self.required = tuple(r[3] for r in rows)
+        self.masks = tuple(r[4] for r in rows)
+        self.values = tuple(r[5] for r in rows)
+        self.pos_by_slug = {slug: i for i, slug in enumerate(self.slugs)}
+        self.pos_by_id = {qid: i for i, qid in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.slugs)
+
+    @property
+    def max_points(self) -> float:
+        return sum(self.weights)
+
+
+def build_answer_key(quiz) -> AnswerKey:
+    rows = []
+    for q in quiz.questions.prefetch_related("choices").order_by("order", "id"):
+        choices = sorted(q.choices.all(), key=lambda ch: (ch.order, ch.id))
+        mask = 0
+        for i, ch in enumerate(choices[:len(LETTERS)]):
+            if ch.is_correct:
+                mask |= 1 << i
+        values = frozenset(ch.value for ch in choices if ch.is_correct)
+        rows.append((q.slug, q.id, q.weight, q.required, mask, values))
+    return AnswerKey(quiz.version, rows)
+
+
+def get_answer_key(quiz) -> AnswerKey:
+    """Gabarito da versão atual do quiz (mesmo cache/invalidação dos snapshots)."""
+    return get_versioned("answer_key", quiz, build_answer_key)
+
+
+async def aget_answer_key(quiz) -> AnswerKey:
+    return await aget_versioned("answer_key", quiz, build_answer_key)
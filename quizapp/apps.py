@@ -1,6 +1,23 @@
+import logging
+
 from django.apps import AppConfig
 
+log = logging.getLogger(__name__)
+
 
 class QuizappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'quizapp'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+
+        from .cache import catalog_changed
+        from .ratelimit import config_warnings
+
+        quiz = self.get_model("Quiz")
+        post_save.connect(catalog_changed, sender=quiz, dispatch_uid="quizapp.catalog_save")
+        post_delete.connect(catalog_changed, sender=quiz, dispatch_uid="quizapp.catalog_delete")
+
+        for problem in config_warnings():
+            log.warning(problem)
@@ -0,0 +1,212 @@
+"""
+Versões async (ASGI) do funil start → answer → finish → result + webhook.
+Usam o ORM async do Django e o cliente HTTP async do gateway de pagamento;
+ativadas com QUIZ_ASYNC_VIEWS=1 (as views DRF síncronas continuam como fallback).
+"""
+import json
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse, HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .analytics import awith_percentile, record_result
+from .answer_key import aget_answer_key, letters_mask
+from .models import Quiz, QuizSession, Answer
+from .outbox import aenqueue_payment
+from .packed import packed_mode, save_packed_answers, unpack
+from .pools import sample_questions
+from .ratelimit import rate_limited
+from .payments import get_gateway, GatewayUnavailable
+from .preferences import acreate_preference, preference_data, request_preference
+from .serializers import SaveAnswersSerializer
+from .snapshots import aget_quiz_snapshot
+from .stateless import (
+    stateless_mode, session_token, read_session_token, session_token_from_request, selected_by_id,
+    persist_finished_session,
+)
+from .tokens import result_token, read_result_token, token_from_request
+from .views import grade_masks, served_pairs
+
+
+def _json_body(req) -> dict:
+    try:
+        data = json.loads(req.body or b"{}")
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+async def _get_session(session_id, **filters):
+    try:
+        return await QuizSession.objects.select_related("quiz").aget(pk=session_id, **filters)
+    except (QuizSession.DoesNotExist, ValidationError):
+        return None
+
+
+@csrf_exempt
+@require_POST
+async def start_quiz(req):
+    limited = await sync_to_async(rate_limited)(req, "start")
+    if limited:
+        return limited
+    slug = _json_body(req).get("slug")
+    if not slug:
+        return JsonResponse({"error": "Missing slug"}, status=400)
+    try:
+        quiz = await Quiz.objects.aget(slug=slug, is_active=True)
+    except Quiz.DoesNotExist:
+        return JsonResponse({"error": "quiz not found"}, status=404)
+
+    snapshot = await aget_quiz_snapshot(quiz)
+    sample = await sync_to_async(sample_questions)(quiz, await aget_answer_key(quiz))
+    question_ids, questions = None, snapshot["questions"]
+    if sample is not None:
+        question_ids, positions = sample
+        questions = [snapshot["questions"][pos] for pos in positions]
+
+    if stateless_mode():
+        session_id = uuid.uuid4()
+        return JsonResponse({
+            "session_id": str(session_id),
+            "session_token": session_token(session_id, quiz, question_ids),
+            "quiz": snapshot["quiz"],
+            "questions": questions,
+        })
+
+    s = await QuizSession.objects.acreate(quiz=quiz, question_ids=question_ids)
+    if settings.MP_PREFERENCE_MODE == "prefetch" and get_gateway() is not None:
+        await sync_to_async(request_preference)(s)
+
+    return JsonResponse({"session_id": str(s.pk), "quiz": snapshot["quiz"], "questions": questions})
+
+
+@csrf_exempt
+@require_POST
+async def save_answers(req, session_id):
+    limited = await sync_to_async(rate_limited)(req, "answer", session_id)
+    if limited:
+        return limited
+    body = _json_body(req)
+    s = await _get_session(session_id)
+    if s is None:
+        if read_session_token(session_token_from_request(req, body), session_id):
+            return JsonResponse({"ok": True, "stateless": True})
+        return JsonResponse({"error": "session not found"}, status=404)
+    if s.quiz is None:
+        return JsonResponse({"error": "session has no quiz"}, status=400)
+
+    ser = SaveAnswersSerializer(data=body)
+    if not ser.is_valid():
+        return JsonResponse(ser.errors, status=400)
+
+    if packed_mode():
+        await sync_to_async(save_packed_answers)(s.pk, ser.validated_data["answers"])
+        return JsonResponse({"ok": True})
+
+    key = await aget_answer_key(s.quiz)
+    selected_by_qid = {}
+    for a in ser.validated_data["answers"]:
+        pos = key.pos_by_slug.get(a["questionId"])
+        if pos is not None:
+            selected_by_qid[key.ids[pos]] = a["choices"]
+
+    await Answer.objects.abulk_create(
+        [Answer(session=s, question_id=qid, selected=sel) for qid, sel in selected_by_qid.items()],
+        update_conflicts=True,
+        unique_fields=["session", "question"],
+        update_fields=["selected"],
+    )
+    return JsonResponse({"ok": True})
+
+
+@csrf_exempt
+@require_POST
+async def finish_quiz(req, session_id):
+    slug = req.GET.get("slug")
+    if not slug:
+        return JsonResponse({"error": "missing slug"}, status=400)
+    try:
+        quiz = await Quiz.objects.aget(slug=slug, is_active=True)
+    except Quiz.DoesNotExist:
+        return JsonResponse({"error": "quiz not found"}, status=404)
+    key = await aget_answer_key(quiz)
+    s = await _get_session(session_id, quiz=quiz)
+    if s is None:
+        body = _json_body(req)
+        claims = read_session_token(session_token_from_request(req, body), session_id)
+        if claims is None or claims["q"] != quiz.pk:
+            return JsonResponse({"error": "session not found"}, status=404)
+        ser = SaveAnswersSerializer(data=body)
+        if not ser.is_valid():
+            return JsonResponse(ser.errors, status=400)
+        question_ids = claims.get("ids")
+        selected = selected_by_id(key, ser.validated_data["answers"], question_ids)
+        pairs = [(qid, letters_mask(sel)) for qid, sel in selected.items()]
+        result = grade_masks(key, pairs, question_ids)
+        s, _ = await sync_to_async(persist_finished_session)(session_id, quiz, key, selected, pairs, result, question_ids)
+        result = s.result
+    else:
+        if s.packed_answers is not None:
+            pairs = list((await sync_to_async(unpack)(s)).items())
+        else:
+            pairs = [
+                (question_id, letters_mask(selected))
+                async for question_id, selected in Answer.objects.filter(session=s).values_list("question_id", "selected")
+            ]
+        pairs = served_pairs(pairs, s.question_ids)
+        result = grade_masks(key, pairs, s.question_ids)
+        await sync_to_async(record_result)(s, result, key, pairs)
+    result = await awith_percentile(quiz.pk, result)
+    base = {"sessionId": str(s.pk), "result": result, "result_token": result_token(s, result)}
+
+    gateway = get_gateway()
+    if gateway is None:
+        return JsonResponse(base)
+    if s.mp_pref_id:
+        return JsonResponse({**base, **preference_data(s)})
+
+    if settings.MP_PREFERENCE_MODE != "sync":
+        status_ = await sync_to_async(request_preference)(s)
+        return JsonResponse({
+            **base,
+            "preference": {"status": status_, "status_url": f"/api/quiz/{s.pk}/payment"},
+        })
+
+    try:
+        await acreate_preference(s, quiz, gateway)
+        return JsonResponse({**base, **preference_data(s)})
+    except TypeError as te:
+        return JsonResponse({"error": "payload_not_serializable", "detail": str(te)}, status=500)
+    except GatewayUnavailable as e:
+        return JsonResponse({**base, "mp_error": str(e), "payment_unavailable": True})
+    except Exception as e:
+        return JsonResponse({**base, "mp_error": str(e)}, status=502)
+
+
+@require_GET
+async def get_result(req, session_id):
+    token = read_result_token(token_from_request(req), session_id)
+    if token and token["p"]:
+        return JsonResponse({"result": token["r"]})
+
+    s = await _get_session(session_id)
+    if s is None:
+        return JsonResponse({"error": "session not found"}, status=404)
+    if not s.paid:
+        return JsonResponse({"error": "payment_required"}, status=402)
+    result = await awith_percentile(s.quiz_id, s.result)
+    return JsonResponse({"result": result, "result_token": result_token(s, result)})
+
+
+@csrf_exempt
+@require_POST
+async def mp_webhook(req):
+    data = _json_body(req).get("data") or {}
+    pay_id = str(data.get("id") or data.get("payment_id") or "") if isinstance(data, dict) else ""
+    if pay_id:
+        await aenqueue_payment(pay_id)
+    return HttpResponse(status=200)
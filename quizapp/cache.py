@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+
+from . import metrics
+
+
+class LocalLRU:
+    """LRU simples em memória do processo (thread-safe)."""
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LocalLRU(getattr(settings, "QUIZ_CACHE_LRU_SIZE", 128))
+
+
+def shared_cache():
+    """Cache compartilhado entre processos (opcional, via QUIZ_SHARED_CACHE = alias)."""
+    alias = getattr(settings, "QUIZ_SHARED_CACHE", None)
+    return caches[alias] if alias else None
+
+
+def versioned_key(kind: str, quiz_id: int, version: int, generation=None) -> str:
+    key = f"quizapp:{kind}:{quiz_id}:v{version}"
+    return key if generation is None else f"{key}:g{generation}"
+
+
+def get_versioned(kind: str, quiz, build, generation=None):
+    """
+    Devolve o objeto compilado `kind` do quiz na versão atual.
+    Ordem: LRU local → cache compartilhado → build(quiz).
+    Como a chave inclui a versão, não há invalidação explícita: versões
+    antigas simplesmente deixam de ser consultadas e saem do LRU.
+    `generation` entra na chave para objetos que dependem também de dados
+    vivos (ex.: faixas de dificuldade do pool) e precisam ser recompilados.
+    """
+    key = versioned_key(kind, quiz.pk, quiz.version, generation)
+    value = local_cache.get(key)
+    if value is not None:
+        metrics.inc("cache_lookups_total", (("kind", kind), ("outcome", "local_hit")))
+        return value
+
+    shared = shared_cache()
+    if shared is not None:
+        value = shared.get(key)
+    metrics.inc("cache_lookups_total", (("kind", kind), ("outcome", "miss" if value is None else "shared_hit")))
+    if value is None:
+        value = build(quiz)
+        if shared is not None:
+            shared.set(key, value, timeout=getattr(settings, "QUIZ_SHARED_CACHE_TIMEOUT", 24 * 3600))
+    local_cache.set(key, value)
+    return value
+
+
+async def aget_versioned(kind: str, quiz, build):
+    """Versão async de get_versioned: acerto no LRU local não sai do event loop."""
+    value = local_cache.get(versioned_key(kind, quiz.pk, quiz.version))
+    if value is not None:
+        metrics.inc("cache_lookups_total", (("kind", kind), ("outcome", "local_hit")))
+        return value
+    return await sync_to_async(get_versioned)(kind, quiz, build)
+
+
+def bump_quiz_version(quiz):
+    """Invalida snapshots/gabaritos do quiz (incremento atômico da versão)."""
+    from .models import Quiz
+
+    Quiz.objects.filter(pk=quiz.pk).update(version=F("version") + 1)
+    quiz.refresh_from_db(fields=["version"])
+    transaction.on_commit(bump_catalog_version)
+    return quiz.version
+
+
+CATALOG_VERSION_KEY = "quizapp:catalog:version"
+
+
+def catalog_version():
+    """
+    Contador do catálogo no cache compartilhado (ETag do catálogo sem ler o banco).
+    None sem QUIZ_SHARED_CACHE: um contador por processo daria 304 com dados velhos.
+    Chave perdida (restart/evicção) recomeça de time_ns, nunca de um valor já usado.
+    """
+    shared = shared_cache()
+    if shared is None:
+        return None
+    version = shared.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        if not shared.add(CATALOG_VERSION_KEY, version, timeout=None):
+            version = shared.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    """Muda o ETag do catálogo; chamado depois do commit (bump_quiz_version e sinais do Quiz)."""
+    shared = shared_cache()
+    if shared is None:
+        return
+    try:
+        shared.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        shared.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def catalog_changed(sender, **kwargs):
+    """Receptor de post_save/post_delete do Quiz (criação, edição, exclusão)."""
+    transaction.on_commit(bump_catalog_version)
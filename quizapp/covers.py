@@ -0,0 +1,128 @@
+"""
+Variantes das capas dos quizzes: no upload a capa original é redimensionada
+para larguras fixas em WebP e JPEG, com hash do conteúdo no nome
+(quizzes/<slug>/cover-640.<hash>.webp) — URLs imutáveis, cacheáveis para sempre.
+O processamento roda num pool em background (QUIZ_COVER_PROCESSING=sync para inline).
+"""
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+
+from .cache import bump_quiz_version
+from .models import Quiz
+
+log = logging.getLogger(__name__)
+
+FORMATS = {"webp": ("WEBP", "webp"), "jpeg": ("JPEG", "jpg")}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=getattr(settings, "QUIZ_COVER_WORKERS", 2),
+                    thread_name_prefix="cover",
+                )
+    return _pool
+
+
+def render_variants(fp, slug) -> dict:
+    """Gera as variantes a partir do arquivo da capa. Devolve {formato: {largura: nome}}."""
+    from PIL import Image, ImageOps
+
+    with Image.open(fp) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "L"):
+            # achata transparência em fundo branco (JPEG não tem alfa)
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        else:
+            image = image.convert("RGB")
+
+    quality = getattr(settings, "QUIZ_COVER_QUALITY", 80)
+    variants = {}
+    # não amplia: larguras maiores que a original viram uma variante na largura original
+    for w in sorted({min(width, image.width) for width in settings.QUIZ_COVER_WIDTHS}):
+        resized = image.resize((w, max(1, round(image.height * w / image.width))), Image.LANCZOS)
+        for fmt, (pil_format, ext) in FORMATS.items():
+            buf = io.BytesIO()
+            extra = {"method": 6} if fmt == "webp" else {"progressive": True}
+            resized.save(buf, pil_format, quality=quality, optimize=True, **extra)
+            data = buf.getvalue()
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            name = f"quizzes/{slug}/cover-{w}.{digest}.{ext}"
+            if not default_storage.exists(name):
+                default_storage.save(name, ContentFile(data))
+            variants.setdefault(fmt, {})[str(w)] = name
+    return variants
+
+
+def process_cover(quiz_id) -> dict | None:
+    """Gera e grava as variantes da capa atual do quiz; remove as da capa anterior."""
+    quiz = Quiz.objects.only("slug", "cover", "cover_variants").get(pk=quiz_id)
+    if not quiz.cover:
+        variants = {}
+    else:
+        with quiz.cover.open("rb") as fp:
+            variants = render_variants(fp, quiz.slug)
+
+    # só grava se a capa não mudou enquanto processávamos (um job mais novo vence)
+    current = Quiz.objects.filter(pk=quiz_id)
+    current = current.filter(cover=quiz.cover.name) if quiz.cover else current.filter(Q(cover="") | Q(cover__isnull=True))
+    updated = current.update(cover_variants=variants)
+    if not updated:
+        return None
+    bump_quiz_version(quiz)   # snapshot e ETag do catálogo passam a expor as novas URLs
+    keep = {name for sizes in variants.values() for name in sizes.values()}
+    for sizes in (quiz.cover_variants or {}).values():
+        for name in sizes.values():
+            if name not in keep:
+                default_storage.delete(name)
+    return variants
+
+
+def _process_in_background(quiz_id):
+    try:
+        process_cover(quiz_id)
+    except Exception:
+        log.exception("[cover] falha ao processar a capa do quiz %s", quiz_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_cover_processing(quiz):
+    """Agenda a geração das variantes depois do commit da transação atual."""
+    if getattr(settings, "QUIZ_COVER_PROCESSING", "background") == "sync":
+        transaction.on_commit(lambda: process_cover(quiz.pk))
+    else:
+        transaction.on_commit(lambda: _executor().submit(_process_in_background, quiz.pk))
+
+
+def variant_urls(variants, request=None) -> dict:
+    """
+    {"webp": {"srcset": "url 320w, url 640w", "320": url, ...}, "jpeg": {...}}
+    pronto para <picture>/<img srcset>.
+    """
+    out = {}
+    for fmt, sizes in (variants or {}).items():
+        urls = {}
+        for width, name in sorted(sizes.items(), key=lambda kv: int(kv[0])):
+            url = default_storage.url(name)
+            urls[width] = request.build_absolute_uri(url) if request is not None else url
+        urls["srcset"] = ", ".join(f"{url} {w}w" for w, url in urls.items())
+        out[fmt] = urls
+    return out
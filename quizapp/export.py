@@ -0,0 +1,154 @@
+"""
+Exportação em streaming de sessões + respostas (CSV ou NDJSON, gzip opcional).
+
+Uma linha por sessão com os campos do resultado e as respostas achatadas
+(CSV: uma coluna por pergunta quando o quiz é informado). As sessões vêm de
+um .iterator() (cursor no servidor no postgres) e as respostas de uma query
+por lote, então a memória fica constante qualquer que seja o volume.
+"""
+import csv
+import json
+import zlib
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Answer, Question, QuizSession
+from .packed import decode, get_layout, mask_letters
+
+FORMATS = ("csv", "ndjson")
+SESSION_COLUMNS = ("session_id", "quiz", "created_at", "paid", "mp_payment_id", "score", "total", "percent")
+OUT_CHUNK = 64 * 1024
+
+
+def parse_bound(value, end=False):
+    """'2025-01-31' ou ISO 8601 → datetime/date para filtro (data sem hora vale o dia inteiro no fim)."""
+    if not value:
+        return None, None
+    try:
+        d = parse_date(value)
+        dt = None if d is not None else parse_datetime(value)
+    except ValueError:
+        d = dt = None
+    if d is not None:
+        return "created_at__date__lte" if end else "created_at__date__gte", d
+    if dt is None:
+        raise ValueError(f"data inválida: {value!r}")
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return "created_at__lte" if end else "created_at__gte", dt
+
+
+def sessions_queryset(quiz=None, since=None, until=None):
+    qs = QuizSession.objects.all()
+    if quiz is not None:
+        qs = qs.filter(quiz=quiz)
+    for value, end in ((since, False), (until, True)):
+        lookup, bound = parse_bound(value, end)
+        if lookup:
+            qs = qs.filter(**{lookup: bound})
+    return qs.order_by("created_at", "id").values(
+        "id", "quiz_id", "quiz__slug", "created_at", "paid", "mp_payment_id", "result",
+        "packed_answers", "packed_version",
+    )
+
+
+def session_rows(qs, chunk_size=2000):
+    """Dicts {campos da sessão..., "answers": {slug: [letras]}} em lotes de chunk_size."""
+    slugs = {}
+    rows = qs.iterator(chunk_size=chunk_size)
+    while True:
+        batch = list(islice(rows, chunk_size))
+        if not batch:
+            return
+        answers = {}
+        row_ids = [r["id"] for r in batch if r["packed_answers"] is None]
+        if row_ids:
+            for session_id, slug, selected in Answer.objects.filter(session_id__in=row_ids).values_list(
+                "session_id", "question__slug", "selected"
+            ):
+                answers.setdefault(session_id, {})[slug] = selected
+        for r in batch:
+            if r["packed_answers"] is not None:
+                layout = get_layout(r["quiz_id"], r["packed_version"])
+                missing = [qid for qid in layout if qid not in slugs]
+                if missing:
+                    slugs.update(Question.objects.filter(pk__in=missing).values_list("pk", "slug"))
+                # pergunta apagada depois da sessão: some do export, como as linhas de Answer (CASCADE)
+                answers[r["id"]] = {
+                    slugs[qid]: mask_letters(mask)
+                    for qid, mask in zip(layout, decode(r["packed_answers"])) if mask and qid in slugs
+                }
+            result = r["result"] if isinstance(r["result"], dict) else {}
+            yield {
+                "session_id": str(r["id"]),
+                "quiz": r["quiz__slug"],
+                "created_at": r["created_at"],
+                "paid": r["paid"],
+                "mp_payment_id": r["mp_payment_id"],
+                "score": result.get("score"),
+                "total": result.get("total", result.get("total_questions")),
+                "percent": result.get("percent"),
+                "answers": answers.get(r["id"], {}),
+            }
+
+
+class _Echo:
+    """csv.writer escreve aqui e recebemos a linha pronta (sem buffer acumulado)."""
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, question_slugs=None):
+    """
+    Com question_slugs: uma coluna por pergunta ("a;b").
+    Sem (vários quizzes): uma coluna answers "slug=a;slug2=b|c".
+    """
+    writer = csv.writer(_Echo())
+    answer_columns = list(question_slugs) if question_slugs else ["answers"]
+    yield writer.writerow(list(SESSION_COLUMNS) + answer_columns)
+    for row in rows:
+        values = [row[c].isoformat() if c == "created_at" else row[c] for c in SESSION_COLUMNS]
+        if question_slugs:
+            values += [";".join(row["answers"].get(slug) or ()) for slug in question_slugs]
+        else:
+            values.append(";".join(f"{slug}={'|'.join(sel or ())}" for slug, sel in sorted(row["answers"].items(), key=lambda kv: str(kv[0]))))
+        yield writer.writerow(values)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def encode_stream(lines, compress=False):
+    """Agrupa linhas em blocos de ~64 KB; com compress, gzip incremental (zlib wbits=31)."""
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buf, size = [], 0
+    for line in lines:
+        data = line.encode("utf-8")
+        buf.append(data)
+        size += len(data)
+        if size >= OUT_CHUNK:
+            block = b"".join(buf)
+            buf, size = [], 0
+            block = gz.compress(block) if gz else block
+            if block:
+                yield block
+    block = b"".join(buf)
+    if gz:
+        block = gz.compress(block) + gz.flush()
+    if block:
+        yield block
+
+
+def export_stream(fmt, quiz=None, since=None, until=None, compress=False, chunk_size=2000):
+    rows = session_rows(sessions_queryset(quiz, since, until), chunk_size)
+    if fmt == "csv":
+        slugs = list(quiz.questions.order_by("order", "id").values_list("slug", flat=True)) if quiz is not None else None
+        lines = csv_lines(rows, slugs)
+    else:
+        lines = ndjson_lines(rows)
+    return encode_stream(lines, compress)
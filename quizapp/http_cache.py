@@ -0,0 +1,52 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .cache import catalog_version
+from .models import Quiz
+
+
+def catalog_etag(request, *args, **kwargs):
+    """
+    Versão do catálogo + query string. Com QUIZ_SHARED_CACHE, vem do contador
+    no cache (cache.catalog_version): nenhuma query. Sem ele, hash de (id, version)
+    de todos os quizzes — cresce com o catálogo, mas nunca fica velho entre workers.
+    """
+    version = catalog_version()
+    if version is None:
+        version = list(Quiz.objects.order_by("id").values_list("id", "version"))
+    digest = hashlib.sha1(repr(version).encode())
+    digest.update(request.META.get("QUERY_STRING", "").encode())
+    return f"catalog-{digest.hexdigest()[:20]}"
+
+
+def questions_etag(request, *args, **kwargs):
+    """ETag das perguntas = id + versão do quiz (o Quiz lido fica em request.quiz_obj)."""
+    slug = request.GET.get("slug", "iq")
+    quiz = Quiz.objects.filter(slug=slug, is_active=True).first()
+    request.quiz_obj = quiz
+    if quiz is None:
+        return None
+    return f"quiz-{quiz.pk}-v{quiz.version}"
+
+
+def conditional(etag_func, cache_control_setting):
+    """
+    If-None-Match → 304 sem montar o payload (django `condition`) e
+    Cache-Control para CDN em todas as respostas 200/304.
+    """
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                patch_cache_control(response, **getattr(settings, cache_control_setting))
+                patch_vary_headers(response, ["Accept-Encoding"])
+            return response
+        return wrapper
+    return decorator
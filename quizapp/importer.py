@@ -0,0 +1,111 @@
+from collections import Counter
+
+from django.db import transaction
+
+from .cache import bump_quiz_version
+from .models import Question, Choice
+
+QUESTION_FIELDS = ("title", "description", "kind", "required", "order", "weight")
+CHOICE_FIELDS = ("label", "is_correct", "order")
+
+
+def _question_values(qdata: dict) -> dict:
+    return {
+        "title": qdata["title"],
+        "description": qdata.get("description", ""),
+        "kind": qdata["kind"],
+        "required": qdata.get("required", True),
+        "order": qdata.get("order", 0),
+        "weight": qdata.get("weight", 1.0),
+    }
+
+
+def _choice_values(ch: dict) -> dict:
+    return {
+        "label": ch["label"],
+        "is_correct": ch["is_correct"],
+        "order": ch.get("order", 0),
+    }
+
+
+def apply_questions(quiz, items, stats=None) -> Counter:
+    """
+    Aplica um lote de perguntas (payload do QuestionCreateSerializer) no quiz,
+    gravando só o que mudou: bulk_create/bulk_update/delete em Question e Choice.
+    Slugs repetidos no lote: vale o último. Deve rodar dentro de uma transação.
+    """
+    stats = stats if stats is not None else Counter()
+    incoming = {q["slug"]: q for q in items}
+    if not incoming:
+        return stats
+
+    existing = {
+        q.slug: q
+        for q in Question.objects.filter(quiz=quiz, slug__in=incoming).prefetch_related("choices")
+    }
+
+    # 1) perguntas
+    new_questions, changed_questions = [], []
+    for slug, qdata in incoming.items():
+        values = _question_values(qdata)
+        q = existing.get(slug)
+        if q is None:
+            new_questions.append(Question(quiz=quiz, slug=slug, **values))
+            continue
+        if any(getattr(q, f) != v for f, v in values.items()):
+            for f, v in values.items():
+                setattr(q, f, v)
+            changed_questions.append(q)
+        else:
+            stats["questions_unchanged"] += 1
+
+    if new_questions:
+        Question.objects.bulk_create(new_questions)
+        for q in new_questions:
+            existing[q.slug] = q
+    if changed_questions:
+        Question.objects.bulk_update(changed_questions, QUESTION_FIELDS)
+    stats["questions_created"] += len(new_questions)
+    stats["questions_updated"] += len(changed_questions)
+
+    # 2) alternativas (identificadas por `value` dentro da pergunta)
+    new_choices, changed_choices, stale_choice_ids = [], [], []
+    created = {q.slug for q in new_questions}
+    for slug, qdata in incoming.items():
+        q = existing[slug]
+        current = {} if slug in created else {ch.value: ch for ch in q.choices.all()}
+        wanted = {ch["value"]: ch for ch in qdata["choices"]}
+        for value, ch in wanted.items():
+            values = _choice_values(ch)
+            old = current.get(value)
+            if old is None:
+                new_choices.append(Choice(question=q, value=value, **values))
+            elif any(getattr(old, f) != v for f, v in values.items()):
+                for f, v in values.items():
+                    setattr(old, f, v)
+                changed_choices.append(old)
+        stale_choice_ids.extend(ch.id for value, ch in current.items() if value not in wanted)
+
+    if stale_choice_ids:
+        Choice.objects.filter(id__in=stale_choice_ids).delete()
+    if changed_choices:
+        Choice.objects.bulk_update(changed_choices, CHOICE_FIELDS)
+    if new_choices:
+        Choice.objects.bulk_create(new_choices)
+    stats["choices_created"] += len(new_choices)
+    stats["choices_updated"] += len(changed_choices)
+    stats["choices_deleted"] += len(stale_choice_ids)
+    return stats
+
+
+def import_questions(quiz, items) -> Counter:
+    """Importa perguntas numa única transação e invalida os caches do quiz."""
+    with transaction.atomic():
+        stats = apply_questions(quiz, items)
+        if has_changes(stats):
+            bump_quiz_version(quiz)
+    return stats
+
+
+def has_changes(stats) -> bool:
+    return any(v for k, v in stats.items() if k != "questions_unchanged")
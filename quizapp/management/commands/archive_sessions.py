@@ -0,0 +1,232 @@
+import gzip
+import io
+import json
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from quizapp.models import QuizSession, Answer, Question
+from quizapp.packed import decode, get_layout, mask_letters
+
+SESSION_FIELDS = ("id", "quiz_id", "quiz__slug", "created_at", "result", "paid", "mp_pref_id", "mp_payment_id",
+                  "packed_answers", "packed_version")
+
+
+def _after(checkpoint):
+    """Filtro keyset (created_at, id) > checkpoint."""
+    if not checkpoint or not checkpoint.get("created_at"):
+        return Q()
+    ts = parse_datetime(checkpoint["created_at"])
+    return Q(created_at__gt=ts) | Q(created_at=ts, id__gt=checkpoint["id"])
+
+
+def _upto(checkpoint):
+    ts = parse_datetime(checkpoint["created_at"])
+    return Q(created_at__lt=ts) | Q(created_at=ts, id__lte=checkpoint["id"])
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:   # sem suporte (Windows)
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Command(BaseCommand):
+    help = (
+        "Arquiva sessões finalizadas antigas (com respostas) em partes JSONL.gz e as remove em lotes; "
+        "remove sessões abandonadas (sem resultado) num prazo menor. Cada parte é fechada e gravada em "
+        "disco (fsync) antes de remover suas sessões; uma retomada sempre começa uma parte nova."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=int, default=180, help="dias: idade mínima das sessões finalizadas arquivadas")
+        parser.add_argument("--abandoned-after", type=int, default=7, help="dias: idade mínima das sessões sem resultado removidas")
+        parser.add_argument("--output-dir", default=str(Path(settings.BASE_DIR) / "archive"))
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--part-size", type=int, default=50000, help="sessões por arquivo de parte")
+        parser.add_argument("--checkpoint", help="arquivo de checkpoint (padrão: <output-dir>/checkpoint.json)")
+        parser.add_argument("--archive-abandoned", action="store_true", help="também grava as abandonadas no arquivo antes de remover")
+        parser.add_argument("--skip-abandoned", action="store_true")
+        parser.add_argument("--skip-finished", action="store_true")
+        parser.add_argument("--dry-run", action="store_true", help="só conta o que seria arquivado/removido")
+
+    def handle(self, *args, **opts):
+        self.opts = opts
+        self.slugs_by_id = {}
+        self.out_dir = Path(opts["output_dir"])
+        self.checkpoint_path = Path(opts["checkpoint"] or self.out_dir / "checkpoint.json")
+        now = timezone.now()
+
+        jobs = []
+        if not opts["skip_finished"]:
+            jobs.append(("finished", Q(result__isnull=False, created_at__lt=now - timedelta(days=opts["older_than"])), True))
+        if not opts["skip_abandoned"]:
+            jobs.append(("abandoned", Q(result__isnull=True, created_at__lt=now - timedelta(days=opts["abandoned_after"])),
+                         opts["archive_abandoned"]))
+
+        for name, where, archive in jobs:
+            if opts["dry_run"]:
+                n = QuizSession.objects.filter(where).count()
+                verb = "arquivadas e removidas" if archive else "removidas"
+                self.stdout.write(f"[dry-run] {name}: {n} sessões seriam {verb}.")
+                continue
+            if archive:
+                self.run_job(name, where)
+            else:
+                self.purge(name, where)
+
+    # checkpoint: {"<job>": {"stamp": ..., "part": N, "parts": [...], "created_at": ..., "id": ...}}
+    # created_at/id = última sessão da última parte fechada (tudo até ali está em disco)
+    def load_checkpoints(self):
+        if self.checkpoint_path.exists():
+            return json.loads(self.checkpoint_path.read_text())
+        return {}
+
+    def save_checkpoint(self, name, state):
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        data = self.load_checkpoints()
+        if state is None:
+            data.pop(name, None)
+        else:
+            data[name] = state
+        tmp = self.checkpoint_path.with_suffix(".tmp")
+        with open(tmp, "w") as fp:
+            fp.write(json.dumps(data, cls=DjangoJSONEncoder))
+            fp.flush()
+            os.fsync(fp.fileno())
+        tmp.replace(self.checkpoint_path)
+        _fsync_dir(self.checkpoint_path.parent)
+
+    def purge(self, name, where):
+        """Remoção sem arquivo: lotes pelo keyset até acabar (idempotente, sem checkpoint)."""
+        qs = QuizSession.objects.filter(where).order_by("created_at", "id").values_list("pk", flat=True)
+        total, started = 0, time.monotonic()
+        while True:
+            ids = list(qs[:self.opts["batch_size"]])
+            if not ids:
+                break
+            self.delete_batches(ids)
+            total += len(ids)
+            self.report(name, total, started)
+        self.report(name, total, started, final=True)
+
+    def run_job(self, name, where):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        base = QuizSession.objects.filter(where)
+        state = self.load_checkpoints().get(name)
+
+        if state and "stamp" not in state:
+            # checkpoint do formato antigo (arquivo único): o que ele cobre já foi gravado
+            state = {"stamp": timezone.now().strftime("%Y%m%dT%H%M%S"), "part": 0, "parts": [],
+                     "created_at": state["created_at"], "id": state["id"]}
+        if state is None:
+            # nomes das partes fixados antes de gravar qualquer coisa: uma parte órfã
+            # (renomeada mas sem checkpoint) é sobrescrita na retomada, não duplicada
+            state = {"stamp": timezone.now().strftime("%Y%m%dT%H%M%S"), "part": 0, "parts": []}
+            self.save_checkpoint(name, state)
+        elif state.get("created_at"):
+            # retomada: sessões já em partes fechadas mas ainda não removidas saem primeiro
+            self.delete_batches(base.filter(_upto(state)).values_list("pk", flat=True))
+            self.stdout.write(f"{name}: retomando após {state['created_at']} (parte {state['part'] + 1})")
+
+        total, started = 0, time.monotonic()
+        while True:
+            path = self.out_dir / f"sessions-{name}-{state['stamp']}-part{state['part'] + 1:04d}.jsonl.gz"
+            qs = base.filter(_after(state)).order_by("created_at", "id").values(*SESSION_FIELDS)
+            n, last = self.write_part(qs[:self.opts["part_size"]], path)
+            if not n:
+                break
+            state = {
+                **state,
+                "part": state["part"] + 1,
+                "parts": state["parts"] + [path.name],
+                "created_at": last["created_at"].isoformat(),
+                "id": str(last["id"]),
+            }
+            # parte fechada e em disco → checkpoint → só então remove
+            self.save_checkpoint(name, state)
+            self.delete_batches(base.filter(_upto(state)).values_list("pk", flat=True))
+            total += n
+            self.report(name, total, started, path=path)
+
+        self.save_checkpoint(name, None)
+        self.report(name, total, started, final=True, parts=len(state["parts"]))
+
+    def write_part(self, qs, path):
+        """Grava a parte em <path>.partial, fecha, fsync e renomeia. Devolve (nº de sessões, última linha)."""
+        tmp = path.with_name(path.name + ".partial")
+        n, last, batch = 0, None, []
+        with open(tmp, "wb") as raw:
+            with io.TextIOWrapper(gzip.GzipFile(fileobj=raw, mode="wb"), encoding="utf-8") as fp:
+                # cursor no servidor (Postgres): memória constante independente do volume
+                for row in qs.iterator(chunk_size=self.opts["batch_size"]):
+                    batch.append(row)
+                    if len(batch) >= self.opts["batch_size"]:
+                        self.write_batch(batch, fp)
+                        n, last, batch = n + len(batch), batch[-1], []
+                if batch:
+                    self.write_batch(batch, fp)
+                    n, last = n + len(batch), batch[-1]
+            raw.flush()
+            os.fsync(raw.fileno())
+        if not n:
+            tmp.unlink()
+            return 0, None
+        tmp.replace(path)
+        _fsync_dir(path.parent)
+        return n, last
+
+    def write_batch(self, batch, fp):
+        ids = [row["id"] for row in batch]
+        answers = {}
+        for a in Answer.objects.filter(session_id__in=ids).values("session_id", "question__slug", "selected"):
+            answers.setdefault(a["session_id"], []).append({"question": a["question__slug"], "selected": a["selected"]})
+        for row in batch:
+            quiz_slug = row.pop("quiz__slug")
+            packed, packed_version = row.pop("packed_answers"), row.pop("packed_version")
+            if packed is not None:
+                answers[row["id"]] = self.unpack(row["quiz_id"], packed_version, packed)
+            doc = {**row, "quiz": quiz_slug, "answers": answers.get(row["id"], [])}
+            fp.write(json.dumps(doc, cls=DjangoJSONEncoder) + "\n")
+
+    def unpack(self, quiz_id, version, packed):
+        slugs = self.slugs_by_id
+        layout = get_layout(quiz_id, version)
+        missing = [qid for qid in layout if qid not in slugs]
+        if missing:
+            slugs.update(Question.objects.filter(pk__in=missing).values_list("pk", "slug"))
+        return [
+            {"question": slugs.get(qid), "selected": mask_letters(mask)}
+            for qid, mask in zip(layout, decode(packed)) if mask
+        ]
+
+    def delete_batches(self, ids):
+        ids = list(ids)
+        size = self.opts["batch_size"]
+        for i in range(0, len(ids), size):
+            # uma transação curta por lote (Answer sai junto via CASCADE)
+            with transaction.atomic():
+                QuizSession.objects.filter(pk__in=ids[i:i + size]).delete()
+
+    def report(self, name, total, started, final=False, path=None, parts=0):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        msg = f"{name}: {total} sessões ({total / elapsed:.0f}/s)"
+        if final:
+            msg += f" em {elapsed:.1f}s" + (f", {parts} partes em {self.out_dir}" if parts else "")
+            self.stdout.write(self.style.SUCCESS(msg))
+        else:
+            self.stdout.write(msg + (f" → {path.name}" if path else ""))
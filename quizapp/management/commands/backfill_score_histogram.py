@@ -0,0 +1,55 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from quizapp.analytics import add_scores, missing_sessions, score_bucket
+from quizapp.models import Quiz, QuizSession, ScoreBucket
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstrói o histograma de notas (ScoreBucket) a partir dos resultados das sessões, com cursor em streaming. "
+        "Recusa quizzes com sessões já arquivadas (os percentis perderiam esse histórico) sem --allow-history-loss."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--quiz", help="slug do quiz (padrão: todos)")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--allow-history-loss", action="store_true",
+                            help="reconstrói mesmo com sessões arquivadas (elas saem dos percentis)")
+
+    def handle(self, *args, **opts):
+        sessions = QuizSession.objects.filter(result__isnull=False, quiz__isnull=False)
+        quizzes = Quiz.objects.all()
+        if opts["quiz"]:
+            quizzes = quizzes.filter(slug=opts["quiz"])
+            sessions = sessions.filter(quiz__slug=opts["quiz"])
+
+        slugs = dict(quizzes.values_list("pk", "slug"))
+        missing = missing_sessions(list(slugs))
+        if missing:
+            lines = [f"{slugs[qid]}: {n} sessões corrigidas não estão mais no banco (arquivadas)" for qid, n in missing.items()]
+            if not opts["allow_history_loss"]:
+                raise CommandError(
+                    "Reconstruir apagaria o histórico arquivado dos percentis:\n  " + "\n  ".join(lines)
+                    + "\nUse --allow-history-loss para reconstruir só com as sessões do banco."
+                )
+            for line in lines:
+                self.stderr.write(self.style.WARNING(f"{line}; saem do histograma"))
+
+        # uma passada só; .iterator() usa cursor do servidor no postgres
+        counts = {}
+        rows = sessions.order_by().values_list("quiz_id", "result").iterator(chunk_size=opts["chunk_size"])
+        for quiz_id, result in rows:
+            p = score_bucket(result)
+            if p is not None:
+                counts.setdefault(quiz_id, Counter())[p] += 1
+
+        for quiz_id, slug in quizzes.values_list("pk", "slug"):
+            histogram = counts.get(quiz_id, Counter())
+            with transaction.atomic():
+                ScoreBucket.objects.filter(quiz_id=quiz_id).delete()
+                add_scores(quiz_id, histogram)
+            self.stdout.write(f"{slug}: {sum(histogram.values())} resultados")
+        self.stdout.write(self.style.SUCCESS("Histogramas reconstruídos."))
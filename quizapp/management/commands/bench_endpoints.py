@@ -0,0 +1,189 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from quizapp.cache import local_cache
+from quizapp.models import Quiz, Question, Choice, QuizSession
+from quizapp.payments import StubGateway, set_gateway
+from quizapp.ratelimit import take
+from quizapp.views import grade_session, calc_result
+
+# orçamento de queries por operação (cache quente, sem BEGIN/COMMIT/SAVEPOINT)
+DEFAULT_BUDGETS = {
+    "list_questions": 1,   # Quiz
+    "start_quiz": 2,       # Quiz + INSERT sessão
+    "save_answers": 2,     # sessão + INSERT ... ON CONFLICT
+    # primeiro finish: Quiz + sessão + respostas + UPDATE result condicional + upserts de
+    # QuestionStats/ChoiceStats/ScoreBucket + percentil + UPDATE da preferência (não cresce com as perguntas)
+    "finish_quiz_first": 9,
+    "finish_quiz": 5,      # repetido: Quiz + sessão + respostas + UPDATE result + percentil (preferência reaproveitada)
+    "grade_session": 1,
+    "calc_result": 1,
+    "rate_limit_check": 0,   # só cache (incr), nada de SQL
+}
+OP_NOTES = {
+    "finish_quiz_first": "primeiro finish de cada sessão (correção, analytics e preferência); sessão nova por execução",
+    "finish_quiz": "finish repetido da mesma sessão (resultado e preferência já gravados)",
+}
+# limites altos: a checagem roda em start/answer (custo incluído) sem nunca recusar
+BENCH_RATE_LIMITS = {"start": {"ip": "1000000/s"}, "answer": {"ip": "1000000/s", "session": "1000000/s"}}
+TX_STATEMENTS = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE SAVEPOINT")
+
+
+class Rollback(Exception):
+    pass
+
+
+def count_queries(captured):
+    return sum(1 for q in captured if not q["sql"].upper().startswith(TX_STATEMENTS))
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmark dos endpoints do funil: queries SQL, tempo e alocações por chamada. "
+        "Cria um quiz sintético numa transação desfeita no fim e falha se algum orçamento de queries estourar. "
+        "O finish é medido duas vezes: o primeiro de cada sessão (finish_quiz_first) e o repetido (finish_quiz)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", type=int, default=40)
+        parser.add_argument("--choices", type=int, default=4)
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--budget", action="append", default=[], metavar="OP=N", help="sobrescreve um orçamento")
+        parser.add_argument("--output", help="grava o JSON no arquivo (padrão: stdout)")
+        parser.add_argument("--no-fail", action="store_true", help="só reporta, sem falhar por orçamento")
+
+    def handle(self, *args, **opts):
+        budgets = dict(DEFAULT_BUDGETS)
+        for item in opts["budget"]:
+            op, _, n = item.partition("=")
+            if op not in budgets or not n.isdigit():
+                raise CommandError(f"--budget inválido: {item!r}")
+            budgets[op] = int(n)
+
+        report = {
+            "params": {k: opts[k] for k in ("questions", "choices", "iterations")},
+            "db": connection.vendor,
+            "results": {},
+        }
+        set_gateway(StubGateway())
+        try:
+            with override_settings(MP_ACCESS_TOKEN="bench", MP_PREFERENCE_MODE="sync", QUIZ_RATE_LIMITS=BENCH_RATE_LIMITS):
+                with transaction.atomic():
+                    self.run_all(opts, report["results"])
+                    raise Rollback
+        except Rollback:
+            pass
+        finally:
+            set_gateway(None)
+            local_cache.clear()
+
+        failures = []
+        for op, res in report["results"].items():
+            res["budget"] = budgets.get(op)
+            res["within_budget"] = res["budget"] is None or res["queries"] <= res["budget"]
+            if not res["within_budget"]:
+                failures.append(f"{op}: {res['queries']} queries (orçamento {res['budget']})")
+        report["ok"] = not failures
+
+        out = json.dumps(report, indent=2)
+        if opts["output"]:
+            with open(opts["output"], "w") as fp:
+                fp.write(out)
+        else:
+            self.stdout.write(out)
+
+        if failures and not opts["no_fail"]:
+            raise CommandError("Orçamento de queries excedido:\n  " + "\n  ".join(failures))
+
+    def seed(self, n_questions, n_choices):
+        quiz = Quiz.objects.create(slug="bench-quiz", title="Benchmark")
+        questions = Question.objects.bulk_create([
+            Question(quiz=quiz, slug=f"q{i}", title=f"Pergunta {i}", order=i) for i in range(n_questions)
+        ])
+        Choice.objects.bulk_create([
+            Choice(question=q, label=f"Opção {j}", value=f"opt_{j}", is_correct=(j == i % n_choices), order=j)
+            for i, q in enumerate(questions) for j in range(n_choices)
+        ])
+        return quiz, questions
+
+    def measure(self, fn, iterations, setup=None):
+        """
+        setup: chamado antes de cada execução, fora do tempo e da contagem de queries;
+        devolve os argumentos de fn (ex.: uma sessão nova para medir o primeiro finish).
+        """
+        setup = setup or tuple
+        fn(*setup())   # aquece caches (snapshot/gabarito)
+        args = setup()
+        with CaptureQueriesContext(connection) as ctx:
+            fn(*args)
+        queries = count_queries(ctx.captured_queries)
+
+        times = []
+        for _ in range(iterations):
+            args = setup()
+            start = time.perf_counter()
+            fn(*args)
+            times.append((time.perf_counter() - start) * 1000)
+
+        args = setup()
+        tracemalloc.start()
+        fn(*args)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        times.sort()
+        return {
+            "queries": queries,
+            "ms_median": round(statistics.median(times), 3),
+            "ms_p95": round(times[max(int(len(times) * 0.95) - 1, 0)], 3),
+            "ms_max": round(times[-1], 3),
+            "alloc_peak_kb": round(peak / 1024, 1),
+            "alloc_retained_kb": round(current / 1024, 1),
+        }
+
+    def run_all(self, opts, results):
+        quiz, questions = self.seed(opts["questions"], opts["choices"])
+        client = Client()
+        letters = "abcd"
+        answers = {"answers": [{"questionId": q.slug, "choices": [letters[i % 4]]} for i, q in enumerate(questions)]}
+        session_id = client.post("/api/quiz/start", {"slug": quiz.slug}, content_type="application/json").json()["session_id"]
+
+        def expect(resp, status=200):
+            if resp.status_code != status:
+                raise CommandError(f"{resp.request['PATH_INFO']}: HTTP {resp.status_code} {resp.content[:200]!r}")
+            return resp
+
+        def answered_session():
+            """Sessão nova já respondida: o finish seguinte é o primeiro (correção + analytics + preferência)."""
+            sid = client.post("/api/quiz/start", {"slug": quiz.slug}, content_type="application/json").json()["session_id"]
+            expect(client.post(f"/api/quiz/{sid}/answer", answers, content_type="application/json"))
+            return (sid,)
+
+        ops = {
+            "list_questions": lambda: expect(client.get("/api/quiz/questions", {"slug": quiz.slug})),
+            "start_quiz": lambda: expect(client.post("/api/quiz/start", {"slug": quiz.slug}, content_type="application/json")),
+            "save_answers": lambda: expect(client.post(f"/api/quiz/{session_id}/answer", answers, content_type="application/json")),
+            "finish_quiz_first": (
+                lambda sid: expect(client.post(f"/api/quiz/{sid}/finish?slug={quiz.slug}")), answered_session,
+            ),
+            "finish_quiz": lambda: expect(client.post(f"/api/quiz/{session_id}/finish?slug={quiz.slug}")),
+        }
+        session = QuizSession.objects.get(pk=session_id)
+        ops["grade_session"] = lambda: grade_session(session, quiz)
+        ops["calc_result"] = lambda: calc_result(session, quiz)
+        ops["rate_limit_check"] = lambda: take("answer", "session", session_id)
+
+        for op, fn in ops.items():
+            fn, setup = fn if isinstance(fn, tuple) else (fn, None)
+            results[op] = self.measure(fn, opts["iterations"], setup)
+            if op in OP_NOTES:
+                results[op]["note"] = OP_NOTES[op]
+            note = f" ({OP_NOTES[op]})" if op in OP_NOTES else ""
+            self.stderr.write(f"{op}: {results[op]['queries']} queries, mediana {results[op]['ms_median']} ms{note}")
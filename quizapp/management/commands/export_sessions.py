@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quizapp.export import FORMATS, export_stream
+from quizapp.models import Quiz
+
+
+class Command(BaseCommand):
+    help = "Exporta sessões + respostas em streaming (CSV ou NDJSON, gzip opcional), uma linha por sessão."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--quiz", help="slug do quiz (CSV ganha uma coluna por pergunta)")
+        parser.add_argument("--since", help="data/hora inicial (YYYY-MM-DD ou ISO 8601)")
+        parser.add_argument("--until", help="data/hora final, inclusiva")
+        parser.add_argument("--format", choices=FORMATS, default="csv")
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--output", "-o", help="arquivo de saída (padrão: stdout)")
+
+    def handle(self, *args, **opts):
+        quiz = None
+        if opts["quiz"]:
+            quiz = Quiz.objects.filter(slug=opts["quiz"]).first()
+            if quiz is None:
+                raise CommandError(f"quiz não encontrado: {opts['quiz']}")
+        try:
+            stream = export_stream(opts["format"], quiz, opts["since"], opts["until"], opts["gzip"], opts["chunk_size"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        out = open(opts["output"], "wb") if opts["output"] else sys.stdout.buffer
+        written = 0
+        try:
+            for block in stream:
+                out.write(block)
+                written += len(block)
+        finally:
+            if opts["output"]:
+                out.close()
+            else:
+                out.flush()
+        if opts["output"]:
+            self.stderr.write(f"{written} bytes → {opts['output']}")
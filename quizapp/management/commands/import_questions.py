@@ -0,0 +1,108 @@
+import csv
+import json
+import sys
+from collections import Counter
+from itertools import groupby, islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from quizapp.cache import bump_quiz_version
+from quizapp.importer import apply_questions, has_changes
+from quizapp.models import Quiz
+from quizapp.serializers import QuestionCreateSerializer
+
+TRUE_VALUES = {"1", "true", "t", "yes", "sim", "s", "x"}
+
+
+def read_ndjson(fp):
+    """Uma pergunta (mesmo formato da API) por linha."""
+    for lineno, line in enumerate(fp, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise CommandError(f"linha {lineno}: JSON inválido ({e})")
+
+
+def read_csv(fp):
+    """
+    Uma linha por alternativa; linhas consecutivas com o mesmo `slug` formam a pergunta.
+    Colunas: slug,title,description,kind,required,order,weight,
+             choice_label,choice_value,choice_is_correct,choice_order
+    """
+    rows = csv.DictReader(fp)
+    for slug, group in groupby(rows, key=lambda r: r["slug"]):
+        group = list(group)
+        first = group[0]
+        question = {
+            "slug": slug,
+            "title": first["title"],
+            "description": first.get("description") or "",
+            "kind": first.get("kind") or "single",
+            "required": (first.get("required") or "true").strip().lower() in TRUE_VALUES,
+            "order": first.get("order") or 0,
+            "weight": first.get("weight") or 1.0,
+            "choices": [
+                {
+                    "label": r["choice_label"],
+                    "value": r["choice_value"],
+                    "is_correct": (r.get("choice_is_correct") or "").strip().lower() in TRUE_VALUES,
+                    "order": r.get("choice_order") or 0,
+                }
+                for r in group
+            ],
+        }
+        yield question
+
+
+def chunked(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = "Importa perguntas de um arquivo NDJSON/CSV em lotes (streaming, transação única)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("quiz", help="slug do quiz")
+        parser.add_argument("path", help="arquivo de entrada ('-' para stdin)")
+        parser.add_argument("--format", choices=["ndjson", "csv"], help="padrão: pela extensão do arquivo")
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **opts):
+        try:
+            quiz = Quiz.objects.get(slug=opts["quiz"])
+        except Quiz.DoesNotExist:
+            raise CommandError(f"Quiz '{opts['quiz']}' não encontrado.")
+
+        path = opts["path"]
+        fmt = opts["format"] or ("csv" if path.lower().endswith(".csv") else "ndjson")
+        reader = read_csv if fmt == "csv" else read_ndjson
+
+        fp = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        stats = Counter()
+        try:
+            # tudo ou nada: um erro em qualquer lote desfaz a importação inteira
+            with transaction.atomic():
+                for n, chunk in enumerate(chunked(reader(fp), opts["chunk_size"]), 1):
+                    ser = QuestionCreateSerializer(data=chunk, many=True)
+                    if not ser.is_valid():
+                        errors = {i: e for i, e in enumerate(ser.errors) if e}
+                        raise CommandError(f"lote {n}: {errors}")
+                    apply_questions(quiz, ser.validated_data, stats)
+                    self.stdout.write(f"lote {n}: {len(chunk)} perguntas")
+                if has_changes(stats):
+                    bump_quiz_version(quiz)
+        finally:
+            if fp is not sys.stdin:
+                fp.close()
+
+        summary = ", ".join(f"{k}={v}" for k, v in sorted(stats.items()))
+        self.stdout.write(self.style.SUCCESS(f"Importação concluída ({summary or 'nada a fazer'})."))
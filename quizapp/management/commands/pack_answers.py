@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from quizapp.answer_key import get_answer_key, letters_mask
+from quizapp.models import Answer, Quiz, QuizSession
+from quizapp.packed import encode, ensure_layout
+
+
+class Command(BaseCommand):
+    help = "Migra respostas da tabela Answer para QuizSession.packed_answers (em lotes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--quiz", help="slug do quiz (padrão: todos)")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--delete-rows", action="store_true", help="remove as linhas de Answer já empacotadas")
+
+    def handle(self, *args, **opts):
+        quizzes = Quiz.objects.all()
+        if opts["quiz"]:
+            quizzes = quizzes.filter(slug=opts["quiz"])
+
+        total = 0
+        for quiz in quizzes:
+            key = get_answer_key(quiz)
+            ensure_layout(quiz, key)
+            ids = (
+                QuizSession.objects.filter(quiz=quiz, packed_answers__isnull=True, answers__isnull=False)
+                .distinct().values_list("pk", flat=True)
+            )
+            batch = []
+            for pk in ids.iterator(chunk_size=opts["batch_size"]):
+                batch.append(pk)
+                if len(batch) >= opts["batch_size"]:
+                    total += self.pack(key, batch, opts["delete_rows"])
+                    batch = []
+            if batch:
+                total += self.pack(key, batch, opts["delete_rows"])
+            self.stdout.write(f"{quiz.slug}: {total} sessões empacotadas até agora")
+
+        self.stdout.write(self.style.SUCCESS(f"{total} sessões migradas para packed_answers."))
+
+    def pack(self, key, session_ids, delete_rows):
+        masks = {pk: [0] * len(key) for pk in session_ids}
+        rows = Answer.objects.filter(session_id__in=session_ids).values_list("session_id", "question_id", "selected")
+        for session_id, question_id, selected in rows:
+            pos = key.pos_by_id.get(question_id)
+            if pos is not None:
+                masks[session_id][pos] = letters_mask(selected)
+
+        sessions = [QuizSession(pk=pk, packed_answers=encode(m), packed_version=key.version) for pk, m in masks.items()]
+        with transaction.atomic():
+            QuizSession.objects.bulk_update(sessions, ["packed_answers", "packed_version"])
+            if delete_rows:
+                Answer.objects.filter(session_id__in=session_ids).delete()
+        return len(sessions)
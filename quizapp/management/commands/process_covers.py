@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from quizapp.covers import process_cover
+from quizapp.models import Quiz
+
+
+class Command(BaseCommand):
+    help = "Gera (ou regenera) as variantes WebP/JPEG das capas dos quizzes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--quiz", help="slug do quiz (padrão: todos com capa)")
+        parser.add_argument("--missing", action="store_true", help="só quizzes ainda sem variantes")
+
+    def handle(self, *args, **opts):
+        quizzes = Quiz.objects.exclude(cover="").exclude(cover__isnull=True)
+        if opts["quiz"]:
+            quizzes = quizzes.filter(slug=opts["quiz"])
+        if opts["missing"]:
+            quizzes = quizzes.filter(cover_variants={})
+
+        done = 0
+        for pk, slug in quizzes.values_list("pk", "slug"):
+            variants = process_cover(pk)
+            if variants is None:
+                self.stderr.write(f"{slug}: capa mudou durante o processamento, ignorado")
+                continue
+            done += 1
+            self.stdout.write(f"{slug}: {sum(len(v) for v in variants.values())} variantes")
+        self.stdout.write(self.style.SUCCESS(f"{done} capas processadas."))
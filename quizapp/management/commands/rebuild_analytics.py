@@ -0,0 +1,88 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from quizapp.analytics import answer_deltas, apply_deltas, missing_sessions
+from quizapp.answer_key import get_answer_key, letters_mask
+from quizapp.models import Answer, ChoiceStats, Quiz, QuestionStats, QuizSession
+from quizapp.packed import unpack
+from quizapp.views import served_pairs
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula as estatísticas por pergunta a partir das sessões corrigidas ainda no banco "
+        "(leitura em lotes por keyset; troca os contadores do quiz numa transação curta). "
+        "Recusa quizzes com sessões já arquivadas (archive_sessions), cujo histórico sumiria, "
+        "a menos que se passe --allow-history-loss."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--quiz", help="slug do quiz (padrão: todos)")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--allow-history-loss", action="store_true",
+                            help="reconstrói mesmo com sessões arquivadas (elas saem das estatísticas)")
+
+    def handle(self, *args, **opts):
+        quizzes = Quiz.objects.all()
+        if opts["quiz"]:
+            quizzes = quizzes.filter(slug=opts["quiz"])
+
+        slugs = dict(quizzes.values_list("pk", "slug"))
+        missing = missing_sessions(list(slugs))
+        if missing:
+            lines = [f"{slugs[qid]}: {n} sessões corrigidas não estão mais no banco (arquivadas)" for qid, n in missing.items()]
+            if not opts["allow_history_loss"]:
+                raise CommandError(
+                    "Reconstruir apagaria o histórico arquivado das estatísticas:\n  " + "\n  ".join(lines)
+                    + "\nUse --allow-history-loss para reconstruir só com as sessões do banco."
+                )
+            for line in lines:
+                self.stderr.write(self.style.WARNING(f"{line}; saem das estatísticas"))
+
+        for quiz in quizzes:
+            key = get_answer_key(quiz)
+            attempts, correct, letters = Counter(), Counter(), Counter()
+            sessions = 0
+            for batch in self.batches(quiz, opts["batch_size"]):
+                for pairs in self.session_masks(batch):
+                    answer_deltas(key, pairs, attempts, correct, letters)
+                sessions += len(batch)
+
+            # sessões finalizadas durante a varredura entram pelos incrementos normais
+            # só se terminarem depois da troca; rode em janela de pouco tráfego
+            with transaction.atomic():
+                QuestionStats.objects.filter(quiz=quiz).delete()
+                ChoiceStats.objects.filter(quiz=quiz).delete()
+                apply_deltas(quiz.pk, attempts, correct, letters)
+            self.stdout.write(f"{quiz.slug}: {sessions} sessões, {len(attempts)} perguntas")
+
+        self.stdout.write(self.style.SUCCESS("Estatísticas recalculadas."))
+
+    def batches(self, quiz, size):
+        qs = (
+            QuizSession.objects.filter(quiz=quiz, result__isnull=False)
+            .only("id", "quiz_id", "packed_answers", "packed_version", "question_ids")
+            .order_by("id")
+        )
+        last = None
+        while True:
+            page = list((qs.filter(id__gt=last) if last else qs)[:size])
+            if not page:
+                return
+            yield page
+            last = page[-1].id
+
+    def session_masks(self, sessions):
+        row_ids = [s.pk for s in sessions if s.packed_answers is None]
+        rows = {}
+        if row_ids:
+            for session_id, question_id, selected in Answer.objects.filter(session_id__in=row_ids).values_list(
+                "session_id", "question_id", "selected"
+            ):
+                rows.setdefault(session_id, []).append((question_id, letters_mask(selected)))
+        for s in sessions:
+            pairs = list(unpack(s).items()) if s.packed_answers is not None else rows.get(s.pk, [])
+            # como no record_result: só as perguntas servidas na sessão (amostra do banco)
+            yield served_pairs(pairs, s.question_ids)
@@ -0,0 +1,162 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from quizapp.answer_key import get_answer_key, letters_mask
+from quizapp.models import Answer, Quiz, QuizSession
+from quizapp.packed import decode, get_layout
+from quizapp.scoring import RULES, np, result_payload, score_matrix
+
+COMPARED = ("score", "total", "percent")
+
+
+class _Done:
+    """Future já resolvido (modo sem pool)."""
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
+class Command(BaseCommand):
+    help = (
+        "Recorrige QuizSession.result contra o gabarito atual (ex.: após corrigir um is_correct). "
+        "Lê sessões e respostas em lotes, monta a matriz sessões × perguntas e pontua com NumPy "
+        "(se instalado) num pool de processos; grava só os resultados que mudaram, com bulk_update."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--quiz", help="slug do quiz (padrão: todos)")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--workers", type=int, default=min(os.cpu_count() or 1, 4), help="processos (1 = sem pool)")
+        parser.add_argument("--scoring", choices=RULES, default=None, help="regra de pontuação (padrão: QUIZ_SCORING)")
+        parser.add_argument("--dry-run", action="store_true", help="só conta quantos resultados mudariam")
+        parser.add_argument("--rebuild-stats", action="store_true",
+                            help="recalcula estatísticas por pergunta e histograma de notas no fim")
+        parser.add_argument("--allow-python", action="store_true",
+                            help="sem NumPy, pontua em Python puro (lento) em vez de falhar")
+
+    def handle(self, *args, **opts):
+        self.opts = opts
+        self.rule = opts["scoring"] or settings.QUIZ_SCORING
+        quizzes = Quiz.objects.all()
+        if opts["quiz"]:
+            quizzes = quizzes.filter(slug=opts["quiz"])
+        if np is None and not opts["allow_python"]:
+            raise CommandError("NumPy não instalado (requirements.txt); use --allow-python para o laço em Python puro.")
+        backend = f"numpy {np.__version__}" if np is not None else "python puro"
+        self.stdout.write(f"Pontuação: {backend}, regra {self.rule}, {opts['workers']} processo(s).")
+
+        pool = ProcessPoolExecutor(max_workers=opts["workers"]) if opts["workers"] > 1 else None
+        try:
+            for quiz in quizzes:
+                self.regrade_quiz(quiz, pool)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        if opts["rebuild_stats"] and not opts["dry_run"]:
+            args = ["--quiz", opts["quiz"]] if opts["quiz"] else []
+            call_command("rebuild_analytics", *args, stdout=self.stdout)
+            call_command("backfill_score_histogram", *args, stdout=self.stdout)
+
+    def regrade_quiz(self, quiz, pool):
+        key = get_answer_key(quiz)
+        if not len(key):
+            return
+        key_masks = list(key.masks)
+        total = QuizSession.objects.filter(quiz=quiz, result__isnull=False).count()
+        self.done = self.changed = 0
+        self.started = time.monotonic()
+
+        # no máximo 2 lotes por processo em voo: memória limitada, pool sempre ocupado
+        pending = deque()
+        max_pending = 2 * max(self.opts["workers"], 1)
+        for chunk in self.chunks(quiz, key):
+            ids, results, masks, served = chunk
+            if pool is None:
+                future = _Done(score_matrix(key_masks, masks, served, self.rule))
+            else:
+                future = pool.submit(score_matrix, key_masks, masks, served, self.rule)
+            pending.append((ids, results, future))
+            while len(pending) >= max_pending:
+                self.write(quiz, total, *pending.popleft())
+        while pending:
+            self.write(quiz, total, *pending.popleft())
+
+        verb = "mudariam" if self.opts["dry_run"] else "atualizados"
+        self.stdout.write(self.style.SUCCESS(f"{quiz.slug}: {self.done} sessões, {self.changed} resultados {verb}."))
+
+    def chunks(self, quiz, key):
+        """Lotes (ids, resultados antigos, matriz de máscaras S × Q, perguntas servidas ou None)."""
+        n = len(key)
+        qs = (
+            QuizSession.objects.filter(quiz=quiz, result__isnull=False)
+            .only("id", "quiz_id", "result", "packed_answers", "packed_version", "question_ids")
+            .order_by("id")
+        )
+        last = None
+        while True:
+            page = list((qs.filter(id__gt=last) if last else qs)[:self.opts["chunk_size"]])
+            if not page:
+                return
+            last = page[-1].id
+
+            matrix = bytearray(len(page) * n)
+            row_of = {s.pk: i for i, s in enumerate(page)}
+            for i, s in enumerate(page):
+                if s.packed_answers is None:
+                    continue
+                if s.packed_version == key.version:
+                    matrix[i * n:(i + 1) * n] = bytes(s.packed_answers)[:n].ljust(n, b"\0")
+                else:
+                    # layout de outra versão: remapeia por id
+                    for qid, mask in zip(get_layout(quiz.pk, s.packed_version), decode(s.packed_answers)):
+                        pos = key.pos_by_id.get(qid)
+                        if pos is not None:
+                            matrix[i * n + pos] = mask
+            row_ids = [s.pk for s in page if s.packed_answers is None]
+            if row_ids:
+                rows = Answer.objects.filter(session_id__in=row_ids).values_list("session_id", "question_id", "selected")
+                for session_id, question_id, selected in rows.iterator(chunk_size=self.opts["chunk_size"]):
+                    pos = key.pos_by_id.get(question_id)
+                    if pos is not None:
+                        matrix[row_of[session_id] * n + pos] = letters_mask(selected) & 0xFF
+
+            served = None
+            if any(s.question_ids is not None for s in page):
+                served = [[True] * n if s.question_ids is None else [False] * n for s in page]
+                for i, s in enumerate(page):
+                    for qid in s.question_ids or ():
+                        pos = key.pos_by_id.get(qid)
+                        if pos is not None:
+                            served[i][pos] = True
+
+            if np is not None:
+                masks = np.frombuffer(bytes(matrix), dtype=np.uint8).reshape(len(page), n)
+            else:
+                masks = [matrix[i * n:(i + 1) * n] for i in range(len(page))]
+            yield [s.pk for s in page], [s.result for s in page], masks, served
+
+    def write(self, quiz, total, ids, old_results, future):
+        scores, totals = future.result()
+        updates = []
+        for pk, old, score, n in zip(ids, old_results, scores, totals):
+            new = result_payload(score, n)
+            if not isinstance(old, dict) or any(old.get(k) != new[k] for k in COMPARED):
+                updates.append(QuizSession(pk=pk, result=new))
+        if updates and not self.opts["dry_run"]:
+            with transaction.atomic():
+                QuizSession.objects.bulk_update(updates, ["result"], batch_size=500)
+
+        self.done += len(ids)
+        self.changed += len(updates)
+        rate = self.done / max(time.monotonic() - self.started, 1e-6)
+        self.stderr.write(f"{quiz.slug}: {self.done}/{total} sessões, {self.changed} alteradas ({rate:.0f}/s)")
@@ -0,0 +1,42 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from quizapp.outbox import claim_batch, process_notification
+
+
+def _run(n, max_attempts):
+    try:
+        return process_notification(n, max_attempts=max_attempts)
+    finally:
+        # cada thread tem sua conexão; não deixa conexões penduradas no pool
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Processa o outbox de notificações do Mercado Pago (pool de threads, retry com backoff)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--batch-size", type=int, default=20)
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="segundos entre buscas quando a fila está vazia")
+        parser.add_argument("--max-attempts", type=int, default=8)
+        parser.add_argument("--once", action="store_true", help="drena a fila uma vez e sai")
+
+    def handle(self, *args, **opts):
+        processed = applied = 0
+        with ThreadPoolExecutor(max_workers=opts["threads"]) as pool:
+            while True:
+                batch = claim_batch(opts["batch_size"])
+                if not batch:
+                    if opts["once"]:
+                        break
+                    time.sleep(opts["poll_interval"])
+                    continue
+                for result in pool.map(lambda n: _run(n, opts["max_attempts"]), batch):
+                    processed += 1
+                    applied += bool(result)
+
+        self.stdout.write(self.style.SUCCESS(f"{processed} notificações processadas, {applied} pagamentos aplicados."))
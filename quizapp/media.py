@@ -0,0 +1,147 @@
+"""
+Servidor de mídia (MEDIA_URL) para produção.
+
+MEDIA_SERVE_MODE:
+  accel    → X-Accel-Redirect para o nginx (location interna MEDIA_ACCEL_PREFIX)
+  sendfile → X-Sendfile (apache mod_xsendfile / lighttpd)
+  stream   → FileResponse (wsgi.file_wrapper/sendfile) com Range e 304 no próprio Django
+  off      → nenhuma rota; o servidor da frente serve MEDIA_ROOT direto
+
+Nomes com hash de conteúdo (cover-640.<hash>.webp) recebem cache imutável de 1 ano.
+Variantes pré-comprimidas (<arquivo>.br / <arquivo>.gz) são servidas quando o cliente aceita.
+"""
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.[A-Za-z0-9]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def cache_control_for(path) -> str:
+    if HASHED_NAME.search(path):
+        return IMMUTABLE
+    return getattr(settings, "MEDIA_CACHE_CONTROL", "public, max-age=3600")
+
+
+def _pick_encoding(request, fullpath):
+    accepted = request.headers.get("Accept-Encoding", "")
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(fullpath + suffix):
+            return encoding, fullpath + suffix
+    return None, fullpath
+
+
+def _parse_range(header, size):
+    """Um único intervalo 'bytes=a-b' → (início, fim inclusivo); None = ignorar; False = 416."""
+    m = RANGE.match(header.strip())
+    if not m or size == 0:
+        return None
+    first, last = m.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1     # sufixo: últimos N bytes
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class _FileSlice:
+    """Arquivo limitado a [start, start+length) para respostas 206."""
+    def __init__(self, fp, start, length):
+        fp.seek(start)
+        self.fp = fp
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.fp.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.fp.close()
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except ValueError:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    encoding, filepath = _pick_encoding(request, fullpath)
+    st = os.stat(filepath)
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}{"-" + encoding if encoding else ""}"'
+    content_type = mimetypes.guess_type(fullpath)[0] or "application/octet-stream"
+
+    def headers(response):
+        response["ETag"] = etag
+        response["Last-Modified"] = formatdate(st.st_mtime, usegmt=True)
+        response["Cache-Control"] = cache_control_for(path)
+        response["Accept-Ranges"] = "bytes"
+        patch_vary_headers(response, ["Accept-Encoding"])
+        if encoding:
+            response["Content-Encoding"] = encoding
+        return response
+
+    # condicionais: If-None-Match tem precedência sobre If-Modified-Since
+    inm = request.headers.get("If-None-Match")
+    if inm is not None:
+        if etag in [t.strip() for t in inm.split(",")] or inm.strip() == "*":
+            return headers(HttpResponseNotModified())
+    else:
+        ims = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+        if ims is not None and int(st.st_mtime) <= ims:
+            return headers(HttpResponseNotModified())
+
+    mode = getattr(settings, "MEDIA_SERVE_MODE", "stream")
+    if mode == "accel":
+        relative = os.path.relpath(filepath, settings.MEDIA_ROOT).replace(os.sep, "/")
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_PREFIX.rstrip("/") + "/" + relative
+        return headers(response)    # Range fica com o nginx
+    if mode == "sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = filepath
+        return headers(response)
+
+    # If-Range: só respeita o Range se o validador ainda bater
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if range_header and request.headers.get("If-Range", etag) == etag:
+        byte_range = _parse_range(range_header, st.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416, content_type=content_type)
+        response["Content-Range"] = f"bytes */{st.st_size}"
+        return headers(response)
+
+    fp = open(filepath, "rb")
+    if byte_range is None:
+        response = FileResponse(fp, content_type=content_type)    # zero-copy via wsgi.file_wrapper
+        response["Content-Length"] = str(st.st_size)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(_FileSlice(fp, start, length), status=206, content_type=content_type)
+        response["Content-Length"] = str(length)
+        response["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    return headers(response)
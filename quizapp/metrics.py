@@ -0,0 +1,261 @@
+"""
+Métricas de requisição no formato texto do Prometheus (GET /metrics).
+
+Acúmulo sem lock no caminho quente: cada thread escreve no próprio dicionário
+e a leitura soma todos. Com METRICS_DIR configurado, cada processo (worker do
+gunicorn) grava periodicamente um snapshot em <METRICS_DIR>/<pid>.json e o
+/metrics agrega os arquivos de todos os workers.
+
+Acesso: exige METRICS_TOKEN ("Authorization: Bearer <token>"); sem token
+configurado o /metrics responde 404 (só fica aberto com DEBUG, para uso local).
+"""
+import atexit
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+PREFIX = "quiz_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+HELP = {
+    "http_requests_total": ("counter", "Requisições por rota, método e classe de status"),
+    "http_request_duration_seconds": ("histogram", "Latência das requisições por rota"),
+    "http_requests_in_flight": ("gauge", "Requisições em andamento"),
+    "db_queries_per_request": ("histogram", "Queries SQL por requisição"),
+    "db_query_seconds_total": ("counter", "Tempo total em SQL por rota"),
+    "mp_request_duration_seconds": ("histogram", "Latência das chamadas ao Mercado Pago"),
+    "mp_requests_total": ("counter", "Chamadas ao Mercado Pago por operação e desfecho"),
+    "cache_lookups_total": ("counter", "Consultas aos caches compilados por tipo e desfecho"),
+    "rate_limited_total": ("counter", "Requisições recusadas (429) por rota e escopo do limite"),
+}
+GAUGES = {name for name, (kind, _) in HELP.items() if kind == "gauge"}
+
+
+class _Registry:
+    def __init__(self):
+        self._local = threading.local()
+        self._stores = []
+        self._stores_lock = threading.Lock()   # só no primeiro uso de cada thread
+        self._last_flush = 0.0
+
+    def _store(self):
+        store = getattr(self._local, "store", None)
+        if store is None:
+            store = self._local.store = {"counters": {}, "hist": {}}
+            with self._stores_lock:
+                self._stores.append(store)
+        return store
+
+    def inc(self, name, labels=(), value=1.0):
+        counters = self._store()["counters"]
+        key = (name, labels)
+        counters[key] = counters.get(key, 0.0) + value
+
+    def observe(self, name, value, labels=(), buckets=LATENCY_BUCKETS):
+        hist = self._store()["hist"]
+        key = (name, labels)
+        h = hist.get(key)
+        if h is None:
+            h = hist[key] = [buckets, [0] * (len(buckets) + 1), 0.0, 0]
+        h[1][bisect_left(buckets, value)] += 1
+        h[2] += value
+        h[3] += 1
+
+    def snapshot(self):
+        """Soma os dicionários de todas as threads deste processo."""
+        counters, hist = {}, {}
+        with self._stores_lock:
+            stores = list(self._stores)
+        for store in stores:
+            for key, v in list(store["counters"].items()):
+                counters[key] = counters.get(key, 0.0) + v
+            for key, (buckets, counts, total, n) in list(store["hist"].items()):
+                h = hist.get(key)
+                if h is None:
+                    hist[key] = [buckets, list(counts), total, n]
+                else:
+                    h[1] = [a + b for a, b in zip(h[1], counts)]
+                    h[2] += total
+                    h[3] += n
+        return counters, hist
+
+    def flush(self, force=False):
+        """Grava o snapshot do processo em METRICS_DIR (no máximo 1x por intervalo)."""
+        directory = getattr(settings, "METRICS_DIR", None)
+        now = time.monotonic()
+        if not directory or (not force and now - self._last_flush < getattr(settings, "METRICS_FLUSH_INTERVAL", 1.0)):
+            return
+        self._last_flush = now
+        counters, hist = self.snapshot()
+        data = {
+            "counters": [[n, list(l), v] for (n, l), v in counters.items()],
+            "hist": [[n, list(l), list(b), c, s, k] for (n, l), (b, c, s, k) in hist.items()],
+        }
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        tmp = path / f".{os.getpid()}.tmp"
+        tmp.write_text(json.dumps(data))
+        tmp.replace(path / f"{os.getpid()}.json")
+
+
+registry = _Registry()
+inc = registry.inc
+observe = registry.observe
+atexit.register(lambda: registry.flush(force=True))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect():
+    """Agrega este processo + snapshots dos demais workers em METRICS_DIR."""
+    counters, hist = registry.snapshot()
+    directory = getattr(settings, "METRICS_DIR", None)
+    if directory and Path(directory).is_dir():
+        for f in Path(directory).glob("*.json"):
+            pid = int(f.stem) if f.stem.isdigit() else None
+            if pid is None or pid == os.getpid():
+                continue
+            alive = _pid_alive(pid)
+            try:
+                data = json.loads(f.read_text())
+            except (OSError, ValueError):
+                continue
+            for name, labels, v in data["counters"]:
+                if name in GAUGES and not alive:
+                    continue   # gauge de worker morto não vale mais
+                key = (name, tuple(tuple(x) for x in labels))
+                counters[key] = counters.get(key, 0.0) + v
+            for name, labels, buckets, counts, total, n in data["hist"]:
+                key = (name, tuple(tuple(x) for x in labels))
+                h = hist.get(key)
+                if h is None:
+                    hist[key] = [tuple(buckets), counts, total, n]
+                else:
+                    h[1] = [a + b for a, b in zip(h[1], counts)]
+                    h[2] += total
+                    h[3] += n
+    return counters, hist
+
+
+def _labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+
+def render() -> str:
+    counters, hist = collect()
+    lines = []
+    for name, (kind, help_text) in HELP.items():
+        full = PREFIX + name
+        lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} {kind}")
+        if kind == "histogram":
+            for (n, labels), (buckets, counts, total, count) in sorted(hist.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, c in zip(list(buckets) + ["+Inf"], counts):
+                    cumulative += c
+                    lines.append(f"{full}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{full}_sum{_labels(labels)} {total}")
+                lines.append(f"{full}_count{_labels(labels)} {count}")
+        else:
+            for (n, labels), v in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{full}{_labels(labels)} {v:g}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if not token:
+        # rotas, tráfego e desfechos do MP não são públicos: sem token, só em DEBUG
+        if not settings.DEBUG:
+            raise Http404
+    elif not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class _QueryCounter:
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """Latência por rota, requisições em andamento e queries SQL por requisição."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        inc("http_requests_in_flight")
+        start = time.perf_counter()
+        queries = _QueryCounter()
+        try:
+            with connection.execute_wrapper(queries):
+                response = self.get_response(request)
+        finally:
+            inc("http_requests_in_flight", value=-1)
+        self.record(request, response, time.perf_counter() - start, queries)
+        return response
+
+    async def __acall__(self, request):
+        # views async: as queries rodam em outras threads, então só latência/status
+        inc("http_requests_in_flight")
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            inc("http_requests_in_flight", value=-1)
+        self.record(request, response, time.perf_counter() - start, None)
+        return response
+
+    def record(self, request, response, elapsed, queries):
+        match = getattr(request, "resolver_match", None)
+        route = ("/" + match.route) if match else "unmatched"
+        status = f"{response.status_code // 100}xx"
+        inc("http_requests_total", (("route", route), ("method", request.method), ("status", status)))
+        observe("http_request_duration_seconds", elapsed, (("route", route),))
+        if queries is not None:
+            observe("db_queries_per_request", queries.count, (("route", route),), QUERY_BUCKETS)
+            inc("db_query_seconds_total", (("route", route),), queries.seconds)
+        registry.flush()
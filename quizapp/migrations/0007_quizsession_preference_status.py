@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizapp', '0006_payment_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizsession',
+            name='mp_init_point',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='quizsession',
+            name='mp_pref_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quizsession',
+            name='mp_pref_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Criando'), ('ready', 'Pronta'), ('failed', 'Falhou')], max_length=10),
+        ),
+    ]
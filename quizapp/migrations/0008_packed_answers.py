@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizapp', '0007_quizsession_preference_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizsession',
+            name='packed_answers',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quizsession',
+            name='packed_version',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='QuizLayout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('question_ids', models.JSONField(default=list)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='layouts', to='quizapp.quiz')),
+            ],
+            options={
+                'unique_together': {('quiz', 'version')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizapp', '0009_quiz_cover_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='quizapp.question')),
+                ('attempts', models.PositiveBigIntegerField(default=0)),
+                ('correct', models.PositiveBigIntegerField(default=0)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='question_stats', to='quizapp.quiz')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChoiceStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('letter', models.CharField(max_length=1)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='choice_stats', to='quizapp.question')),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='choice_stats', to='quizapp.quiz')),
+            ],
+            options={
+                'unique_together': {('question', 'letter')},
+            },
+        ),
+    ]
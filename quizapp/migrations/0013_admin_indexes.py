@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizapp', '0012_question_pools'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='quizsession',
+            name='mp_pref_id',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='quizsession',
+            index=models.Index(fields=['created_at', 'id'], name='quizapp_qui_created_39237b_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 import secrets
 import uuid
 
@@ -17,7 +18,13 @@ class Quiz(models.Model):
     is_active = models.BooleanField(default=True)
 
     cover = models.ImageField(upload_to=quiz_cover_path, blank=True, null=True)
-    
+    # {"webp": {"320": "quizzes/<slug>/cover-320.<hash>.webp", ...}, "jpeg": {...}} (ver covers.py)
+    cover_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # incrementado a cada alteração de conteúdo; chave dos snapshots em cache
+    version = models.PositiveIntegerField(default=1, editable=False)
+    # banco de questões: cada sessão recebe uma amostra estratificada de N perguntas (vazio = todas)
+    sample_size = models.PositiveIntegerField(null=True, blank=True)
+
     class Meta:
         ordering = ["slug"]
 
@@ -25,11 +32,44 @@ class Quiz(models.Model):
         return self.title
     
 class QuizSession(models.Model):
+    PREF_PENDING = "pending"
+    PREF_READY   = "ready"
+    PREF_FAILED  = "failed"
+    PREF_STATUS_CHOICES = [
+        (PREF_PENDING, "Criando"),
+        (PREF_READY, "Pronta"),
+        (PREF_FAILED, "Falhou"),
+    ]
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     quiz = models.ForeignKey('Quiz', on_delete=models.CASCADE, related_name='sessions', null=True, blank=True)
-    mp_pref_id = models.CharField(max_length=100, null=True, blank=True)
+    mp_pref_id = models.CharField(max_length=100, null=True, blank=True, db_index=True)
+    mp_pref_status = models.CharField(max_length=10, choices=PREF_STATUS_CHOICES, blank=True)
+    mp_pref_requested_at = models.DateTimeField(null=True, blank=True)
+    mp_init_point = models.CharField(max_length=500, blank=True)
+    mp_payment_id = models.CharField(max_length=64, null=True, blank=True, unique=True)
+    paid = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     result = models.JSONField(null=True, blank=True)
+    # modo QUIZ_ANSWER_STORAGE="packed": 1 byte por pergunta (bitmask das letras),
+    # na ordem do QuizLayout da versão `packed_version`
+    packed_answers = models.BinaryField(null=True, blank=True)
+    packed_version = models.PositiveIntegerField(null=True, blank=True)
+    # ids das perguntas servidas, na ordem (quiz com sample_size); nulo = todas do quiz
+    question_ids = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        # filtro/date_hierarchy do admin e ordenação por -created_at, -pk sem sort
+        indexes = [models.Index(fields=["created_at", "id"])]
+
+class QuizLayout(models.Model):
+    """Ordem das perguntas de uma versão do quiz (posições usadas em packed_answers)."""
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name="layouts")
+    version = models.PositiveIntegerField()
+    question_ids = models.JSONField(default=list)
+
+    class Meta:
+        unique_together = (("quiz", "version"),)
 
 class Question(models.Model):
     KIND_SINGLE   = "single"     # uma alternativa correta
@@ -76,4 +116,59 @@ class Answer(models.Model):
     selected = models.JSONField(default=list)
 
     class Meta:
-        unique_together = (("session", "question"),)
\ No newline at end of file
+        unique_together = (("session", "question"),)
+
+class PaymentNotification(models.Model):
+    """Outbox de notificações do Mercado Pago (uma linha por pagamento)."""
+    STATUS_PENDING    = "pending"
+    STATUS_PROCESSING = "processing"
+    STATUS_DONE       = "done"
+    STATUS_FAILED     = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pendente"),
+        (STATUS_PROCESSING, "Processando"),
+        (STATUS_DONE, "Concluída"),
+        (STATUS_FAILED, "Falhou"),
+    ]
+
+    payment_id = models.CharField(max_length=64, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    payment_status = models.CharField(max_length=32, blank=True)   # status visto no MP
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"{self.payment_id} ({self.status})"
+
+class QuestionStats(models.Model):
+    """Contadores por pergunta, incrementados a cada sessão corrigida (ver analytics.py)."""
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name="question_stats")
+    attempts = models.PositiveBigIntegerField(default=0)
+    correct = models.PositiveBigIntegerField(default=0)
+
+class ChoiceStats(models.Model):
+    """Quantas vezes cada letra (a..d) foi marcada em cada pergunta."""
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name="choice_stats")
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name="choice_stats")
+    letter = models.CharField(max_length=1)
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        unique_together = (("question", "letter"),)
+
+class ScoreBucket(models.Model):
+    """Histograma de notas por quiz: quantas sessões tiraram cada percentual (0..100)."""
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name="score_buckets")
+    percent = models.PositiveSmallIntegerField()
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        unique_together = (("quiz", "percent"),)
@@ -0,0 +1,123 @@
+import logging
+import random
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import PaymentNotification, QuizSession
+from .payments import get_gateway, GatewayError
+
+log = logging.getLogger(__name__)
+
+LEASE = timedelta(minutes=5)         # após isso, uma linha "processing" órfã volta para a fila
+BACKOFF_BASE = 5                     # segundos
+BACKOFF_MAX = 30 * 60
+
+
+def enqueue_payment(payment_id: str):
+    """
+    Registra a notificação no outbox (idempotente por payment_id).
+    Se o pagamento já foi processado sem aprovação, volta para a fila:
+    o MP notifica de novo quando o status muda (ex.: pending → approved).
+    """
+    PaymentNotification.objects.bulk_create(
+        [PaymentNotification(payment_id=payment_id)], ignore_conflicts=True
+    )
+    PaymentNotification.objects.filter(
+        payment_id=payment_id,
+        status__in=[PaymentNotification.STATUS_DONE, PaymentNotification.STATUS_FAILED],
+    ).exclude(payment_status="approved").update(
+        status=PaymentNotification.STATUS_PENDING, attempts=0, next_attempt_at=timezone.now()
+    )
+
+
+async def aenqueue_payment(payment_id: str):
+    await PaymentNotification.objects.abulk_create(
+        [PaymentNotification(payment_id=payment_id)], ignore_conflicts=True
+    )
+    await PaymentNotification.objects.filter(
+        payment_id=payment_id,
+        status__in=[PaymentNotification.STATUS_DONE, PaymentNotification.STATUS_FAILED],
+    ).exclude(payment_status="approved").aupdate(
+        status=PaymentNotification.STATUS_PENDING, attempts=0, next_attempt_at=timezone.now()
+    )
+
+
+def claim_batch(limit: int):
+    """
+    Reserva até `limit` notificações vencidas. A reserva é um UPDATE condicional
+    por linha, então vários workers podem rodar em paralelo sem processar a mesma.
+    """
+    now = timezone.now()
+    due = (
+        Q(status=PaymentNotification.STATUS_PENDING, next_attempt_at__lte=now)
+        | Q(status=PaymentNotification.STATUS_PROCESSING, locked_at__lt=now - LEASE)
+    )
+    candidates = list(
+        PaymentNotification.objects.filter(due).order_by("next_attempt_at").values_list("pk", flat=True)[:limit]
+    )
+    claimed = []
+    for pk in candidates:
+        if PaymentNotification.objects.filter(due, pk=pk).update(
+            status=PaymentNotification.STATUS_PROCESSING, locked_at=now, attempts=F("attempts") + 1
+        ):
+            claimed.append(pk)
+    return list(PaymentNotification.objects.filter(pk__in=claimed))
+
+
+def fetch_payment(payment_id: str) -> dict:
+    gateway = get_gateway()
+    if gateway is None:
+        raise GatewayError("MP_ACCESS_TOKEN não configurado")
+    return gateway.get_payment(payment_id)
+
+
+def apply_payment(payment_id: str, payment: dict) -> bool:
+    """Marca a sessão como paga. O UPDATE condicional garante efeito único."""
+    if payment.get("status") != "approved":
+        return False
+    ext = payment.get("external_reference")
+    if not ext:
+        return False
+    try:
+        with transaction.atomic():
+            return bool(
+                QuizSession.objects.filter(pk=ext, paid=False)
+                .update(paid=True, mp_payment_id=payment_id)
+            )
+    except ValidationError:
+        log.warning("[MP] external_reference inválida no pagamento %s: %r", payment_id, ext)
+        return False
+
+
+def backoff(attempts: int) -> timedelta:
+    delay = min(BACKOFF_BASE * 2 ** max(attempts - 1, 0), BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def process_notification(n: PaymentNotification, fetch=fetch_payment, max_attempts: int = 8):
+    try:
+        payment = fetch(n.payment_id)
+        applied = apply_payment(n.payment_id, payment)
+    except Exception as e:
+        failed = n.attempts >= max_attempts
+        PaymentNotification.objects.filter(pk=n.pk).update(
+            status=PaymentNotification.STATUS_FAILED if failed else PaymentNotification.STATUS_PENDING,
+            next_attempt_at=timezone.now() + backoff(n.attempts),
+            locked_at=None,
+            last_error=str(e)[:2000],
+        )
+        log.warning("[MP] pagamento %s: tentativa %s falhou: %s", n.payment_id, n.attempts, e)
+        return None
+
+    PaymentNotification.objects.filter(pk=n.pk).update(
+        status=PaymentNotification.STATUS_DONE,
+        payment_status=str(payment.get("status") or "")[:32],
+        processed_at=timezone.now(),
+        locked_at=None,
+        last_error="",
+    )
+    return applied
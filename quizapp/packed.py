@@ -0,0 +1,95 @@
+"""
+Armazenamento compacto das respostas na própria sessão (QUIZ_ANSWER_STORAGE="packed").
+
+Formato: bytes com 1 byte por pergunta, na ordem do QuizLayout da versão
+`packed_version`. Cada byte é o bitmask de letras de answer_key.letters_mask
+(a=1, b=2, c=4, d=8, 16 = escolha inválida); 0 = não respondida.
+Um quiz de 40 perguntas ocupa 40 bytes em vez de 40 linhas de Answer.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from .answer_key import LETTERS, get_answer_key, letters_mask
+from .cache import local_cache
+from .models import QuizLayout, QuizSession
+
+
+def packed_mode() -> bool:
+    return getattr(settings, "QUIZ_ANSWER_STORAGE", "rows") == "packed"
+
+
+def encode(masks) -> bytes:
+    return bytes(masks)
+
+
+def decode(data) -> list:
+    return list(bytes(data or b""))
+
+
+def mask_letters(mask: int) -> list:
+    return [letter for i, letter in enumerate(LETTERS) if mask & (1 << i)]
+
+
+def _cache_layout(cache_key, layout):
+    # só depois do commit: se a transação do chamador desfizer o QuizLayout, o cache
+    # não pode afirmar que a linha existe (ensure_layout pularia o get_or_create)
+    transaction.on_commit(lambda: local_cache.set(cache_key, layout))
+
+
+def get_layout(quiz_id: int, version: int) -> tuple:
+    """ids das perguntas da versão (imutável → cache local sem expiração prática)."""
+    key = f"quizapp:layout:{quiz_id}:v{version}"
+    layout = local_cache.get(key)
+    if layout is None:
+        ids = QuizLayout.objects.filter(quiz_id=quiz_id, version=version).values_list("question_ids", flat=True).first()
+        if ids is None:
+            return ()
+        layout = tuple(ids)
+        _cache_layout(key, layout)
+    return layout
+
+
+def ensure_layout(quiz, key) -> tuple:
+    """Garante o QuizLayout da versão atual (criado na primeira sessão empacotada)."""
+    cache_key = f"quizapp:layout:{quiz.pk}:v{key.version}"
+    layout = local_cache.get(cache_key)
+    if layout is None:
+        QuizLayout.objects.get_or_create(quiz=quiz, version=key.version, defaults={"question_ids": list(key.ids)})
+        layout = key.ids
+        _cache_layout(cache_key, layout)
+    return layout
+
+
+def unpack(session) -> dict:
+    """{question_id: mask} das respostas empacotadas da sessão."""
+    if session.packed_answers is None:
+        return {}
+    layout = get_layout(session.quiz_id, session.packed_version)
+    return {qid: mask for qid, mask in zip(layout, decode(session.packed_answers)) if mask}
+
+
+def save_packed_answers(session_id, answers) -> QuizSession:
+    """
+    Mescla respostas [{"questionId": slug, "choices": [...]}] no campo compacto.
+    Leitura + escrita da linha da sessão sob lock; se o quiz mudou de versão desde
+    o último save, as respostas antigas são remapeadas por id para o layout atual.
+    """
+    with transaction.atomic():
+        s = QuizSession.objects.select_for_update().select_related("quiz").get(pk=session_id)
+        key = get_answer_key(s.quiz)
+        ensure_layout(s.quiz, key)
+
+        masks = [0] * len(key)
+        for qid, mask in unpack(s).items():
+            pos = key.pos_by_id.get(qid)
+            if pos is not None:
+                masks[pos] = mask
+        for a in answers:
+            pos = key.pos_by_slug.get(a["questionId"])
+            if pos is not None:
+                masks[pos] = letters_mask(a["choices"])
+
+        s.packed_answers = encode(masks)
+        s.packed_version = key.version
+        s.save(update_fields=["packed_answers", "packed_version"])
+    return s
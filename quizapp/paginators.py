@@ -0,0 +1,49 @@
+"""
+Paginator do admin para tabelas grandes (sessões, respostas, outbox).
+
+No postgres o total vem de estimativa: pg_class.reltuples sem filtro, ou as
+"Plan Rows" do EXPLAIN com filtro/busca. Só quando a estimativa fica abaixo
+de ADMIN_EXACT_COUNT_BELOW é que roda o COUNT(*) exato (barato nesse porte).
+Nos outros bancos, COUNT(*) normal.
+"""
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+def estimated_count(qs):
+    """Número aproximado de linhas do queryset (postgres) ou None se não houver estimativa."""
+    connection = connections[qs.db]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        if not qs.query.where and not qs.query.distinct:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [connection.ops.quote_name(qs.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+            estimate = row[0] if row else None
+        else:
+            sql, params = qs.query.sql_with_params()
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = plan[0]["Plan"]["Plan Rows"]
+    # reltuples = -1: tabela nunca analisada (postgres ≥ 14)
+    return int(estimate) if estimate is not None and estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate >= settings.ADMIN_EXACT_COUNT_BELOW:
+                return estimate
+        return super().count
@@ -0,0 +1,327 @@
+import asyncio
+import itertools
+import threading
+import time
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:   # opcional: sem httpx, as chamadas async usam o cliente síncrono numa thread
+    httpx = None
+
+from . import metrics
+
+
+class GatewayError(Exception):
+    pass
+
+
+class GatewayRejected(GatewayError):
+    """O MP respondeu com erro 4xx: o serviço está saudável, a requisição é que é inválida."""
+
+
+class GatewayUnavailable(GatewayError):
+    """Circuito aberto: o MP está com falhas e as chamadas são recusadas sem rede."""
+
+
+class CircuitBreaker:
+    """
+    closed → (N falhas seguidas) → open → (reset_timeout) → half-open → 1 chamada de teste.
+    Sucesso na chamada de teste fecha o circuito; falha reabre.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probe = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probe:
+                self._probe = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probe = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class GatewayStats:
+    """Contadores por operação: chamadas, erros, recusas do circuito e latência."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ops = {}
+
+    def record(self, op: str, seconds: float, outcome: str):
+        with self._lock:
+            s = self._ops.setdefault(op, {"calls": 0, "errors": 0, "rejected": 0, "latency_sum": 0.0, "latency_max": 0.0})
+            if outcome == "rejected":
+                s["rejected"] += 1
+                return
+            s["calls"] += 1
+            s["errors"] += outcome != "ok"
+            s["latency_sum"] += seconds
+            s["latency_max"] = max(s["latency_max"], seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {op: dict(s) for op, s in self._ops.items()}
+
+
+class BaseGateway:
+    name = "base"
+
+    def __init__(self, breaker=None):
+        self.breaker = breaker or CircuitBreaker(
+            getattr(settings, "MP_BREAKER_THRESHOLD", 5), getattr(settings, "MP_BREAKER_RESET", 30.0)
+        )
+        self.stats = GatewayStats()
+
+    @property
+    def healthy(self) -> bool:
+        return self.breaker.state != "open"
+
+    def _enter(self, op):
+        if not self.breaker.allow():
+            self.stats.record(op, 0.0, "rejected")
+            metrics.inc("mp_requests_total", (("op", op), ("outcome", "rejected")))
+            raise GatewayUnavailable(f"Mercado Pago indisponível (circuito {self.breaker.state})")
+        return time.perf_counter()
+
+    def _exit(self, op, start, exc=None):
+        """Registra o desfecho da chamada; devolve a exceção a propagar (se houver)."""
+        elapsed = time.perf_counter() - start
+        outcome = "ok" if exc is None else ("rejected_4xx" if isinstance(exc, GatewayRejected) else "error")
+        metrics.observe("mp_request_duration_seconds", elapsed, (("op", op),))
+        metrics.inc("mp_requests_total", (("op", op), ("outcome", outcome)))
+        if exc is None:
+            self.breaker.record_success()
+            self.stats.record(op, elapsed, "ok")
+            return None
+        if isinstance(exc, GatewayRejected):
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        self.stats.record(op, elapsed, "error")
+        return exc if isinstance(exc, GatewayError) else GatewayError(str(exc))
+
+    def _call(self, op, fn, *args):
+        start = self._enter(op)
+        try:
+            result = fn(*args)
+        except Exception as e:
+            err = self._exit(op, start, e)
+            if err is e:
+                raise
+            raise err from e
+        self._exit(op, start)
+        return result
+
+    async def _acall(self, op, fn, *args):
+        start = self._enter(op)
+        try:
+            result = await fn(*args)
+        except Exception as e:
+            err = self._exit(op, start, e)
+            if err is e:
+                raise
+            raise err from e
+        self._exit(op, start)
+        return result
+
+    def create_preference(self, payload: dict, timeout=None) -> dict:
+        return self._call("create_preference", self._create_preference, payload, timeout)
+
+    def get_payment(self, payment_id: str, timeout=None) -> dict:
+        return self._call("get_payment", self._get_payment, payment_id, timeout)
+
+    async def acreate_preference(self, payload: dict, timeout=None) -> dict:
+        return await self._acall("create_preference", self._acreate_preference, payload, timeout)
+
+    async def aget_payment(self, payment_id: str, timeout=None) -> dict:
+        return await self._acall("get_payment", self._aget_payment, payment_id, timeout)
+
+    def _create_preference(self, payload, timeout):
+        raise NotImplementedError
+
+    def _get_payment(self, payment_id, timeout):
+        raise NotImplementedError
+
+    # padrão das versões async: implementação síncrona numa thread à parte
+    async def _acreate_preference(self, payload, timeout):
+        return await sync_to_async(self._create_preference, thread_sensitive=False)(payload, timeout)
+
+    async def _aget_payment(self, payment_id, timeout):
+        return await sync_to_async(self._get_payment, thread_sensitive=False)(payment_id, timeout)
+
+
+class MercadoPagoGateway(BaseGateway):
+    """Cliente HTTP do MP com pool keep-alive, timeouts por chamada e circuit breaker."""
+    name = "mercadopago"
+
+    def __init__(self, access_token=None, base_url=None, timeout=None, pool_size=None, breaker=None):
+        super().__init__(breaker)
+        self.access_token = access_token if access_token is not None else settings.MP_ACCESS_TOKEN
+        self.base_url = (base_url or settings.MP_API_BASE_URL).rstrip("/")
+        self.timeout = timeout or settings.MP_TIMEOUT
+        self.pool_size = pool_size = pool_size or getattr(settings, "MP_POOL_SIZE", 10)
+        self._aclient = None   # httpx.AsyncClient, criado no primeiro uso (event loop do worker ASGI)
+
+        self.session = requests.Session()
+        # retry só para GET (idempotente); POST de preferência não é repetido às cegas
+        retry = Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Authorization"] = f"Bearer {self.access_token}"
+
+    @property
+    def mode(self) -> str:
+        return "prod" if str(self.access_token).startswith("APP_USR-") else "sandbox"
+
+    @staticmethod
+    def _check(method, path, status_code, text):
+        if status_code >= 400:
+            exc = GatewayRejected if status_code < 500 else GatewayError
+            raise exc(f"MP {method} {path}: HTTP {status_code} {text[:200]}")
+
+    def _request(self, method, path, timeout, **kwargs):
+        r = self.session.request(method, f"{self.base_url}{path}", timeout=timeout or self.timeout, **kwargs)
+        self._check(method, path, r.status_code, r.text)
+        return r.json()
+
+    async def _arequest(self, method, path, timeout, **kwargs):
+        if self._aclient is None:
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            self._aclient = httpx.AsyncClient(
+                base_url=self.base_url, headers=dict(self.session.headers), limits=limits,
+                transport=httpx.AsyncHTTPTransport(retries=1, limits=limits),
+            )
+        r = await self._aclient.request(method, path, timeout=timeout or self.timeout, **kwargs)
+        self._check(method, path, r.status_code, r.text)
+        return r.json()
+
+    @staticmethod
+    def _preference_headers(payload):
+        if payload.get("external_reference"):
+            return {"X-Idempotency-Key": f"pref-{payload['external_reference']}"}
+        return {}
+
+    def _create_preference(self, payload, timeout):
+        return self._request("POST", "/checkout/preferences", timeout,
+                             json=payload, headers=self._preference_headers(payload))
+
+    def _get_payment(self, payment_id, timeout):
+        return self._request("GET", f"/v1/payments/{payment_id}", timeout)
+
+    async def _acreate_preference(self, payload, timeout):
+        if httpx is None:
+            return await super()._acreate_preference(payload, timeout)
+        return await self._arequest("POST", "/checkout/preferences", timeout,
+                                    json=payload, headers=self._preference_headers(payload))
+
+    async def _aget_payment(self, payment_id, timeout):
+        if httpx is None:
+            return await super()._aget_payment(payment_id, timeout)
+        return await self._arequest("GET", f"/v1/payments/{payment_id}", timeout)
+
+
+class StubGateway(BaseGateway):
+    """Gateway em processo para testes e testes de carga (nenhuma chamada de rede)."""
+    name = "stub"
+    mode = "stub"
+
+    def __init__(self, payments=None, latency=0.0, breaker=None):
+        super().__init__(breaker)
+        self.payments = payments if payments is not None else {}
+        self.latency = latency
+        self.preferences = []
+        self._ids = itertools.count(1)
+
+    def _preference(self, payload):
+        pref_id = f"stub-pref-{next(self._ids)}"
+        self.preferences.append(payload)
+        return {"id": pref_id, "sandbox_init_point": f"https://sandbox.stub.invalid/checkout/{pref_id}"}
+
+    def _payment(self, payment_id):
+        try:
+            return self.payments[payment_id]
+        except KeyError:
+            raise GatewayRejected(f"pagamento {payment_id} desconhecido")
+
+    def _create_preference(self, payload, timeout):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._preference(payload)
+
+    def _get_payment(self, payment_id, timeout):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._payment(payment_id)
+
+    async def _acreate_preference(self, payload, timeout):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._preference(payload)
+
+    async def _aget_payment(self, payment_id, timeout):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._payment(payment_id)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """
+    Gateway configurado em PAYMENT_GATEWAY (caminho pontilhado da classe).
+    Devolve None quando o MP real está configurado sem credencial.
+    """
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                cls = import_string(getattr(settings, "PAYMENT_GATEWAY", "quizapp.payments.MercadoPagoGateway"))
+                if cls is MercadoPagoGateway and not settings.MP_ACCESS_TOKEN:
+                    return None
+                _gateway = cls()
+    return _gateway
+
+
+def set_gateway(gateway):
+    """Troca o gateway do processo (testes/carga). `None` volta ao configurado."""
+    global _gateway
+    _gateway = gateway
@@ -0,0 +1,85 @@
+"""
+Banco de questões com amostragem estratificada (Quiz.sample_size).
+
+O pool de cada versão do quiz é compilado no mesmo cache dos snapshots:
+posições das perguntas agrupadas em estratos (peso, faixa de dificuldade).
+Como as faixas vêm das estatísticas vivas (QuestionStats), a chave também
+muda a cada QUIZ_POOL_REFRESH segundos e o pool é recompilado com as taxas
+de acerto atuais, mesmo sem edição do conteúdo.
+Cada start sorteia em memória, em O(k), uma amostra com a mesma proporção
+de estratos do banco — nada de ORDER BY RANDOM() na tabela de perguntas.
+"""
+import random
+import time
+
+from django.conf import settings
+
+from .answer_key import get_answer_key
+from .cache import get_versioned
+from .models import QuestionStats
+
+# abaixo disso a taxa de acerto ainda não diz nada: a pergunta fica na faixa "?"
+DIFFICULTY_MIN_ATTEMPTS = 30
+
+
+def difficulty_band(attempts, correct) -> str:
+    if attempts < DIFFICULTY_MIN_ATTEMPTS:
+        return "?"
+    rate = correct / attempts
+    return "easy" if rate >= 0.7 else ("medium" if rate >= 0.4 else "hard")
+
+
+class QuestionPool:
+    """Estratos imutáveis: ((peso, faixa), (posições no gabarito, ...))."""
+    __slots__ = ("version", "strata", "size")
+
+    def __init__(self, version, strata):
+        self.version = version
+        self.strata = tuple((key, tuple(positions)) for key, positions in sorted(strata.items()))
+        self.size = sum(len(positions) for _, positions in self.strata)
+
+    def allocate(self, k, rng=random) -> list:
+        """Quantas perguntas sortear de cada estrato (proporcional, maiores restos; empates aleatórios)."""
+        quotas = [k * len(positions) / self.size for _, positions in self.strata]
+        counts = [int(q) for q in quotas]
+        order = sorted(range(len(quotas)), key=lambda i: (counts[i] - quotas[i], rng.random()))
+        for i in order[:k - sum(counts)]:
+            counts[i] += 1
+        return counts
+
+    def sample(self, k, rng=random) -> list:
+        """k posições sorteadas, estratificadas e embaralhadas."""
+        picked = []
+        for (_, positions), n in zip(self.strata, self.allocate(k, rng)):
+            picked.extend(rng.sample(positions, n))
+        rng.shuffle(picked)
+        return picked
+
+
+def build_question_pool(quiz) -> QuestionPool:
+    key = get_answer_key(quiz)
+    stats = {
+        qid: (attempts, correct)
+        for qid, attempts, correct in QuestionStats.objects.filter(quiz=quiz).values_list("question_id", "attempts", "correct")
+    }
+    strata = {}
+    for pos, qid in enumerate(key.ids):
+        band = difficulty_band(*stats.get(qid, (0, 0)))
+        strata.setdefault((key.weights[pos], band), []).append(pos)
+    return QuestionPool(key.version, strata)
+
+
+def get_question_pool(quiz) -> QuestionPool:
+    generation = int(time.time() // settings.QUIZ_POOL_REFRESH)
+    return get_versioned("question_pool", quiz, build_question_pool, generation)
+
+
+def sample_questions(quiz, key):
+    """
+    (ids, posições) das perguntas da sessão, ou None quando o quiz serve todas
+    (sem sample_size ou sample_size ≥ tamanho do banco).
+    """
+    if not quiz.sample_size or quiz.sample_size >= len(key):
+        return None
+    positions = get_question_pool(quiz).sample(quiz.sample_size)
+    return [key.ids[pos] for pos in positions], positions
@@ -0,0 +1,135 @@
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import QuizSession
+from .payments import get_gateway
+
+log = logging.getLogger(__name__)
+
+PENDING_TIMEOUT = timedelta(minutes=2)   # "pending" mais velho que isso é considerado órfão
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=getattr(settings, "MP_PREFERENCE_WORKERS", 4),
+                    thread_name_prefix="mp-pref",
+                )
+    return _pool
+
+
+def preference_payload(session, quiz) -> dict:
+    """Payload 100% serializável da preferência de pagamento da sessão."""
+    price = getattr(settings, "QUIZ_PRICE", 0)
+    if isinstance(price, Decimal):
+        price = float(price)
+
+    payload = {
+        "items": [{
+            "title": f"Resultado do Quiz: {quiz.title}",
+            "quantity": 1,
+            "currency_id": str(getattr(settings, "CURRENCY", "BRL")),
+            "unit_price": float(price),
+        }],
+        "back_urls": {
+            "success": f"{settings.APP_BASE_URL}/quiz/sucesso",
+            "failure": f"{settings.APP_BASE_URL}/quiz/erro",
+            "pending": f"{settings.APP_BASE_URL}/quiz/aguardando",
+        },
+        "auto_return": "approved",
+        "notification_url": f"{settings.API_BASE_URL}/api/webhooks/mercadopago",
+        "external_reference": str(session.pk),   # 👈 UUID como string
+    }
+    json.dumps(payload)   # TypeError aqui = bug de payload, não do MP
+    return payload
+
+
+def preference_data(session) -> dict:
+    """Campos da preferência já criada, no formato devolvido pela API."""
+    init_point = session.mp_init_point or None
+    return {
+        "preference_id": session.mp_pref_id,
+        "init_point": init_point,
+        "mode": None if not init_point else ("sandbox" if "sandbox" in init_point else "prod"),
+    }
+
+
+def create_preference(session, quiz, gateway):
+    """Cria a preferência no MP (chamada síncrona) e grava na sessão."""
+    log.info("[MP] mode: %s APP_BASE_URL: %s API_BASE_URL: %s", gateway.mode, settings.APP_BASE_URL, settings.API_BASE_URL)
+    try:
+        pref = gateway.create_preference(preference_payload(session, quiz)) or {}
+    except Exception:
+        QuizSession.objects.filter(pk=session.pk).update(mp_pref_status=QuizSession.PREF_FAILED)
+        raise
+
+    log.info("[MP PREF] id=%s init_point=%s sandbox_init_point=%s",
+             pref.get("id"), pref.get("init_point"), pref.get("sandbox_init_point"))
+    session.mp_pref_id = pref.get("id")
+    session.mp_init_point = pref.get("init_point") or pref.get("sandbox_init_point") or ""
+    session.mp_pref_status = QuizSession.PREF_READY
+    session.save(update_fields=["mp_pref_id", "mp_init_point", "mp_pref_status"])
+    return session
+
+
+async def acreate_preference(session, quiz, gateway):
+    """Versão async de create_preference (cliente HTTP async + ORM async)."""
+    try:
+        pref = await gateway.acreate_preference(preference_payload(session, quiz)) or {}
+    except Exception:
+        await QuizSession.objects.filter(pk=session.pk).aupdate(mp_pref_status=QuizSession.PREF_FAILED)
+        raise
+
+    session.mp_pref_id = pref.get("id")
+    session.mp_init_point = pref.get("init_point") or pref.get("sandbox_init_point") or ""
+    session.mp_pref_status = QuizSession.PREF_READY
+    await session.asave(update_fields=["mp_pref_id", "mp_init_point", "mp_pref_status"])
+    return session
+
+
+def request_preference(session) -> str:
+    """
+    Agenda a criação da preferência em background (no máximo uma por sessão).
+    A reserva é um UPDATE condicional, então chamadas repetidas de finish/start
+    não criam preferências duplicadas. Devolve o status atual.
+    """
+    if session.mp_pref_id:
+        return QuizSession.PREF_READY
+
+    stale = timezone.now() - PENDING_TIMEOUT
+    claimed = QuizSession.objects.filter(pk=session.pk, mp_pref_id__isnull=True).filter(
+        Q(mp_pref_status__in=["", QuizSession.PREF_FAILED])
+        | Q(mp_pref_status=QuizSession.PREF_PENDING, mp_pref_requested_at__lt=stale)
+    ).update(mp_pref_status=QuizSession.PREF_PENDING, mp_pref_requested_at=timezone.now())
+    if claimed:
+        _executor().submit(_create_in_background, session.pk)
+    return QuizSession.PREF_PENDING
+
+
+def _create_in_background(session_id):
+    try:
+        gateway = get_gateway()
+        s = QuizSession.objects.select_related("quiz").get(pk=session_id)
+        if gateway is None or s.quiz is None:
+            QuizSession.objects.filter(pk=session_id).update(mp_pref_status=QuizSession.PREF_FAILED)
+            return
+        create_preference(s, s.quiz, gateway)
+    except Exception:
+        log.exception("[MP] falha ao criar preferência da sessão %s", session_id)
+    finally:
+        close_old_connections()
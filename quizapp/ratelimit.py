@@ -0,0 +1,114 @@
+"""
+Limite de taxa do funil (start e answer) por IP e por sessão, no cache do Django.
+
+Balde de fichas recarregado por janela: cada (rota, escopo, identificador)
+tem um contador na janela corrente de `período` segundos e cada requisição
+gasta uma ficha com um incremento atômico — uma ida ao cache por checagem
+(no redis, SET NX + INCR no mesmo pipeline; nos outros backends, incr e,
+só na primeira da janela, add). Passou da capacidade → 429 com Retry-After
+até a recarga.
+
+QUIZ_RATE_LIMITS = {"rota": {"ip": "30/m", "session": "120/m"}}; taxa vazia
+ou rota ausente = sem limite (padrão: desligado, ver RATE_LIMIT_ENABLED). O
+cache é RATE_LIMIT_CACHE: locmem só serve para testes e um processo — com
+vários workers cada um teria o próprio contador. config_warnings() aponta
+configurações perigosas e é logada na inicialização (apps.py).
+"""
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from django.http import JsonResponse
+
+from . import metrics
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """'30/m' → (30, 60); '100/10s' → (100, 10)."""
+    num, _, per = rate.partition("/")
+    unit = per[-1:]
+    span = int(per[:-1] or 1) if unit in PERIODS else int(per)
+    return int(num), span * PERIODS.get(unit, 1)
+
+
+def config_warnings() -> list:
+    """Problemas da configuração de limites ativa (vazio se desligado ou ok)."""
+    if not any(rate for scopes in settings.QUIZ_RATE_LIMITS.values() for rate in scopes.values()):
+        return []
+    problems = []
+    backend = settings.CACHES.get(settings.RATE_LIMIT_CACHE, {}).get("BACKEND", "")
+    if not backend:
+        problems.append(f"RATE_LIMIT_CACHE={settings.RATE_LIMIT_CACHE!r} não existe em CACHES")
+    elif backend.endswith("LocMemCache"):
+        problems.append(
+            "limite de taxa em cache locmem: contador por processo, o limite efetivo "
+            "multiplica pelo número de workers (use redis/memcached em RATE_LIMIT_CACHE)"
+        )
+    if not settings.RATE_LIMIT_NUM_PROXIES:
+        problems.append(
+            "RATE_LIMIT_NUM_PROXIES=0: atrás de proxy todos os visitantes chegam com o mesmo "
+            "REMOTE_ADDR e dividem um único balde por IP"
+        )
+    return problems
+
+
+def client_ip(request) -> str:
+    """REMOTE_ADDR ou, atrás de RATE_LIMIT_NUM_PROXIES proxies, o endereço que o primeiro deles viu."""
+    proxies = settings.RATE_LIMIT_NUM_PROXIES
+    xff = request.META.get("HTTP_X_FORWARDED_FOR")
+    if proxies and xff:
+        hops = [h.strip() for h in xff.split(",")]
+        return hops[-min(proxies, len(hops))]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _incr_redis(cache, key, period):
+    client = cache._cache.get_client(key, write=True)
+    pipe = client.pipeline()
+    pipe.set(key, 0, ex=period + 1, nx=True)
+    pipe.incr(key)
+    return pipe.execute()[1]
+
+
+def _incr(cache, key, period):
+    if isinstance(cache, RedisCache):
+        return _incr_redis(cache, cache.make_and_validate_key(key), period)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # primeira da janela; se outro worker criou antes, o add perde e incrementamos
+        if cache.add(key, 1, timeout=period + 1):
+            return 1
+        return cache.incr(key)
+
+
+def take(route, scope, ident, now=None) -> int:
+    """Gasta uma ficha do balde; 0 se permitido, senão segundos até a recarga."""
+    rate = settings.QUIZ_RATE_LIMITS.get(route, {}).get(scope)
+    if not rate or not ident:
+        return 0
+    capacity, period = parse_rate(rate)
+    now = time.time() if now is None else now
+    window = int(now // period)
+    digest = hashlib.blake2b(str(ident).encode(), digest_size=8).hexdigest()
+    used = _incr(caches[settings.RATE_LIMIT_CACHE], f"quizapp:rl:{route}:{scope}:{digest}:{window}", period)
+    if used <= capacity:
+        return 0
+    metrics.inc("rate_limited_total", (("route", route), ("scope", scope)))
+    return max(math.ceil((window + 1) * period - now), 1)
+
+
+def rate_limited(request, route, session_id=None):
+    """JsonResponse 429 se algum balde da rota (IP, depois sessão) estiver vazio; senão None."""
+    for scope, ident in (("ip", client_ip(request)), ("session", session_id)):
+        wait = take(route, scope, ident)
+        if wait:
+            resp = JsonResponse({"error": "rate_limited", "retry_after": wait}, status=429)
+            resp["Retry-After"] = str(wait)
+            return resp
+    return None
@@ -0,0 +1,81 @@
+"""
+Regras de pontuação sobre bitmasks de letras (answer_key.letters_mask).
+
+QUIZ_SCORING:
+  exact   → 1 ponto se as letras marcadas == gabarito, senão 0
+  partial → crédito parcial: (acertos - marcações erradas) / nº de corretas, limitado a [0, 1]
+            (numa pergunta de resposta única equivale ao exact)
+
+score_matrix aplica a mesma regra a um lote sessões × perguntas com NumPy
+(opcional; sem NumPy cai no laço em Python). Este módulo não depende do
+Django para poder rodar em processos do pool do regrade.
+"""
+try:
+    import numpy as np
+except ImportError:   # NumPy é opcional
+    np = None
+
+EXACT = "exact"
+PARTIAL = "partial"
+RULES = (EXACT, PARTIAL)
+
+POPCOUNT = tuple(bin(i).count("1") for i in range(256))
+
+
+def question_credit(mask, key_mask, rule=EXACT) -> float:
+    if not key_mask or not mask:
+        return 0
+    if rule == EXACT:
+        return 1 if mask == key_mask else 0
+    hits = POPCOUNT[mask & key_mask]
+    wrong = POPCOUNT[mask & ~key_mask & 0xFF]   # inclui o bit de escolha inválida
+    return min(max((hits - wrong) / POPCOUNT[key_mask], 0.0), 1.0)
+
+
+def result_payload(score, total) -> dict:
+    """Formato do QuizSession.result."""
+    percent = 0 if total == 0 else round(score / total * 100)
+    msg = "Excelente!" if percent >= 85 else ("Muito bom!" if percent >= 60 else "Continue praticando!")
+    if isinstance(score, float):
+        score = int(score) if score.is_integer() else round(score, 2)
+    return {"score": score, "total": total, "percent": percent, "message": msg}
+
+
+def score_matrix(key_masks, masks, served=None, rule=EXACT):
+    """
+    key_masks: gabarito (Q,) · masks: respostas (S, Q) · served: perguntas servidas (S, Q) ou None.
+    Devolve (score, total) por sessão, como listas.
+    """
+    if np is None:
+        return _score_rows(key_masks, masks, served, rule)
+
+    key = np.asarray(key_masks, dtype=np.uint8)
+    m = np.asarray(masks, dtype=np.uint8).reshape(-1, len(key))
+    counted = np.broadcast_to(key != 0, m.shape)
+    if served is not None:
+        counted = counted & np.asarray(served, dtype=bool).reshape(m.shape)
+    if rule == EXACT:
+        credit = (m == key).astype(np.float64)
+    else:
+        pop = np.array(POPCOUNT, dtype=np.int16)
+        hits = pop[m & key]
+        wrong = pop[m & ~key]
+        n_correct = np.maximum(pop[key], 1)
+        credit = np.clip((hits - wrong) / n_correct, 0.0, 1.0)
+    credit = np.where(counted & (m != 0), credit, 0.0)
+    return credit.sum(axis=1).tolist(), counted.sum(axis=1).tolist()
+
+
+def _score_rows(key_masks, masks, served, rule):
+    scores, totals = [], []
+    for i, row in enumerate(masks):
+        row_served = served[i] if served is not None else None
+        score = total = 0
+        for pos, key_mask in enumerate(key_masks):
+            if not key_mask or (row_served is not None and not row_served[pos]):
+                continue
+            total += 1
+            score += question_credit(row[pos], key_mask, rule)
+        scores.append(float(score))
+        totals.append(total)
+    return scores, totals
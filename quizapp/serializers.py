@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Question, Choice, Quiz
+from .covers import variant_urls
 
 class ChoiceOutSerializer(serializers.ModelSerializer):
     class Meta:
@@ -17,7 +18,9 @@ class QuestionOutSerializer(serializers.ModelSerializer):
         # Ordena e mapeia para a,b,c,d
         letters = ["a", "b", "c", "d"]
         opts = {}
-        for i, ch in enumerate(obj.choices.all().order_by("order", "id")):
+        # ordena em Python para aproveitar o prefetch_related("choices")
+        choices = sorted(obj.choices.all(), key=lambda ch: (ch.order, ch.id))
+        for i, ch in enumerate(choices):
             if i >= len(letters):
                 break
             # Mostre o texto que você quer (label ou value). Aqui uso label como texto visível:
@@ -31,17 +34,44 @@ class AnswerInSerializer(serializers.Serializer):
 class SaveAnswersSerializer(serializers.Serializer):
     answers = AnswerInSerializer(many=True)
 
+class CoverVariantsField(serializers.ReadOnlyField):
+    """Nomes das variantes da capa → mapa de URLs com srcset (covers.variant_urls)."""
+    def to_representation(self, value):
+        return variant_urls(value, self.context.get("request"))
+
 class QuizSerializer(serializers.ModelSerializer):
+    cover_variants = CoverVariantsField()
+
     class Meta:
         model = Quiz
         fields = '__all__'
 
+
+class QuizCatalogSerializer(serializers.ModelSerializer):
+    """Catálogo com projeção: `fields` (lista) limita as colunas serializadas."""
+    cover_variants = CoverVariantsField()
+
+    class Meta:
+        model = Quiz
+        fields = ("id", "slug", "title", "description", "is_active", "cover", "cover_variants", "version")
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
 class QuizCreateSerializer(serializers.Serializer):
     slug = serializers.SlugField(max_length=64)
     title = serializers.CharField(max_length=200)
     description = serializers.CharField(allow_blank=True, required=False)
     is_active = serializers.BooleanField(default=True)
     cover = serializers.ImageField(required=False, allow_null=True)
+    sample_size = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+
+class QuizUpdateSerializer(serializers.Serializer):
+    """Campos do PATCH que precisam de validação (os demais são atribuídos direto)."""
+    sample_size = serializers.IntegerField(min_value=1, required=False, allow_null=True)
 
 class ChoiceCreateSerializer(serializers.Serializer):
     label = serializers.CharField(max_length=200)
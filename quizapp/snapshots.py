@@ -0,0 +1,22 @@
+from .cache import get_versioned, aget_versioned
+
+
+def build_quiz_snapshot(quiz):
+    """Monta o payload público do quiz (dados + perguntas/opções) de uma vez."""
+    from .serializers import QuizSerializer, QuestionOutSerializer
+
+    qs = quiz.questions.prefetch_related("choices").all()
+    return {
+        "version": quiz.version,
+        "quiz": QuizSerializer(quiz).data,
+        "questions": QuestionOutSerializer(qs, many=True).data,
+    }
+
+
+def get_quiz_snapshot(quiz):
+    """Snapshot compilado do quiz na versão atual (LRU local + cache compartilhado)."""
+    return get_versioned("snapshot", quiz, build_quiz_snapshot)
+
+
+async def aget_quiz_snapshot(quiz):
+    return await aget_versioned("snapshot", quiz, build_quiz_snapshot)
@@ -0,0 +1,90 @@
+"""
+Modo sem estado (QUIZ_SESSION_MODE="stateless"): o start não grava nada e
+devolve um token assinado (sessão, quiz, início); as respostas ficam
+no cliente e vão junto no finish, que insere sessão + respostas + resultado
+numa única transação. Sessões abandonadas não custam nenhuma escrita.
+"""
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .analytics import count_graded
+from .models import Answer, QuizSession
+from .packed import encode, ensure_layout, packed_mode
+
+SESSION_SALT = "quizapp.session"
+
+
+def stateless_mode() -> bool:
+    return getattr(settings, "QUIZ_SESSION_MODE", "db") == "stateless"
+
+
+def session_token(session_id, quiz, question_ids=None) -> str:
+    """question_ids: amostra servida (banco de questões), gravada na sessão no finish."""
+    # sem a versão do quiz: uma edição no meio do quiz não invalida a sessão, o finish
+    # corrige pelo gabarito atual (por id) e descarta perguntas que não existem mais
+    claims = {"sid": str(session_id), "q": quiz.pk, "t": int(timezone.now().timestamp())}
+    if question_ids is not None:
+        claims["ids"] = list(question_ids)
+    return signing.dumps(claims, salt=SESSION_SALT, compress=True)
+
+
+def read_session_token(token, session_id):
+    """Claims do token se válido, dentro do prazo e da mesma sessão; senão None."""
+    if not token:
+        return None
+    try:
+        data = signing.loads(token, salt=SESSION_SALT, max_age=settings.QUIZ_SESSION_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if not isinstance(data, dict) or data.get("sid") != str(session_id):
+        return None
+    return data
+
+
+def session_token_from_request(request, data=None):
+    """Token no header X-Session-Token ou no campo session_token do corpo."""
+    token = request.headers.get("X-Session-Token")
+    if not token and isinstance(data, dict):
+        token = data.get("session_token")
+    return token
+
+
+def selected_by_id(key, answers, question_ids=None) -> dict:
+    """
+    {question_id: choices} das respostas enviadas (questionId = slug; repetidas: vale a última),
+    limitadas às perguntas servidas quando a sessão recebeu uma amostra do banco.
+    """
+    served = None if question_ids is None else set(question_ids)
+    selected = {}
+    for a in answers:
+        pos = key.pos_by_slug.get(a["questionId"])
+        if pos is not None and (served is None or key.ids[pos] in served):
+            selected[key.ids[pos]] = a["choices"]
+    return selected
+
+
+def persist_finished_session(session_id, quiz, key, selected, pairs, result, question_ids=None):
+    """
+    Insere a sessão já corrigida, as respostas (linhas ou compactas) e os
+    contadores de analytics numa transação. Finish concorrente da mesma sessão:
+    o segundo INSERT falha na PK e devolvemos a sessão gravada pelo primeiro.
+    """
+    try:
+        with transaction.atomic():
+            s = QuizSession(id=session_id, quiz=quiz, result=result, question_ids=question_ids)
+            if packed_mode():
+                ensure_layout(quiz, key)
+                masks = [0] * len(key)
+                for qid, mask in pairs:
+                    masks[key.pos_by_id[qid]] = mask
+                s.packed_answers = encode(masks)
+                s.packed_version = key.version
+            s.save(force_insert=True)
+            if not packed_mode():
+                Answer.objects.bulk_create([Answer(session=s, question_id=qid, selected=sel) for qid, sel in selected.items()])
+            count_graded(quiz.pk, result, key, pairs)
+    except IntegrityError:
+        return QuizSession.objects.get(pk=session_id), False
+    return s, True
@@ -1,3 +1,1306 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib.util
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F, Sum
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+
+from . import async_views, covers
+from .export import export_stream
+from .importer import import_questions
+from .management.commands.archive_sessions import Command as ArchiveCommand
+from .management.commands.bench_endpoints import DEFAULT_BUDGETS
+from .answer_key import get_answer_key, letters_mask
+from .cache import bump_quiz_version, local_cache
+from .covers import process_cover
+from .models import (
+    Answer, Choice, ChoiceStats, PaymentNotification, Question, QuestionStats, Quiz, QuizLayout, QuizSession,
+    ScoreBucket,
+)
+from .outbox import LEASE, claim_batch, enqueue_payment, process_notification
+from .packed import save_packed_answers, unpack
+from .payments import CircuitBreaker, GatewayError, GatewayRejected, GatewayUnavailable, StubGateway, set_gateway
+from .pools import get_question_pool, sample_questions
+from .ratelimit import config_warnings
+from .scoring import EXACT, PARTIAL, RULES, np, question_credit, score_matrix
+from .stateless import persist_finished_session, session_token
+from .tokens import read_result_token, result_token
+from .views import CatalogPagination, calc_result, grade_masks, grade_session
+
+
+def make_quiz(slug="iq", n_questions=5, n_choices=4, **fields):
+    """Quiz com n perguntas; a alternativa correta da pergunta i é a de índice i % n_choices."""
+    quiz = Quiz.objects.create(slug=slug, title=slug.upper(), **fields)
+    for i in range(n_questions):
+        q = Question.objects.create(quiz=quiz, slug=f"q{i}", title=f"Pergunta {i}", order=i)
+        Choice.objects.bulk_create([
+            Choice(question=q, label=f"Opção {j}", value=f"opt_{j}", is_correct=(j == i % n_choices), order=j)
+            for j in range(n_choices)
+        ])
+    return quiz
+
+
+class QuizTestCase(TestCase):
+    """Limpa os caches de processo: os pks se repetem entre testes e as chaves são (quiz, versão)."""
+    def setUp(self):
+        local_cache.clear()
+        caches["default"].clear()
+
+
+RATE_LIMITS = {"start": {"ip": "3/m"}, "answer": {"ip": "100/m", "session": "2/m"}}
+
+
+@override_settings(QUIZ_RATE_LIMITS=RATE_LIMITS, RATE_LIMIT_CACHE="default")
+class RateLimitTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz()
+
+    def start(self, **extra):
+        return self.client.post("/api/quiz/start", {"slug": "iq"}, content_type="application/json", **extra)
+
+    def test_start_limited_per_ip_with_retry_after(self):
+        for _ in range(3):
+            self.assertEqual(self.start().status_code, 200)
+        resp = self.start()
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp.json()["error"], "rate_limited")
+        self.assertGreaterEqual(int(resp["Retry-After"]), 1)
+        self.assertLessEqual(int(resp["Retry-After"]), 60)
+        # outro IP tem o próprio balde
+        self.assertEqual(self.start(REMOTE_ADDR="10.0.0.9").status_code, 200)
+
+    def test_answer_limited_per_session_without_queries(self):
+        sid = self.start().json()["session_id"]
+        other = self.start().json()["session_id"]
+        body = {"answers": [{"questionId": "q0", "choices": ["a"]}]}
+        url = f"/api/quiz/{sid}/answer"
+        for _ in range(2):
+            self.assertEqual(self.client.post(url, body, content_type="application/json").status_code, 200)
+        with self.assertNumQueries(0):
+            resp = self.client.post(url, body, content_type="application/json")
+        self.assertEqual(resp.status_code, 429)
+        self.assertIn("Retry-After", resp)
+        resp = self.client.post(f"/api/quiz/{other}/answer", body, content_type="application/json")
+        self.assertEqual(resp.status_code, 200)
+
+    @override_settings(QUIZ_RATE_LIMITS={})
+    def test_disabled(self):
+        for _ in range(5):
+            self.assertEqual(self.start().status_code, 200)
+
+    @override_settings(RATE_LIMIT_NUM_PROXIES=1)
+    def test_client_ip_behind_proxy(self):
+        # o IP visto pelo proxy decide o balde, não o REMOTE_ADDR compartilhado nem o hop forjado
+        for _ in range(3):
+            self.assertEqual(self.start(HTTP_X_FORWARDED_FOR="6.6.6.6, 1.1.1.1").status_code, 200)
+        self.assertEqual(self.start(HTTP_X_FORWARDED_FOR="7.7.7.7, 1.1.1.1").status_code, 429)
+        self.assertEqual(self.start(HTTP_X_FORWARDED_FOR="6.6.6.6, 1.1.1.2").status_code, 200)
+
+    def test_config_warnings(self):
+        problems = config_warnings()
+        self.assertTrue(any("locmem" in p for p in problems))
+        self.assertTrue(any("RATE_LIMIT_NUM_PROXIES" in p for p in problems))
+        with override_settings(QUIZ_RATE_LIMITS={}):
+            self.assertEqual(config_warnings(), [])
+
+
+class ArchiveSessionsTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz()
+        self.out = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.out, ignore_errors=True)
+        questions = list(self.quiz.questions.all())
+        for i in range(7):
+            s = QuizSession.objects.create(quiz=self.quiz, result={"score": i, "total": 5, "percent": 0})
+            Answer.objects.create(session=s, question=questions[i % 5], selected=["opt_0"])
+        QuizSession.objects.update(created_at=timezone.now() - timedelta(days=365))
+
+    def archive(self):
+        call_command("archive_sessions", "--output-dir", str(self.out), "--batch-size", "2", "--part-size", "3",
+                     "--skip-abandoned", stdout=StringIO())
+
+    def archived_ids(self):
+        ids = []
+        for part in sorted(self.out.glob("*.jsonl.gz")):
+            with gzip.open(part, "rt", encoding="utf-8") as fp:   # cada parte é um gzip completo
+                ids += [json.loads(line)["id"] for line in fp]
+        return ids
+
+    def test_archives_in_parts_and_deletes(self):
+        expected = sorted(str(pk) for pk in QuizSession.objects.values_list("pk", flat=True))
+        self.archive()
+        self.assertEqual(len(list(self.out.glob("*.jsonl.gz"))), 3)
+        self.assertEqual(sorted(self.archived_ids()), expected)
+        self.assertFalse(QuizSession.objects.exists())
+        self.assertFalse(Answer.objects.exists())
+
+    def test_resume_after_crash_before_delete(self):
+        expected = sorted(str(pk) for pk in QuizSession.objects.values_list("pk", flat=True))
+        original = ArchiveCommand.delete_batches
+        calls = []
+
+        def crash_once(cmd, ids):
+            calls.append(1)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return original(cmd, ids)
+
+        with mock.patch.object(ArchiveCommand, "delete_batches", crash_once), self.assertRaises(KeyboardInterrupt):
+            self.archive()
+        self.archive()
+        self.assertEqual(sorted(self.archived_ids()), expected)
+        self.assertFalse(QuizSession.objects.exists())
+
+    def test_resume_after_crash_mid_part(self):
+        expected = sorted(str(pk) for pk in QuizSession.objects.values_list("pk", flat=True))
+        original = ArchiveCommand.write_batch
+        calls = []
+
+        def crash(cmd, batch, fp):
+            calls.append(1)
+            if len(calls) == 4:   # 2º lote da 2ª parte
+                raise KeyboardInterrupt
+            return original(cmd, batch, fp)
+
+        with mock.patch.object(ArchiveCommand, "write_batch", crash), self.assertRaises(KeyboardInterrupt):
+            self.archive()
+        # a parte interrompida não remove nada além da primeira
+        self.assertEqual(QuizSession.objects.count(), 4)
+        self.archive()
+        self.assertEqual(sorted(self.archived_ids()), expected)   # sem duplicatas
+        self.assertEqual(list(self.out.glob("*.partial")), [])
+        self.assertFalse(QuizSession.objects.exists())
+
+
+# rotas do funil async para os testes (em produção só montadas com QUIZ_ASYNC_VIEWS=1)
+urlpatterns = [
+    path("api/quiz/start", async_views.start_quiz),
+    path("api/quiz/<str:session_id>/answer", async_views.save_answers),
+    path("api/quiz/<str:session_id>/finish", async_views.finish_quiz),
+    path("api/result/<str:session_id>", async_views.get_result),
+]
+
+
+def load_settings(**env):
+    """Executa quiz/settings.py de novo com outras variáveis de ambiente."""
+    spec = importlib.util.spec_from_file_location("quiz_settings_test", Path(settings.BASE_DIR) / "quiz" / "settings.py")
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(os.environ, env):
+        spec.loader.exec_module(module)
+    return module
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncFunnelTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz()
+
+    async def test_start_answer_finish(self):
+        client = AsyncClient()
+        resp = await client.post("/api/quiz/start", {"slug": "iq"}, content_type="application/json")
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual([q["slug"] for q in data["questions"]], [f"q{i}" for i in range(5)])
+
+        # 3 certas (q0..q2), 1 errada (q3), q4 sem resposta
+        answers = [{"questionId": f"q{i}", "choices": ["abcd"[i % 4]]} for i in range(3)]
+        answers.append({"questionId": "q3", "choices": ["a"]})
+        resp = await client.post(f"/api/quiz/{data['session_id']}/answer", {"answers": answers},
+                                 content_type="application/json")
+        self.assertEqual(resp.json(), {"ok": True})
+
+        resp = await client.post(f"/api/quiz/{data['session_id']}/finish?slug=iq")
+        self.assertEqual(resp.status_code, 200)
+        result = resp.json()["result"]
+        self.assertEqual((result["score"], result["total"], result["percent"]), (3, 5, 60))
+        session = await QuizSession.objects.aget(pk=data["session_id"])
+        self.assertEqual(session.result["score"], 3)
+
+    @override_settings(DEBUG=True)   # o Django só loga as adaptações sync/async com DEBUG
+    def test_asgi_middleware_chain_is_fully_async(self):
+        sync_settings = load_settings(QUIZ_ASYNC_VIEWS="")
+        with override_settings(MIDDLEWARE=sync_settings.MIDDLEWARE), \
+                self.assertLogs("django.request", level="DEBUG") as logs:
+            ASGIHandler()
+        self.assertTrue(any("whitenoise" in line for line in logs.output))
+
+        async_settings = load_settings(QUIZ_ASYNC_VIEWS="1")
+        self.assertNotIn("whitenoise.middleware.WhiteNoiseMiddleware", async_settings.MIDDLEWARE)
+        with override_settings(MIDDLEWARE=async_settings.MIDDLEWARE), \
+                self.assertNoLogs("django.request", level="DEBUG"):
+            ASGIHandler()   # "Synchronous handler adapted for middleware ..." = cadeia em thread
+
+
+class RegradeTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz(n_questions=4)
+        self.session = QuizSession.objects.create(quiz=self.quiz, result={"score": 0, "total": 4, "percent": 0})
+        for i, q in enumerate(self.quiz.questions.all()):
+            Answer.objects.create(session=self.session, question=q, selected=["abcd"[i % 4]])   # todas certas
+
+    def regrade(self, *args):
+        out = StringIO()
+        call_command("regrade", "--workers", "1", *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_regrade_updates_changed_results_and_reports_backend(self):
+        out = self.regrade()
+        self.assertIn(f"numpy {np.__version__}", out)
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.result["score"], self.session.result["percent"]), (4, 100))
+
+    def test_dry_run_writes_nothing(self):
+        self.regrade("--dry-run")
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.result["score"], 0)
+
+    def test_without_numpy_requires_allow_python(self):
+        with mock.patch("quizapp.management.commands.regrade.np", None):
+            with self.assertRaises(CommandError):
+                self.regrade()
+            out = self.regrade("--allow-python")
+        self.assertIn("python puro", out)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.result["score"], 4)
+
+    def test_numpy_and_python_scoring_agree(self):
+        rng = random.Random(7)
+        key = [rng.choice([0, 1, 2, 4, 8, 3, 5, 12]) for _ in range(12)]
+        masks = [[rng.randrange(32) for _ in key] for _ in range(40)]
+        served = [[rng.random() < 0.8 for _ in key] for _ in masks]
+        for rule in RULES:
+            for srv in (None, served):
+                fast = score_matrix(key, masks, srv, rule)
+                with mock.patch("quizapp.scoring.np", None):
+                    slow = score_matrix(key, masks, srv, rule)
+                self.assertEqual(slow[1], fast[1])
+                for a, b in zip(slow[0], fast[0]):
+                    self.assertAlmostEqual(a, b)
+
+
+class QuizEditTests(QuizTestCase):
+    """PATCH /api/quiz/<slug>/edit e admin do quiz."""
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz()
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(self.admin)
+
+    def concurrent_bump(self):
+        """
+        Quiz.save que sofre um bump de outro processo entre a leitura e a gravação:
+        a edição não pode regravar a `version` lida antes (reaproveitaria o número).
+        """
+        original = Quiz.save
+
+        def save(quiz, *args, **kwargs):
+            Quiz.objects.filter(pk=quiz.pk).update(version=F("version") + 1)
+            return original(quiz, *args, **kwargs)
+        return mock.patch.object(Quiz, "save", save)
+
+    def test_update_quiz_keeps_concurrent_bump(self):
+        start = self.quiz.version
+        with self.concurrent_bump():
+            resp = self.client.patch("/api/quiz/iq/edit", {"title": "Novo"}, content_type="application/json")
+        self.assertEqual(resp.status_code, 200)
+        self.quiz.refresh_from_db()
+        self.assertEqual(self.quiz.title, "Novo")
+        self.assertEqual(self.quiz.version, start + 2)
+
+    def test_admin_change_keeps_concurrent_bump(self):
+        start = self.quiz.version
+        data = {"slug": "iq", "title": "Pelo admin", "description": "", "is_active": "on", "sample_size": "",
+                "_save": "Salvar"}
+        with self.concurrent_bump():
+            resp = self.client.post(f"/admin/quizapp/quiz/{self.quiz.pk}/change/", data)
+        self.assertEqual(resp.status_code, 302)
+        self.quiz.refresh_from_db()
+        self.assertEqual(self.quiz.title, "Pelo admin")
+        self.assertEqual(self.quiz.version, start + 2)
+
+    def test_update_quiz_validates_sample_size(self):
+        for bad in ("abc", "-3", "0", 2.5):
+            resp = self.client.patch("/api/quiz/iq/edit", {"sample_size": bad}, content_type="application/json")
+            self.assertEqual(resp.status_code, 400, bad)
+            self.assertIn("sample_size", resp.json())
+        resp = self.client.patch("/api/quiz/iq/edit", {"sample_size": "3"}, content_type="application/json")
+        self.assertEqual(resp.status_code, 200)
+        self.quiz.refresh_from_db()
+        self.assertEqual(self.quiz.sample_size, 3)
+        resp = self.client.patch("/api/quiz/iq/edit", {"sample_size": ""}, content_type="application/json")
+        self.quiz.refresh_from_db()
+        self.assertIsNone(self.quiz.sample_size)
+
+
+class QuestionPoolTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz(n_questions=10, sample_size=4)
+        self.questions = list(self.quiz.questions.all())
+
+    def bands(self):
+        return sorted({band for (_, band), _ in get_question_pool(self.quiz).strata})
+
+    def test_sample_is_stratified_subset(self):
+        QuestionStats.objects.bulk_create([
+            QuestionStats(question=q, quiz=self.quiz, attempts=100, correct=90 if i < 5 else 10)
+            for i, q in enumerate(self.questions)
+        ])
+        key = get_answer_key(self.quiz)
+        for _ in range(20):
+            ids, positions = sample_questions(self.quiz, key)
+            self.assertEqual(len(set(ids)), 4)
+            self.assertEqual([key.ids[p] for p in positions], ids)
+            easy = sum(1 for p in positions if p < 5)
+            self.assertEqual(easy, 2)   # metade fácil, metade difícil, como o banco
+
+    def test_no_sample_when_size_covers_bank(self):
+        self.quiz.sample_size = 10
+        self.assertIsNone(sample_questions(self.quiz, get_answer_key(self.quiz)))
+
+    def test_strata_refresh_with_live_stats(self):
+        now = time.time()
+        with mock.patch("quizapp.pools.time.time", return_value=now):
+            self.assertEqual(self.bands(), ["?"])   # sem estatísticas ainda
+        QuestionStats.objects.bulk_create([
+            QuestionStats(question=q, quiz=self.quiz, attempts=100, correct=90 if i < 5 else 10)
+            for i, q in enumerate(self.questions)
+        ])
+        with mock.patch("quizapp.pools.time.time", return_value=now):
+            self.assertEqual(self.bands(), ["?"])   # mesma geração: vem do cache
+        with mock.patch("quizapp.pools.time.time", return_value=now + settings.QUIZ_POOL_REFRESH):
+            self.assertEqual(self.bands(), ["easy", "hard"])
+
+    def test_start_serves_sample_and_grades_only_served(self):
+        data = self.client.post("/api/quiz/start", {"slug": "iq"}, content_type="application/json").json()
+        served = [q["slug"] for q in data["questions"]]
+        self.assertEqual(len(served), 4)
+        answers = [{"questionId": slug, "choices": ["abcd"[int(slug[1:]) % 4]]} for slug in served]
+        self.client.post(f"/api/quiz/{data['session_id']}/answer", {"answers": answers}, content_type="application/json")
+        result = self.client.post(f"/api/quiz/{data['session_id']}/finish?slug=iq").json()["result"]
+        self.assertEqual((result["score"], result["total"], result["percent"]), (4, 4, 100))
+
+
+class ExportTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz(n_questions=4)
+        self.rows = QuizSession.objects.create(quiz=self.quiz, result={"score": 1, "total": 4, "percent": 25})
+        Answer.objects.create(session=self.rows, question=self.quiz.questions.get(slug="q1"), selected=["b", "c"])
+        with override_settings(QUIZ_ANSWER_STORAGE="packed"):
+            self.packed = QuizSession.objects.create(quiz=self.quiz)
+            save_packed_answers(self.packed.pk, [{"questionId": "q0", "choices": ["a"]},
+                                                 {"questionId": "q3", "choices": ["d"]}])
+
+    def read(self, fmt, quiz=None, compress=False, **bounds):
+        data = b"".join(export_stream(fmt, quiz, compress=compress, **bounds))
+        return (gzip.decompress(data) if compress else data).decode("utf-8")
+
+    def test_csv_one_column_per_question(self):
+        rows = list(csv.DictReader(StringIO(self.read("csv", self.quiz))))
+        self.assertEqual(len(rows), 2)
+        by_id = {r["session_id"]: r for r in rows}
+        self.assertEqual(by_id[str(self.rows.pk)]["q1"], "b;c")
+        self.assertEqual(by_id[str(self.rows.pk)]["score"], "1")
+        self.assertEqual((by_id[str(self.packed.pk)]["q0"], by_id[str(self.packed.pk)]["q3"]), ("a", "d"))
+
+    def test_ndjson_and_gzip(self):
+        lines = [json.loads(line) for line in self.read("ndjson", compress=True).splitlines()]
+        by_id = {r["session_id"]: r for r in lines}
+        self.assertEqual(by_id[str(self.packed.pk)]["answers"], {"q0": ["a"], "q3": ["d"]})
+        self.assertEqual(by_id[str(self.rows.pk)]["percent"], 25)
+
+    def test_date_bounds(self):
+        self.assertEqual(self.read("ndjson", since="2000-01-01"), self.read("ndjson"))
+        self.assertEqual(self.read("ndjson", until="2000-01-01"), "")
+        with self.assertRaises(ValueError):
+            self.read("ndjson", since="ontem")
+
+    def test_deleted_question_in_packed_layout(self):
+        self.quiz.questions.filter(slug__in=["q0", "q2"]).delete()
+        text = self.read("csv")   # sem quiz: coluna "answers" ordenada por slug
+        self.assertIn("q3=d", text)
+        self.assertNotIn("None", text)
+        self.assertEqual(len(text.strip().splitlines()), 3)
+
+    def test_endpoint(self):
+        self.assertEqual(self.client.get("/api/export/sessions").status_code, 403)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+        self.assertEqual(self.client.get("/api/export/sessions", {"type": "xml"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/export/sessions", {"since": "ontem"}).status_code, 400)
+        resp = self.client.get("/api/export/sessions", {"type": "ndjson", "quiz": "iq", "gzip": "1"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(gzip.decompress(b"".join(resp.streaming_content)).splitlines()), 2)
+
+
+class AnalyticsTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz(n_questions=6, sample_size=3)
+
+    def play(self, answer_all=True):
+        data = self.client.post("/api/quiz/start", {"slug": "iq"}, content_type="application/json").json()
+        slugs = [f"q{i}" for i in range(6)] if answer_all else [q["slug"] for q in data["questions"]]
+        answers = [{"questionId": slug, "choices": ["a"]} for slug in slugs]
+        self.client.post(f"/api/quiz/{data['session_id']}/answer", {"answers": answers}, content_type="application/json")
+        self.client.post(f"/api/quiz/{data['session_id']}/finish?slug=iq")
+        return data
+
+    def stats(self):
+        return (
+            sorted(QuestionStats.objects.filter(quiz=self.quiz).values_list("question_id", "attempts", "correct")),
+            sorted(ChoiceStats.objects.filter(quiz=self.quiz).values_list("question_id", "letter", "count")),
+        )
+
+    def test_live_counters(self):
+        data = self.play(answer_all=False)
+        served = {q.pk for q in self.quiz.questions.filter(slug__in=[q["slug"] for q in data["questions"]])}
+        attempts, _ = self.stats()
+        self.assertEqual({qid for qid, n, _ in attempts if n}, served)
+        self.assertTrue(all(n == 1 for _, n, _ in attempts))
+        self.assertEqual(ScoreBucket.objects.filter(quiz=self.quiz).aggregate(n=Sum("count"))["n"], 1)
+
+    def test_rebuild_matches_live_on_sampled_quiz(self):
+        # respostas também a perguntas não servidas: nem o live nem o rebuild podem contá-las
+        for _ in range(5):
+            self.play(answer_all=True)
+        live = self.stats()
+        call_command("rebuild_analytics", "--quiz", "iq", stdout=StringIO())
+        self.assertEqual(self.stats(), live)
+        self.assertEqual(sum(n for _, n, _ in live[0]), 5 * 3)
+
+    def test_rebuild_refuses_after_archive(self):
+        for _ in range(3):
+            self.play()
+        old = QuizSession.objects.order_by("created_at")[:2]
+        QuizSession.objects.filter(pk__in=[s.pk for s in old]).update(created_at=timezone.now() - timedelta(days=400))
+        out_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, out_dir)
+        call_command("archive_sessions", "--output-dir", out_dir, stdout=StringIO())
+        self.assertEqual(QuizSession.objects.count(), 1)
+
+        live = self.stats()
+        with self.assertRaisesMessage(CommandError, "iq: 2 sessões"):
+            call_command("rebuild_analytics", stdout=StringIO())
+        self.assertEqual(self.stats(), live)
+
+        err = StringIO()
+        call_command("rebuild_analytics", "--allow-history-loss", stdout=StringIO(), stderr=err)
+        self.assertIn("iq: 2 sessões", err.getvalue())
+        self.assertEqual(sum(n for _, n, _ in self.stats()[0]), 3)    # só a sessão que ficou
+
+    def test_backfill_histogram_refuses_after_archive(self):
+        for _ in range(2):
+            self.play()
+        QuizSession.objects.filter(pk=QuizSession.objects.first().pk).delete()    # como o archive_sessions
+        with self.assertRaisesMessage(CommandError, "iq: 1 sessões"):
+            call_command("backfill_score_histogram", stdout=StringIO())
+        self.assertEqual(ScoreBucket.objects.aggregate(n=Sum("count"))["n"], 2)
+        call_command("backfill_score_histogram", "--allow-history-loss", stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(ScoreBucket.objects.aggregate(n=Sum("count"))["n"], 1)
+
+
+class ResultTokenTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz()
+        result = {"score": 3, "total": 5, "percent": 60, "message": "Muito bom!"}
+        self.session = QuizSession.objects.create(quiz=self.quiz, result=result, paid=True)
+
+    def get(self, session_id, token=None):
+        headers = {"HTTP_X_RESULT_TOKEN": token} if token else {}
+        return self.client.get(f"/api/result/{session_id}", **headers)
+
+    def test_paid_token_answers_without_queries(self):
+        token = result_token(self.session)
+        with self.assertNumQueries(0):
+            resp = self.get(self.session.pk, token)
+        self.assertEqual(resp.json()["result"]["score"], 3)
+        with self.assertNumQueries(0):
+            resp = self.client.get(f"/api/result/{self.session.pk}", {"token": token})
+        self.assertEqual(resp.status_code, 200)
+
+    def test_fallback_reissues_paid_token(self):
+        QuizSession.objects.filter(pk=self.session.pk).update(paid=False)
+        self.session.paid = False
+        unpaid = result_token(self.session)   # emitido no finish, antes do pagamento
+        self.assertEqual(self.get(self.session.pk, unpaid).status_code, 402)
+
+        QuizSession.objects.filter(pk=self.session.pk).update(paid=True)
+        resp = self.get(self.session.pk, unpaid)   # token sem pagamento → banco
+        self.assertEqual(resp.status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(self.session.pk, resp.json()["result_token"]).status_code, 200)
+
+    def test_rejects_token_of_other_session_or_tampered(self):
+        other = QuizSession.objects.create(quiz=self.quiz, result={"score": 0, "total": 5, "percent": 0})
+        token = result_token(self.session)
+        self.assertIsNone(read_result_token(token, other.pk))
+        self.assertIsNone(read_result_token(token[:-2] + "xx", self.session.pk))
+        self.assertEqual(self.get(other.pk, token).status_code, 402)   # cai no banco: não paga
+
+    def test_expired_token(self):
+        token = result_token(self.session)
+        with override_settings(RESULT_TOKEN_MAX_AGE=-1):
+            self.assertIsNone(read_result_token(token, self.session.pk))
+
+    def test_session_token_claims(self):
+        token = session_token(uuid.uuid4(), self.quiz, [1, 2])
+        claims = signing.loads(token, salt="quizapp.session")
+        self.assertEqual(set(claims), {"sid", "q", "t", "ids"})
+
+
+@override_settings(QUIZ_SESSION_MODE="stateless")
+class StatelessFinishTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz(n_questions=4)
+        self.ids = {q.slug: q.id for q in self.quiz.questions.all()}
+        # q0 e q1 certas, q2 errada, q3 sem resposta
+        self.answers = [{"questionId": "q0", "choices": ["a"]}, {"questionId": "q1", "choices": ["b"]},
+                        {"questionId": "q2", "choices": ["a"]}]
+
+    def start(self):
+        resp = self.client.post("/api/quiz/start", {"slug": "iq"}, content_type="application/json").json()
+        return resp["session_id"], resp["session_token"]
+
+    def finish(self, sid, token, answers=None, **extra):
+        body = {"answers": self.answers if answers is None else answers}
+        if token:
+            body["session_token"] = token
+        return self.client.post(f"/api/quiz/{sid}/finish?slug=iq", body, content_type="application/json", **extra)
+
+    def assert_counters(self, sessions=1):
+        self.assertEqual(QuestionStats.objects.aggregate(n=Sum("attempts"))["n"], 3 * sessions)
+        self.assertEqual(QuestionStats.objects.aggregate(n=Sum("correct"))["n"], 2 * sessions)
+        self.assertEqual(ScoreBucket.objects.get(quiz=self.quiz, percent=50).count, sessions)
+
+    def test_start_writes_nothing(self):
+        self.start()
+        self.assertFalse(QuizSession.objects.exists())
+
+    def test_finish_inserts_session_rows_and_counters(self):
+        sid, token = self.start()
+        resp = self.finish(sid, token)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual((resp.json()["result"]["score"], resp.json()["result"]["total"]), (2, 4))
+        s = QuizSession.objects.get(pk=sid)
+        self.assertEqual(s.result["score"], 2)
+        self.assertIsNone(s.packed_answers)
+        self.assertEqual(
+            dict(Answer.objects.filter(session=s).values_list("question_id", "selected")),
+            {self.ids["q0"]: ["a"], self.ids["q1"]: ["b"], self.ids["q2"]: ["a"]},
+        )
+        self.assert_counters()
+
+    @override_settings(QUIZ_ANSWER_STORAGE="packed")
+    def test_finish_inserts_packed_session(self):
+        sid, token = self.start()
+        self.assertEqual(self.finish(sid, None, HTTP_X_SESSION_TOKEN=token).status_code, 200)
+        s = QuizSession.objects.get(pk=sid)
+        self.assertFalse(Answer.objects.exists())
+        self.assertEqual(bytes(s.packed_answers), bytes([1, 2, 1, 0]))
+        self.assertEqual(unpack(s), {self.ids["q0"]: 1, self.ids["q1"]: 2, self.ids["q2"]: 1})
+        self.assert_counters()
+
+    def test_repeated_finish_returns_first_result(self):
+        sid, token = self.start()
+        self.finish(sid, token)
+        resp = self.finish(sid, token, answers=[{"questionId": f"q{i}", "choices": ["abcd"[i]]} for i in range(4)])
+        self.assertEqual(resp.json()["result"]["score"], 2)
+        self.assertEqual(QuizSession.objects.count(), 1)
+        self.assert_counters()    # a segunda chamada não soma de novo
+
+    def test_concurrent_finish_keeps_first_insert(self):
+        # dois finish passam pela checagem "sessão não existe"; o segundo INSERT bate na PK
+        sid, token = self.start()
+        self.finish(sid, token)
+        key = get_answer_key(self.quiz)
+        pairs = [(self.ids["q3"], letters_mask("d"))]
+        s, created = persist_finished_session(sid, self.quiz, key, {self.ids["q3"]: ["d"]}, pairs, grade_masks(key, pairs))
+        self.assertFalse(created)
+        self.assertEqual(s.result["score"], 2)
+        self.assertEqual(Answer.objects.filter(session_id=sid).count(), 3)
+        self.assert_counters()
+
+    def test_rejects_missing_or_foreign_token(self):
+        sid, token = self.start()
+        other, _ = self.start()
+        self.assertEqual(self.finish(sid, None).status_code, 404)
+        self.assertEqual(self.finish(other, token).status_code, 404)
+        self.assertEqual(self.finish(sid, token[:-2] + "xx").status_code, 404)
+        self.assertFalse(QuizSession.objects.exists())
+
+
+class GradingTests(QuizTestCase):
+    def test_letters_mask(self):
+        self.assertEqual(letters_mask(["a", "c"]), 0b0101)
+        self.assertEqual(letters_mask("d"), 0b1000)
+        self.assertEqual(letters_mask(["b", "b"]), 0b0010)
+        self.assertEqual(letters_mask(["z"]), 0b10000)    # fora de a..d: bit de escolha inválida
+        self.assertEqual(letters_mask(None), 0)
+
+    def test_question_credit(self):
+        key = letters_mask(["a", "b"])
+        self.assertEqual(question_credit(key, key, EXACT), 1)
+        self.assertEqual(question_credit(letters_mask("a"), key, EXACT), 0)
+        self.assertEqual(question_credit(letters_mask("a"), key, PARTIAL), 0.5)
+        self.assertEqual(question_credit(letters_mask(["a", "b", "c"]), key, PARTIAL), 0.5)
+        self.assertEqual(question_credit(letters_mask(["a", "z"]), key, PARTIAL), 0)
+        self.assertEqual(question_credit(letters_mask("c"), key, PARTIAL), 0)
+        self.assertEqual(question_credit(0, key, PARTIAL), 0)
+        self.assertEqual(question_credit(key, 0, EXACT), 0)    # pergunta sem gabarito
+
+    def test_grade_masks(self):
+        quiz = make_quiz(n_questions=5)
+        key = get_answer_key(quiz)
+        ids = list(quiz.questions.order_by("order").values_list("id", flat=True))
+        pairs = [(ids[0], letters_mask("a")), (ids[1], letters_mask("b")), (ids[2], letters_mask("a")),
+                 (ids[3], letters_mask("d"))]
+        self.assertEqual(grade_masks(key, pairs), {"score": 3, "total": 5, "percent": 60, "message": "Muito bom!"})
+        result = grade_masks(key, pairs[:2], question_ids=ids[:2])
+        self.assertEqual((result["score"], result["total"], result["percent"]), (2, 2, 100))
+        # resposta a pergunta desconhecida não pontua
+        self.assertEqual(grade_masks(key, [(-1, letters_mask("a"))])["score"], 0)
+
+
+def import_items(n=2, **overrides):
+    return [
+        {
+            "slug": f"q{i}", "title": f"Pergunta {i}", "kind": "single", "order": i,
+            "choices": [{"label": f"Opção {j}", "value": f"opt_{j}", "is_correct": j == 0, "order": j} for j in range(3)],
+            **overrides,
+        }
+        for i in range(n)
+    ]
+
+
+class ImporterTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quiz = Quiz.objects.create(slug="iq", title="IQ")
+
+    def test_create_then_noop(self):
+        stats = import_questions(self.quiz, import_items())
+        self.assertEqual(stats["questions_created"], 2)
+        self.assertEqual(stats["choices_created"], 6)
+        version = self.quiz.version
+        self.assertGreater(version, 1)
+
+        stats = import_questions(self.quiz, import_items())
+        self.assertEqual(+stats, {"questions_unchanged": 2})
+        self.quiz.refresh_from_db()
+        self.assertEqual(self.quiz.version, version)    # nada mudou: caches continuam válidos
+
+    def test_diff_stats(self):
+        import_questions(self.quiz, import_items())
+        items = import_items()
+        items[0]["title"] = "Nova"
+        items[1]["choices"][1]["is_correct"] = True
+        del items[1]["choices"][2]
+        items[1]["choices"].append({"label": "Nova", "value": "opt_9", "is_correct": False})
+        items.append(import_items(3)[2])
+        stats = import_questions(self.quiz, items)
+        self.assertEqual(+stats, {
+            "questions_created": 1, "questions_updated": 1, "questions_unchanged": 1,
+            "choices_created": 4, "choices_updated": 1, "choices_deleted": 1,
+        })
+        q1 = Question.objects.get(quiz=self.quiz, slug="q1")
+        self.assertEqual(sorted(q1.choices.values_list("value", flat=True)), ["opt_0", "opt_1", "opt_9"])
+        self.assertEqual(Question.objects.get(quiz=self.quiz, slug="q0").title, "Nova")
+
+
+class OutboxTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz()
+        self.session = QuizSession.objects.create(quiz=self.quiz)
+
+    def payment(self, status="approved"):
+        return {"status": status, "external_reference": str(self.session.pk)}
+
+    def test_enqueue_is_idempotent(self):
+        enqueue_payment("p1")
+        enqueue_payment("p1")
+        self.assertEqual(PaymentNotification.objects.count(), 1)
+
+    def test_claim_and_lease(self):
+        enqueue_payment("p1")
+        enqueue_payment("p2")
+        PaymentNotification.objects.filter(payment_id="p2").update(next_attempt_at=timezone.now() + timedelta(minutes=1))
+        claimed = claim_batch(10)
+        self.assertEqual([n.payment_id for n in claimed], ["p1"])
+        self.assertEqual((claimed[0].status, claimed[0].attempts), (PaymentNotification.STATUS_PROCESSING, 1))
+        self.assertEqual(claim_batch(10), [])    # reservada: outro worker não pega
+
+        # worker morreu com a linha reservada: vence o lease e ela volta
+        PaymentNotification.objects.filter(payment_id="p1").update(locked_at=timezone.now() - LEASE - timedelta(seconds=1))
+        again = claim_batch(10)
+        self.assertEqual([(n.payment_id, n.attempts) for n in again], [("p1", 2)])
+
+    def test_process_applies_once(self):
+        enqueue_payment("p1")
+        n = claim_batch(1)[0]
+        self.assertTrue(process_notification(n, fetch=lambda pid: self.payment()))
+        n.refresh_from_db()
+        self.assertEqual((n.status, n.payment_status), (PaymentNotification.STATUS_DONE, "approved"))
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.paid, self.session.mp_payment_id), (True, "p1"))
+        # reentrega aprovada não volta para a fila; a sessão já está paga
+        enqueue_payment("p1")
+        self.assertEqual(claim_batch(1), [])
+        self.assertFalse(process_notification(n, fetch=lambda pid: self.payment()))
+
+    def test_pending_payment_requeued_on_new_notification(self):
+        enqueue_payment("p1")
+        process_notification(claim_batch(1)[0], fetch=lambda pid: self.payment("pending"))
+        enqueue_payment("p1")
+        n = PaymentNotification.objects.get(payment_id="p1")
+        self.assertEqual((n.status, n.attempts), (PaymentNotification.STATUS_PENDING, 0))
+
+    def test_failure_backs_off_then_fails(self):
+        def boom(pid):
+            raise GatewayError("timeout")
+
+        enqueue_payment("p1")
+        n = claim_batch(1)[0]
+        with self.assertLogs("quizapp.outbox", "WARNING"):
+            self.assertIsNone(process_notification(n, fetch=boom, max_attempts=2))
+        n.refresh_from_db()
+        self.assertEqual((n.status, n.last_error), (PaymentNotification.STATUS_PENDING, "timeout"))
+        self.assertGreater(n.next_attempt_at, timezone.now())
+        self.assertEqual(claim_batch(1), [])    # ainda no backoff
+
+        PaymentNotification.objects.filter(pk=n.pk).update(next_attempt_at=timezone.now())
+        with self.assertLogs("quizapp.outbox", "WARNING"):
+            process_notification(claim_batch(1)[0], fetch=boom, max_attempts=2)
+        n.refresh_from_db()
+        self.assertEqual((n.status, n.attempts), (PaymentNotification.STATUS_FAILED, 2))
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("quizapp.payments.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_open_half_open_close(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+        self.now += 30
+        self.assertEqual(breaker.state, "half-open")
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())    # só uma chamada de teste
+        breaker.record_failure()              # falhou: reabre na hora
+        self.assertEqual(breaker.state, "open")
+
+        self.now += 30
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertEqual(breaker.failures, 0)
+
+    def test_gateway_short_circuits_and_ignores_4xx(self):
+        gateway = StubGateway(payments={"ok": {"status": "approved"}},
+                              breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30))
+        for _ in range(3):
+            with self.assertRaises(GatewayRejected):
+                gateway.get_payment("desconhecido")
+        self.assertEqual(gateway.breaker.state, "closed")    # 4xx não é falha do serviço
+
+        with mock.patch.object(gateway, "_payment", side_effect=OSError("reset")):
+            for _ in range(2):
+                with self.assertRaises(GatewayError):
+                    gateway.get_payment("ok")
+        self.assertFalse(gateway.healthy)
+        with self.assertRaises(GatewayUnavailable):
+            gateway.get_payment("ok")
+        self.assertEqual(gateway.stats.snapshot()["get_payment"]["rejected"], 1)
+
+        self.now += 30
+        self.assertEqual(gateway.get_payment("ok"), {"status": "approved"})
+        self.assertTrue(gateway.healthy)
+
+
+@override_settings(QUIZ_ANSWER_STORAGE="packed")
+class PackedAnswersTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz(n_questions=4)
+        self.session = QuizSession.objects.create(quiz=self.quiz)
+        self.ids = {q.slug: q.id for q in self.quiz.questions.all()}
+
+    def test_one_byte_per_question(self):
+        s = save_packed_answers(self.session.pk, [
+            {"questionId": "q0", "choices": ["a"]}, {"questionId": "q2", "choices": ["a", "c"]},
+            {"questionId": "nao-existe", "choices": ["a"]},
+        ])
+        self.assertEqual(bytes(s.packed_answers), bytes([1, 0, 5, 0]))
+        s = save_packed_answers(self.session.pk, [{"questionId": "q1", "choices": ["b"]}])
+        self.assertEqual(unpack(s), {self.ids["q0"]: 1, self.ids["q1"]: 2, self.ids["q2"]: 5})
+        self.assertEqual(Answer.objects.count(), 0)
+
+    def test_remap_after_new_version(self):
+        save_packed_answers(self.session.pk, [{"questionId": "q0", "choices": ["a"]}, {"questionId": "q3", "choices": ["d"]}])
+        # q0 vai para o fim, q3 é apagada: nova versão com outro layout
+        Question.objects.filter(pk=self.ids["q0"]).update(order=99)
+        Question.objects.filter(pk=self.ids["q3"]).delete()
+        bump_quiz_version(self.quiz)
+
+        s = save_packed_answers(self.session.pk, [{"questionId": "q1", "choices": ["b"]}])
+        self.assertEqual(s.packed_version, self.quiz.version)
+        self.assertEqual(bytes(s.packed_answers), bytes([2, 0, 1]))    # q1, q2, q0
+        self.assertEqual(unpack(s), {self.ids["q0"]: 1, self.ids["q1"]: 2})
+        self.assertEqual(grade_session(s, self.quiz)["score"], 2)
+
+    def test_layout_not_cached_when_transaction_rolls_back(self):
+        key = get_answer_key(self.quiz)
+        pairs = [(self.ids["q0"], 1)]
+        result = grade_masks(key, pairs)
+        # falha depois do ensure_layout: a transação desfaz o QuizLayout
+        with mock.patch("quizapp.stateless.count_graded", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                persist_finished_session(uuid.uuid4(), self.quiz, key, {}, pairs, result)
+        self.assertFalse(QuizLayout.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            s = save_packed_answers(self.session.pk, [{"questionId": "q1", "choices": ["b"]}])
+        self.assertTrue(QuizLayout.objects.filter(quiz=self.quiz, version=key.version).exists())
+        local_cache.clear()    # outro worker / reinício: só o banco conta
+        self.assertEqual(unpack(QuizSession.objects.get(pk=s.pk)), {self.ids["q1"]: 2})
+
+    def test_funnel(self):
+        sid = self.client.post("/api/quiz/start", {"slug": "iq"}, content_type="application/json").json()["session_id"]
+        answers = {"answers": [{"questionId": f"q{i}", "choices": ["abcd"[i]]} for i in range(3)]}
+        self.assertEqual(self.client.post(f"/api/quiz/{sid}/answer", answers, content_type="application/json").status_code, 200)
+        result = self.client.post(f"/api/quiz/{sid}/finish?slug=iq").json()["result"]
+        self.assertEqual((result["score"], result["total"]), (3, 4))
+        self.assertFalse(Answer.objects.exists())
+
+
+@override_settings(MP_ACCESS_TOKEN="test", MP_PREFERENCE_MODE="background")
+class PreferenceModeTests(QuizTestCase):
+    """Preferência fora do caminho do finish: estados que o waitForPreference (Quiz.vue) consulta."""
+    def setUp(self):
+        super().setUp()
+        self.gateway = StubGateway()
+        set_gateway(self.gateway)
+        self.addCleanup(set_gateway, None)
+        self.jobs = []
+        executor = mock.Mock(submit=lambda fn, *args: self.jobs.append((fn, args)))
+        for target, value in (("_executor", lambda: executor), ("close_old_connections", lambda: None)):
+            patcher = mock.patch(f"quizapp.preferences.{target}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.quiz = make_quiz()
+
+    def run_jobs(self):
+        jobs, self.jobs = self.jobs, []
+        for fn, args in jobs:
+            fn(*args)
+
+    def start(self):
+        return self.client.post("/api/quiz/start", {"slug": "iq"}, content_type="application/json").json()["session_id"]
+
+    def finish(self, sid):
+        return self.client.post(f"/api/quiz/{sid}/finish?slug=iq").json()
+
+    def status(self, url):
+        return self.client.get(url).json()
+
+    def test_background_pending_then_ready_and_reused(self):
+        sid = self.start()
+        data = self.finish(sid)
+        self.assertEqual(data["preference"], {"status": "pending", "status_url": f"/api/quiz/{sid}/payment"})
+        self.assertEqual(self.status(data["preference"]["status_url"])["status"], "pending")
+        self.assertEqual(self.finish(sid)["preference"]["status"], "pending")
+        self.assertEqual(len(self.jobs), 1)    # finish repetido não agenda outra
+
+        self.run_jobs()
+        st = self.status(data["preference"]["status_url"])
+        self.assertEqual(st["status"], "ready")
+        self.assertTrue(st["init_point"])
+        again = self.finish(sid)
+        self.assertEqual(again["preference_id"], st["preference_id"])
+        self.assertEqual((len(self.gateway.preferences), self.jobs), (1, []))
+
+    def test_gateway_failure_lands_as_failed_and_retries(self):
+        sid = self.start()
+        url = self.finish(sid)["preference"]["status_url"]
+        with mock.patch.object(self.gateway, "_create_preference", side_effect=OSError("reset")):
+            with self.assertLogs("quizapp.preferences", "ERROR"):
+                self.run_jobs()
+        self.assertEqual(self.status(url)["status"], "failed")
+
+        # novo finish reserva de novo a criação
+        self.assertEqual(self.finish(sid)["preference"]["status"], "pending")
+        self.run_jobs()
+        self.assertEqual(self.status(url)["status"], "ready")
+        self.assertEqual(len(self.gateway.preferences), 1)
+
+    @override_settings(MP_PREFERENCE_MODE="prefetch")
+    def test_prefetch_creates_at_start(self):
+        sid = self.start()
+        self.assertEqual(len(self.jobs), 1)
+        self.assertEqual(self.status(f"/api/quiz/{sid}/payment")["status"], "pending")
+        self.run_jobs()
+        data = self.finish(sid)
+        self.assertNotIn("preference", data)
+        self.assertTrue(data["preference_id"])
+        self.assertEqual((len(self.gateway.preferences), self.jobs), (1, []))
+
+
+class ConditionalGetTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz()
+
+    def test_questions_etag_and_304(self):
+        resp = self.client.get("/api/quiz/questions", {"slug": "iq"})
+        self.assertEqual(resp.status_code, 200)
+        etag = resp["ETag"]
+        self.assertIn("max-age=300", resp["Cache-Control"])
+        with self.assertNumQueries(1):    # só o Quiz do ETag; o payload nem é montado
+            resp = self.client.get("/api/quiz/questions", {"slug": "iq"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertIn("max-age=300", resp["Cache-Control"])
+
+        bump_quiz_version(self.quiz)
+        resp = self.client.get("/api/quiz/questions", {"slug": "iq"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp["ETag"], etag)
+
+    def test_questions_unknown_quiz(self):
+        self.assertEqual(self.client.get("/api/quiz/questions", {"slug": "nada"}).status_code, 404)
+
+    def test_catalog_etag_changes_with_catalog_and_query(self):
+        resp = self.client.get("/api/quiz/list")
+        etag = resp["ETag"]
+        self.assertEqual(self.client.get("/api/quiz/list", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get("/api/quiz/list", {"page_size": 1}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        make_quiz(slug="outro", n_questions=1)
+        self.assertEqual(self.client.get("/api/quiz/list", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(QUIZ_SHARED_CACHE="default")
+    def test_catalog_etag_from_shared_counter(self):
+        etag = self.client.get("/api/quiz/list")["ETag"]
+        with self.assertNumQueries(0):    # contador no cache, nada de varrer os quizzes
+            self.assertEqual(self.client.get("/api/quiz/list", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        def changed(action):
+            nonlocal etag
+            with self.captureOnCommitCallbacks(execute=True):
+                action()
+            new = self.client.get("/api/quiz/list")["ETag"]
+            self.assertNotEqual(new, etag)
+            etag = new
+
+        changed(lambda: make_quiz(slug="outro", n_questions=1))
+        changed(lambda: bump_quiz_version(self.quiz))
+        changed(lambda: Quiz.objects.get(slug="outro").delete())
+        # chave perdida: recomeça com um valor novo em vez de repetir um ETag antigo
+        caches["default"].clear()
+        self.assertNotEqual(self.client.get("/api/quiz/list")["ETag"], etag)
+
+
+class CatalogTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        Quiz.objects.bulk_create([Quiz(slug=f"quiz-{i:02d}", title=f"Quiz {i}", description="x" * 50) for i in range(30)])
+        Quiz.objects.filter(slug__in=["quiz-03", "quiz-04"]).update(is_active=False)
+
+    def get(self, url="/api/quiz/list", **params):
+        return self.client.get(url, params).json()
+
+    def test_cursor_pages_in_slug_order(self):
+        page = self.get()
+        slugs = [q["slug"] for q in page["results"]]
+        self.assertEqual(len(slugs), 24)
+        self.assertEqual(slugs, sorted(slugs))
+        self.assertNotIn("quiz-03", slugs)    # padrão: só ativos
+        rest = self.client.get(page["next"]).json()
+        self.assertEqual(len(rest["results"]), 4)
+        self.assertIsNone(rest["next"])
+        self.assertFalse(set(slugs) & {q["slug"] for q in rest["results"]})
+
+    def test_page_size_is_capped(self):
+        self.assertEqual(len(self.get(page_size=5)["results"]), 5)
+        with mock.patch.object(CatalogPagination, "max_page_size", 10):
+            self.assertEqual(len(self.get(page_size=1000)["results"]), 10)
+
+    def test_is_active_filter(self):
+        self.assertEqual([q["slug"] for q in self.get(is_active="false")["results"]], ["quiz-03", "quiz-04"])
+        self.assertEqual(len(self.get(is_active="all", page_size=100)["results"]), 30)
+
+    def test_field_projection(self):
+        with CaptureQueriesContext(connection) as ctx:
+            page = self.get(fields="slug,title,nope")
+        self.assertEqual(set(page["results"][0]), {"slug", "title"})
+        sql = " ".join(q["sql"] for q in ctx.captured_queries if '"quizapp_quiz"."slug"' in q["sql"])
+        self.assertNotIn('"quizapp_quiz"."description"', sql)    # .only() acompanha os campos
+        # nenhum campo válido: volta ao serializer completo
+        self.assertIn("description", self.get(fields="nope")["results"][0])
+
+
+def png_bytes(size=(800, 400), mode="RGBA", color=(200, 30, 30, 128)):
+    from PIL import Image
+
+    buf = BytesIO()
+    Image.new(mode, size, color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+@override_settings(QUIZ_COVER_WIDTHS=(320, 640, 1280), QUIZ_COVER_PROCESSING="sync")
+class CoverTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        override = override_settings(MEDIA_ROOT=root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.quiz = make_quiz(n_questions=1)
+
+    def set_cover(self, data, name="cover.png"):
+        self.quiz.refresh_from_db()
+        self.quiz.cover.save(name, ContentFile(data), save=False)
+        self.quiz.save(update_fields=["cover"])
+
+    def test_variants_sized_hashed_and_not_upscaled(self):
+        from PIL import Image
+
+        self.set_cover(png_bytes())
+        version = self.quiz.version
+        variants = process_cover(self.quiz.pk)
+        self.assertEqual(set(variants), {"webp", "jpeg"})
+        self.assertEqual(set(variants["webp"]), {"320", "640", "800"})    # 1280 > original → 800
+        self.assertRegex(variants["webp"]["320"], r"^quizzes/iq/cover-320\.[0-9a-f]{12}\.webp$")
+        with default_storage.open(variants["jpeg"]["320"]) as fp, Image.open(fp) as img:
+            self.assertEqual((img.format, img.size, img.mode), ("JPEG", (320, 160), "RGB"))
+        self.quiz.refresh_from_db()
+        self.assertEqual(self.quiz.cover_variants, variants)
+        self.assertGreater(self.quiz.version, version)    # snapshot/ETag expõem as novas URLs
+
+    def test_new_cover_replaces_old_variants(self):
+        self.set_cover(png_bytes())
+        old = process_cover(self.quiz.pk)
+        self.set_cover(png_bytes(color=(0, 0, 255, 255)))
+        new = process_cover(self.quiz.pk)
+        self.assertNotEqual(old["webp"]["320"], new["webp"]["320"])
+        self.assertFalse(default_storage.exists(old["webp"]["320"]))
+        self.assertTrue(default_storage.exists(new["webp"]["320"]))
+
+    def test_stale_job_does_not_overwrite(self):
+        self.set_cover(png_bytes())
+        real = covers.render_variants
+
+        def render_then_replace(fp, slug):
+            Quiz.objects.filter(pk=self.quiz.pk).update(cover="quizzes/outra.png")    # upload mais novo
+            return real(fp, slug)
+
+        with mock.patch("quizapp.covers.render_variants", render_then_replace):
+            self.assertIsNone(process_cover(self.quiz.pk))
+        self.quiz.refresh_from_db()
+        self.assertEqual(self.quiz.cover_variants, {})
+
+    def test_upload_schedules_processing_and_catalog_exposes_srcset(self):
+        upload = ContentFile(png_bytes(), name="capa.png")
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post("/api/quiz", {"slug": "novo", "title": "Novo", "cover": upload})
+        self.assertEqual(resp.status_code, 201)
+        item = next(q for q in self.client.get("/api/quiz/list").json()["results"] if q["slug"] == "novo")
+        srcset = item["cover_variants"]["webp"]["srcset"]
+        self.assertEqual(srcset.count("w,") + 1, 3)
+        self.assertIn("320w", srcset)
+        self.assertTrue(item["cover_variants"]["jpeg"]["640"].startswith("http://testserver/media/quizzes/novo/"))
+
+
+class MediaTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        override = override_settings(MEDIA_ROOT=root, MEDIA_SERVE_MODE="stream")
+        override.enable()
+        self.addCleanup(override.disable)
+        self.body = bytes(range(100))
+        Path(root, "cover.bin").write_bytes(self.body)
+        Path(root, "cover-640.0123abcd.webp").write_bytes(b"webp")
+        Path(root, "data.json").write_bytes(b'{"a": 1}')
+        Path(root, "data.json.gz").write_bytes(gzip.compress(b'{"a": 1}'))
+
+    def get(self, name, **headers):
+        return self.client.get(f"{settings.MEDIA_URL}{name}", **headers)
+
+    def content(self, resp):
+        return b"".join(resp.streaming_content)
+
+    def test_full_and_cache_headers(self):
+        resp = self.get("cover.bin")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.content(resp), self.body)
+        self.assertEqual(resp["Accept-Ranges"], "bytes")
+        self.assertEqual(resp["Cache-Control"], "public, max-age=3600")
+        self.assertIn("immutable", self.get("cover-640.0123abcd.webp")["Cache-Control"])
+        self.assertEqual(self.get("nada.bin").status_code, 404)
+        self.assertEqual(self.get("../settings.py").status_code, 400)    # safe_join: fora do MEDIA_ROOT
+
+    def test_range(self):
+        resp = self.get("cover.bin", HTTP_RANGE="bytes=10-19")
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp["Content-Range"], "bytes 10-19/100")
+        self.assertEqual(self.content(resp), self.body[10:20])
+        resp = self.get("cover.bin", HTTP_RANGE="bytes=-5")
+        self.assertEqual(self.content(resp), self.body[-5:])
+        resp = self.get("cover.bin", HTTP_RANGE="bytes=95-")
+        self.assertEqual(resp["Content-Range"], "bytes 95-99/100")
+
+    def test_unsatisfiable_range(self):
+        resp = self.get("cover.bin", HTTP_RANGE="bytes=100-")
+        self.assertEqual(resp.status_code, 416)
+        self.assertEqual(resp["Content-Range"], "bytes */100")
+
+    def test_if_range_mismatch_serves_full(self):
+        resp = self.get("cover.bin", HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"velho"')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.content(resp), self.body)
+
+    def test_not_modified(self):
+        resp = self.get("cover.bin")
+        self.assertEqual(self.get("cover.bin", HTTP_IF_NONE_MATCH=resp["ETag"]).status_code, 304)
+        self.assertEqual(self.get("cover.bin", HTTP_IF_MODIFIED_SINCE=resp["Last-Modified"]).status_code, 304)
+        self.assertEqual(self.get("cover.bin", HTTP_IF_NONE_MATCH='"outro"').status_code, 200)
+
+    def test_precompressed_variant(self):
+        resp = self.get("data.json", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(self.content(resp)), b'{"a": 1}')
+        self.assertIn("Accept-Encoding", resp["Vary"])
+        resp = self.get("data.json")
+        self.assertFalse(resp.has_header("Content-Encoding"))
+
+
+@override_settings(MP_ACCESS_TOKEN="bench", MP_PREFERENCE_MODE="sync")
+class QueryBudgetTests(QuizTestCase):
+    """Os orçamentos do bench_endpoints (cache quente, gateway stub) como asserções."""
+    def setUp(self):
+        super().setUp()
+        set_gateway(StubGateway())
+        self.addCleanup(set_gateway, None)
+        self.quiz = make_quiz(n_questions=20)
+        self.answers = {"answers": [{"questionId": f"q{i}", "choices": ["abcd"[i % 4]]} for i in range(20)]}
+        self.get_questions()    # aquece snapshot e gabarito
+
+    def get_questions(self):
+        return self.client.get("/api/quiz/questions", {"slug": "iq"})
+
+    def start(self):
+        return self.client.post("/api/quiz/start", {"slug": "iq"}, content_type="application/json").json()["session_id"]
+
+    def answer(self, sid):
+        return self.client.post(f"/api/quiz/{sid}/answer", self.answers, content_type="application/json")
+
+    def finish(self, sid):
+        return self.client.post(f"/api/quiz/{sid}/finish?slug=iq")
+
+    def test_list_questions(self):
+        with self.assertNumQueries(DEFAULT_BUDGETS["list_questions"]):
+            self.assertEqual(self.get_questions().status_code, 200)
+
+    def test_start_and_answer(self):
+        self.start()
+        with self.assertNumQueries(DEFAULT_BUDGETS["start_quiz"]):
+            sid = self.start()
+        with self.assertNumQueries(DEFAULT_BUDGETS["save_answers"]):
+            self.assertEqual(self.answer(sid).status_code, 200)
+
+    def test_finish_first_and_repeated(self):
+        sid = self.start()
+        self.answer(sid)
+        # + SAVEPOINT/RELEASE do atomic do record_result: no TestCase tudo roda dentro da
+        # transação do teste (o bench não conta instruções de transação)
+        with self.assertNumQueries(DEFAULT_BUDGETS["finish_quiz_first"] + 2):
+            resp = self.finish(sid)
+        self.assertEqual(resp.json()["result"]["score"], 20)
+        with self.assertNumQueries(DEFAULT_BUDGETS["finish_quiz"]):
+            self.assertEqual(self.finish(sid).status_code, 200)
+
+    def test_grade_and_calc(self):
+        sid = self.start()
+        self.answer(sid)
+        session = QuizSession.objects.get(pk=sid)
+        with self.assertNumQueries(DEFAULT_BUDGETS["grade_session"]):
+            grade_session(session, self.quiz)
+        with self.assertNumQueries(DEFAULT_BUDGETS["calc_result"]):
+            calc_result(session, self.quiz)
+
+
+class LargeTableAdminTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+        quiz = make_quiz()
+        QuizSession.objects.bulk_create([QuizSession(quiz=quiz) for _ in range(3)])
+        QuizSession.objects.filter(pk=QuizSession.objects.first().pk).update(created_at=timezone.now() - timedelta(days=400))
+
+    def test_session_changelist_without_date_scan(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get("/admin/quizapp/quizsession/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.context["cl"].result_list), 3)
+        self.assertFalse([q["sql"] for q in ctx.captured_queries if "DISTINCT" in q["sql"].upper()])
+
+        since = (timezone.now() - timedelta(days=7)).isoformat()
+        resp = self.client.get("/admin/quizapp/quizsession/", {"created_at__gte": since})
+        self.assertEqual(len(resp.context["cl"].result_list), 2)
+
+
+class MetricsEndpointTests(TestCase):
+    @override_settings(METRICS_TOKEN="", DEBUG=False)
+    def test_closed_without_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+    @override_settings(METRICS_TOKEN="", DEBUG=True)
+    def test_open_in_debug(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    @override_settings(METRICS_TOKEN="s3cr3t")
+    def test_bearer_token(self):
+        self.client.get("/health")
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer errado").status_code, 403)
+        resp = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cr3t")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("quiz_http_requests_total", resp.content.decode())
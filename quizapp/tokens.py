@@ -0,0 +1,38 @@
+"""
+Tokens assinados (django.core.signing: HMAC com SECRET_KEY + timestamp).
+
+Token de resultado: leva o resultado e o estado do pagamento da sessão.
+É emitido no finish e reemitido quando o pagamento é confirmado; com ele o
+GetResult responde sem ler o banco. Sem token, expirado, assinado com chave
+antiga ou ainda sem pagamento → cai na leitura da sessão (fallback).
+"""
+from django.conf import settings
+from django.core import signing
+
+RESULT_SALT = "quizapp.result"
+
+
+def result_token(session, result=None) -> str:
+    return signing.dumps(
+        {"sid": str(session.pk), "r": result if result is not None else session.result, "p": bool(session.paid)},
+        salt=RESULT_SALT,
+        compress=True,
+    )
+
+
+def read_result_token(token, session_id):
+    """Payload do token se válido, não expirado e da mesma sessão; senão None."""
+    if not token:
+        return None
+    try:
+        data = signing.loads(token, salt=RESULT_SALT, max_age=settings.RESULT_TOKEN_MAX_AGE)
+    except signing.BadSignature:   # inclui SignatureExpired
+        return None
+    if not isinstance(data, dict) or data.get("sid") != str(session_id):
+        return None
+    return data
+
+
+def token_from_request(request):
+    """Token em ?token= ou no header X-Result-Token."""
+    return request.GET.get("token") or request.headers.get("X-Result-Token")
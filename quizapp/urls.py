@@ -1,23 +1,50 @@
-from django.urls import path
+import re
+
+from django.urls import path, re_path
 from django.conf import settings
-from django.conf.urls.static import static
 
+from . import async_views
+from .media import serve_media
+from .metrics import metrics_view
 from .views import (
-    BulkCreateQuestions, CreateQuestion, CreateQuiz, ListQuizzes, Health, ListQuestions, StartQuiz, SaveAnswers, FinishQuiz, GetResult, MPWebhook, UpdateQuiz
+    BulkCreateQuestions, CreateQuestion, CreateQuiz, ListQuizzes, Health, ListQuestions, StartQuiz, SaveAnswers, FinishQuiz, GetResult, PaymentStatus, MPWebhook, UpdateQuiz,
+    QuizAnalytics, ExportSessions,
 )
 
 urlpatterns = [
     path("health", Health.as_view()),
+    path("metrics", metrics_view),
     path("api/quiz/questions", ListQuestions.as_view()),     
     path("api/quiz/list", ListQuizzes.as_view()),
     path("api/quiz", CreateQuiz.as_view()),                                   
     path("api/quiz/<slug:slug>/questions", CreateQuestion.as_view()),         
     path("api/quiz/<slug:slug>/questions/bulk", BulkCreateQuestions.as_view()),
 
-    path("api/quiz/start", StartQuiz.as_view()),
-    path("api/quiz/<str:session_id>/answer", SaveAnswers.as_view()),
-    path("api/quiz/<str:session_id>/finish", FinishQuiz.as_view()), 
-    path("api/result/<str:session_id>", GetResult.as_view()),
-    path("api/webhooks/mercadopago", MPWebhook.as_view()),
+    path("api/quiz/<str:session_id>/payment", PaymentStatus.as_view()),
     path("api/quiz/<slug:slug>/edit", UpdateQuiz.as_view()),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    path("api/quiz/<slug:slug>/analytics", QuizAnalytics.as_view()),
+    path("api/export/sessions", ExportSessions.as_view()),
+]
+
+if settings.QUIZ_ASYNC_VIEWS:
+    # funil async (servir com worker ASGI: gunicorn quiz.asgi:application -k uvicorn.workers.UvicornWorker)
+    urlpatterns += [
+        path("api/quiz/start", async_views.start_quiz),
+        path("api/quiz/<str:session_id>/answer", async_views.save_answers),
+        path("api/quiz/<str:session_id>/finish", async_views.finish_quiz),
+        path("api/result/<str:session_id>", async_views.get_result),
+        path("api/webhooks/mercadopago", async_views.mp_webhook),
+    ]
+else:
+    urlpatterns += [
+        path("api/quiz/start", StartQuiz.as_view()),
+        path("api/quiz/<str:session_id>/answer", SaveAnswers.as_view()),
+        path("api/quiz/<str:session_id>/finish", FinishQuiz.as_view()), 
+        path("api/result/<str:session_id>", GetResult.as_view()),
+        path("api/webhooks/mercadopago", MPWebhook.as_view()),
+    ]
+
+if settings.MEDIA_SERVE_MODE != "off":
+    urlpatterns += [
+        re_path(r"^%s(?P<path>.+)$" % re.escape(settings.MEDIA_URL.lstrip("/")), serve_media),
+    ]
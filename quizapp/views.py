@@ -1,22 +1,42 @@
-import json
-from decimal import Decimal
 import logging
 import os
+import uuid
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from mercadopago import SDK
-import requests, hmac, hashlib
+from rest_framework.permissions import IsAdminUser
+import hmac, hashlib
 from rest_framework.generics import ListAPIView
+from rest_framework.pagination import CursorPagination
 from .models import Quiz, QuizSession, Question, Choice, Answer
-from .serializers import QuizSerializer, QuestionOutSerializer, SaveAnswersSerializer, QuizCreateSerializer, QuestionCreateSerializer, BulkQuestionsSerializer
+from .serializers import QuizCatalogSerializer, QuestionOutSerializer, SaveAnswersSerializer, QuizCreateSerializer, QuizUpdateSerializer, QuestionCreateSerializer, BulkQuestionsSerializer
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.exceptions import APIException
-
-sdk = SDK(settings.MP_ACCESS_TOKEN) if settings.MP_ACCESS_TOKEN else None
+from .analytics import record_result, quiz_analytics, with_percentile
+from .cache import bump_quiz_version
+from .covers import schedule_cover_processing
+from .export import FORMATS as EXPORT_FORMATS, export_stream
+from .http_cache import conditional, catalog_etag, questions_etag
+from .snapshots import get_quiz_snapshot
+from .stateless import (
+    stateless_mode, session_token, read_session_token, session_token_from_request, selected_by_id,
+    persist_finished_session,
+)
+from .tokens import result_token, read_result_token, token_from_request
+from .answer_key import get_answer_key, letters_mask
+from .importer import import_questions
+from .packed import packed_mode, save_packed_answers, unpack
+from .pools import sample_questions
+from .ratelimit import rate_limited
+from .scoring import question_credit, result_payload
+from .outbox import enqueue_payment
+from .payments import get_gateway, GatewayUnavailable
+from .preferences import create_preference, preference_data, request_preference
 
 def calc_result(session: QuizSession, quiz: Quiz):
     """
@@ -25,20 +45,31 @@ def calc_result(session: QuizSession, quiz: Quiz):
       - MULTIPLE: acerto pleno se o conjunto de escolhas == conjunto de corretas.
       (Você pode alterar para crédito parcial depois.)
     """
-    total_questions = quiz.questions.count()
-    max_points = sum(q.weight for q in quiz.questions.all())
+    key = get_answer_key(quiz)
+    # sessão com amostra do banco: só as perguntas servidas contam
+    served = None if session.question_ids is None else set(session.question_ids)
+    positions = range(len(key)) if served is None else [key.pos_by_id[q] for q in served if q in key.pos_by_id]
+    total_questions = len(positions)
+    max_points = sum(key.weights[pos] for pos in positions)
     points = 0.0
     correct_count = 0
-    answers_map = {a.question_id: set(a.selected or []) for a in session.answers.select_related("question")}
-
-    for q in quiz.questions.prefetch_related("choices"):
-        correct_values = set(c.value for c in q.choices.all() if c.is_correct)
-        chosen_values = answers_map.get(q.id, set())
 
-        is_correct = (chosen_values == correct_values and len(correct_values) > 0)
-        if is_correct:
-            points += q.weight
-            correct_count += 1
+    if session.packed_answers is not None:
+        # modo compacto: guarda letras, então compara pelo bitmask do gabarito
+        for question_id, mask in served_pairs(unpack(session).items(), session.question_ids):
+            pos = key.pos_by_id.get(question_id)
+            if pos is not None and key.masks[pos] and mask == key.masks[pos]:
+                points += key.weights[pos]
+                correct_count += 1
+    else:
+        for question_id, selected in session.answers.values_list("question_id", "selected"):
+            pos = key.pos_by_id.get(question_id)
+            if pos is None or (served is not None and question_id not in served):
+                continue
+            correct_values = key.values[pos]
+            if correct_values and set(selected or []) == correct_values:
+                points += key.weights[pos]
+                correct_count += 1
 
     percent = (points / max_points * 100.0) if max_points > 0 else 0.0
     if percent >= 90:
@@ -74,22 +105,63 @@ class Health(APIView):
         token = os.getenv("MP_ACCESS_TOKEN", "")
         mode = "prod" if token.startswith("APP_USR-") else "sandbox"
         log.info("[MP] running in %s (token prefix: %s…)", mode, token[:8])
-        return Response({"ok": True, "mp_mode": mode, "mp_token_prefix": token[:8]})
+        gateway = get_gateway()
+        mp = None
+        if gateway is not None:
+            mp = {"gateway": gateway.name, "circuit": gateway.breaker.state, "calls": gateway.stats.snapshot()}
+        return Response({"ok": True, "mp_mode": mode, "mp_token_prefix": token[:8], "mp": mp})
         
-class ListQuizzes(ListAPIView):
-    queryset = Quiz.objects.all()
-    serializer_class = QuizSerializer
+class CatalogPagination(CursorPagination):
+    ordering = "slug"
+    page_size = 24
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
 
+@method_decorator(conditional(catalog_etag, "QUIZ_CATALOG_CACHE_CONTROL"), name="get")
+class ListQuizzes(ListAPIView):
+    """
+    GET /api/quiz/list?is_active=true&fields=slug,title,cover&page_size=24&cursor=...
+    Paginação por cursor em slug; `fields` projeta o serializer e o .only() da query.
+    """
+    serializer_class = QuizCatalogSerializer
+    pagination_class = CatalogPagination
+
+    def projected_fields(self):
+        raw = self.request.query_params.get("fields")
+        if not raw:
+            return None
+        allowed = QuizCatalogSerializer.Meta.fields
+        fields = [f for f in raw.split(",") if f in allowed]
+        return fields or None
+
+    def get_queryset(self):
+        qs = Quiz.objects.all()
+        is_active = self.request.query_params.get("is_active", "true").lower()
+        if is_active in ("true", "1"):
+            qs = qs.filter(is_active=True)
+        elif is_active in ("false", "0"):
+            qs = qs.filter(is_active=False)
+        # "all" (ou qualquer outro valor) → sem filtro
+        fields = self.projected_fields()
+        if fields:
+            # slug é a chave do cursor; id é a pk
+            qs = qs.only(*({"id", "slug"} | set(fields)))
+        return qs
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("context", self.get_serializer_context())
+        return QuizCatalogSerializer(*args, fields=self.projected_fields(), **kwargs)
+
+@method_decorator(conditional(questions_etag, "QUIZ_QUESTIONS_CACHE_CONTROL"), name="get")
 class ListQuestions(APIView):
     def get(self, req):
-        slug = req.query_params.get("slug", "iq")
-        try:
-            quiz = Quiz.objects.get(slug=slug, is_active=True)
-        except Quiz.DoesNotExist:
+        # o Quiz já foi lido pelo cálculo do ETag (questions_etag)
+        quiz = getattr(req, "quiz_obj", None)
+        if quiz is None:
             return Response({"error": "quiz not found"}, status=404)
-        qs = quiz.questions.prefetch_related("choices").all()
-        data = QuestionOutSerializer(qs, many=True).data
-        return Response({"quiz": quiz.slug, "title": quiz.title, "questions": data})
+        snapshot = get_quiz_snapshot(quiz)
+        return Response({"quiz": quiz.slug, "title": quiz.title, "questions": snapshot["questions"]})
 
 class CreateQuiz(APIView):
     """Cria ou atualiza um Quiz (POST /api/quizzes)"""
@@ -110,6 +182,7 @@ class CreateQuiz(APIView):
                 "title": data["title"],
                 "description": data.get("description", ""),
                 "is_active": data.get("is_active", True),
+                "sample_size": data.get("sample_size"),
                 "cover": cover_file, 
             }
         )
@@ -117,10 +190,14 @@ class CreateQuiz(APIView):
             quiz.title = data["title"]
             quiz.description = data.get("description", "")
             quiz.is_active = data.get("is_active", True)
+            quiz.sample_size = data.get("sample_size")
             if cover_file:
                 quiz.cover = cover_file
-            quiz.save(update_fields=["title","description","is_active","cover"] if cover_file
-                      else ["title","description","is_active"])
+            quiz.save(update_fields=["title","description","is_active","sample_size","cover"] if cover_file
+                      else ["title","description","is_active","sample_size"])
+        bump_quiz_version(quiz)
+        if cover_file:
+            schedule_cover_processing(quiz)
         return Response({
             "slug": quiz.slug,
             "title": quiz.title,
@@ -129,35 +206,9 @@ class CreateQuiz(APIView):
         }, status=201 if created else 200)
 
 def _upsert_question_with_choices(quiz: Quiz, qdata: dict):
-    """Cria/atualiza Question e substitui Choices pelo payload recebido."""
-    question, _ = Question.objects.get_or_create( 
-        quiz=quiz, slug=qdata["slug"],
-        defaults={
-            "title": qdata["title"],
-            "description": qdata.get("description",""),
-            "kind": qdata["kind"],
-            "required": qdata.get("required", True),
-            "order": qdata.get("order", 0),
-            "weight": qdata.get("weight", 1.0),
-        }
-    )
-    question.title = qdata["title"]
-    question.description = qdata.get("description","")
-    question.kind = qdata["kind"]
-    question.required = qdata.get("required", True)
-    question.order = qdata.get("order", 0)
-    question.weight = qdata.get("weight", 1.0)
-    question.save()
-
-    question.choices.all().delete()
-    for ch in qdata["choices"]:
-        question.choices.create(
-            label=ch["label"],
-            value=ch["value"],
-            is_correct=ch["is_correct"],
-            order=ch.get("order", 0),
-        )
-    return question
+    """Cria/atualiza Question e sincroniza as Choices com o payload recebido."""
+    import_questions(quiz, [qdata])
+    return quiz.questions.prefetch_related("choices").get(slug=qdata["slug"])
 
 class UpdateQuiz(APIView):
     parser_classes = [MultiPartParser, FormParser, JSONParser]
@@ -174,9 +225,22 @@ class UpdateQuiz(APIView):
         if "title" in data:        quiz.title = data["title"]
         if "description" in data:  quiz.description = data["description"]
         if "is_active" in data:    quiz.is_active = data["is_active"] in ["true", "1", True]
+        if "sample_size" in data:
+            ser = QuizUpdateSerializer(data={"sample_size": data["sample_size"] if data["sample_size"] != "" else None})
+            ser.is_valid(raise_exception=True)
+            quiz.sample_size = ser.validated_data["sample_size"]
         if cover_file:             quiz.cover = cover_file
 
-        quiz.save()
+        # só os campos enviados: um save completo regravaria a `version` lida acima e
+        # desfaria um bump concorrente (ex.: process_cover), reaproveitando o número
+        fields = [f for f in ("title", "description", "is_active", "sample_size") if f in data]
+        if cover_file:
+            fields.append("cover")
+        if fields:
+            quiz.save(update_fields=fields)
+        bump_quiz_version(quiz)
+        if cover_file:
+            schedule_cover_processing(quiz)
         return Response({
             "slug": quiz.slug,
             "title": quiz.title,
@@ -209,14 +273,20 @@ class BulkCreateQuestions(APIView):
 
         ser = BulkQuestionsSerializer(data=req.data)
         ser.is_valid(raise_exception=True)
-        created = []
-        for qdata in ser.validated_data["questions"]:
-            q = _upsert_question_with_choices(quiz, qdata)
-            created.append(QuestionOutSerializer(q).data)
-        return Response({"created": created}, status=201)
+        items = ser.validated_data["questions"]
+        # diff contra o banco + bulk writes, tudo numa transação
+        stats = import_questions(quiz, items)
+
+        slugs = list(dict.fromkeys(q["slug"] for q in items))
+        by_slug = {q.slug: q for q in quiz.questions.filter(slug__in=slugs).prefetch_related("choices")}
+        created = QuestionOutSerializer([by_slug[slug] for slug in slugs], many=True).data
+        return Response({"created": created, "stats": dict(stats)}, status=201)
 
 class StartQuiz(APIView):
     def post(self, req):
+        limited = rate_limited(req, "start")
+        if limited:
+            return limited
         slug = req.data.get("slug")
         if not slug:
             return Response({"error": "Missing slug"}, status=400)
@@ -226,65 +296,109 @@ class StartQuiz(APIView):
         except Quiz.DoesNotExist:
             return Response({"error": "quiz not found"}, status=404)
 
-        # cria e salva a sessão atrelada ao quiz
-        s = QuizSession.objects.create(quiz=quiz)
+        # perguntas vêm do snapshot compilado (sem leituras de Question/Choice);
+        # com sample_size, a sessão recebe uma amostra estratificada do banco
+        snapshot = get_quiz_snapshot(quiz)
+        sample = sample_questions(quiz, get_answer_key(quiz))
+        question_ids, questions = None, snapshot["questions"]
+        if sample is not None:
+            question_ids, positions = sample
+            questions = [snapshot["questions"][pos] for pos in positions]
+
+        if stateless_mode():
+            # nada é gravado até o finish: a sessão vive num token assinado
+            session_id = uuid.uuid4()
+            return Response({
+                "session_id": session_id,
+                "session_token": session_token(session_id, quiz, question_ids),
+                "quiz": snapshot["quiz"],
+                "questions": questions,
+            })
 
-        qs = quiz.questions.prefetch_related("choices").all()
-        questions_data = QuestionOutSerializer(qs, many=True).data
+        # cria e salva a sessão atrelada ao quiz
+        s = QuizSession.objects.create(quiz=quiz, question_ids=question_ids)
+        if settings.MP_PREFERENCE_MODE == "prefetch" and get_gateway() is not None:
+            request_preference(s)   # preferência pronta antes do finish
 
         return Response({
             "session_id": s.pk,                      
-            "quiz": QuizSerializer(quiz).data,
-            "questions": questions_data
+            "quiz": snapshot["quiz"],
+            "questions": questions
         })
 class SaveAnswers(APIView):
     def post(self, req, session_id):
-        try: s = QuizSession.objects.get(pk=session_id)
+        limited = rate_limited(req, "answer", session_id)
+        if limited:
+            return limited
+        try: s = QuizSession.objects.select_related("quiz").get(pk=session_id)
         except QuizSession.DoesNotExist:
+            if read_session_token(session_token_from_request(req, req.data), session_id):
+                # sessão sem estado: as respostas só chegam no finish
+                return Response({"ok": True, "stateless": True})
             return Response({"error":"session not found"}, status=404)
+        if s.quiz is None:
+            return Response({"error":"session has no quiz"}, status=400)
 
         ser = SaveAnswersSerializer(data=req.data)
         ser.is_valid(raise_exception=True)
-        # upsert por (session, question)
+
+        if packed_mode():
+            save_packed_answers(s.pk, ser.validated_data["answers"])
+            return Response({"ok": True})
+
+        # questionId vem como slug; resolve pelo gabarito em cache (escopo = quiz da sessão)
+        key = get_answer_key(s.quiz)
+        selected_by_qid = {}
         for a in ser.validated_data["answers"]:
-            qid = a["questionId"]
-            choices = a["choices"]
-            try:
-                # questionId vem como slug; precisamos achar a Question real
-                q = Question.objects.get(slug=qid)
-            except Question.DoesNotExist:
-                continue
-            Answer.objects.update_or_create(
-                session=s, question=q,
-                defaults={"selected": choices},
-            )
+            pos = key.pos_by_slug.get(a["questionId"])
+            if pos is not None:
+                selected_by_qid[key.ids[pos]] = a["choices"]   # repetidos: vale o último
+
+        # upsert por (session, question) em um único INSERT ... ON CONFLICT
+        Answer.objects.bulk_create(
+            [Answer(session=s, question_id=qid, selected=sel) for qid, sel in selected_by_qid.items()],
+            update_conflicts=True,
+            unique_fields=["session", "question"],
+            update_fields=["selected"],
+        )
         return Response({"ok": True})
     
-LETTERS = ["a", "b", "c", "d"]
+def served_pairs(pairs, question_ids):
+    """Descarta respostas a perguntas que não foram servidas na sessão (amostra do banco)."""
+    if question_ids is None:
+        return list(pairs)
+    served = set(question_ids)
+    return [(question_id, mask) for question_id, mask in pairs if question_id in served]
+
+def grade_masks(key, pairs, question_ids=None):
+    """
+    Pontua pares (question_id, bitmask de letras) — comum às respostas em linhas e compactas.
+    question_ids: perguntas servidas (amostra do banco); None = todas do gabarito.
+    Regra (exata ou crédito parcial) em settings.QUIZ_SCORING; ver scoring.py.
+    """
+    if question_ids is None:
+        total = sum(1 for mask in key.masks if mask)
+    else:
+        total = sum(1 for qid in question_ids if qid in key.pos_by_id and key.masks[key.pos_by_id[qid]])
+    rule = settings.QUIZ_SCORING
+    score = 0
+    for question_id, mask in pairs:
+        pos = key.pos_by_id.get(question_id)
+        if pos is not None:
+            score += question_credit(mask, key.masks[pos], rule)
+    return result_payload(score, total)
+
+def session_masks(session):
+    """Pares (question_id, bitmask) das respostas da sessão — em linhas ou compactas."""
+    if session.packed_answers is not None:
+        return list(unpack(session).items())
+    rows = Answer.objects.filter(session=session).values_list("question_id", "selected")
+    return [(question_id, letters_mask(selected)) for question_id, selected in rows]
+
 def grade_session(session, quiz):
-    # mapa de corretas por slug
-    correct_by_slug = {}
-    for q in quiz.questions.prefetch_related("choices").order_by("order", "id"):
-        choices = list(q.choices.all().order_by("order", "id"))
-        idx = next((i for i, ch in enumerate(choices) if ch.is_correct), None)
-        if idx is not None and idx < len(LETTERS):
-            correct_by_slug[q.slug] = LETTERS[idx]
-
-    # respostas do usuário (independente do related_name)
-    user_answers_qs = Answer.objects.filter(session=session).select_related("question")
-    answers = {}
-    for a in user_answers_qs:
-        sel = a.selected or []
-        # garante lista de letras
-        if isinstance(sel, str):
-            sel = [sel]
-        answers[a.question.slug] = sel
-
-    total = len(correct_by_slug)
-    score = sum(1 for slug, corr in correct_by_slug.items() if answers.get(slug, []) == [corr])
-    percent = 0 if total == 0 else round(score / total * 100)
-    msg = "Excelente!" if percent >= 85 else ("Muito bom!" if percent >= 60 else "Continue praticando!")
-    return {"score": score, "total": total, "percent": percent, "message": msg}
+    # gabarito compilado (cache por versão): uma única passada pelas respostas
+    pairs = served_pairs(session_masks(session), session.question_ids)
+    return grade_masks(get_answer_key(quiz), pairs, session.question_ids)
 
 class FinishQuiz(APIView):
     def post(self, request, session_id):
@@ -297,81 +411,122 @@ class FinishQuiz(APIView):
         except Quiz.DoesNotExist:
             return Response({"error":"quiz not found"}, status=404)
 
-        try:
-            s = QuizSession.objects.get(pk=session_id, quiz=quiz)
-        except QuizSession.DoesNotExist:
-            return Response({"error":"session not found"}, status=404)
-
-        # 1) Calcula e persiste resultado
-        result = grade_session(s, quiz)
-        s.result = result
-        s.save(update_fields=["result"])
+        key = get_answer_key(quiz)
+        s = QuizSession.objects.filter(pk=session_id, quiz=quiz).first()
+        if s is None:
+            # 1a) Sessão sem estado: token do start + respostas no corpo → tudo gravado agora
+            claims = read_session_token(session_token_from_request(request, request.data), session_id)
+            if claims is None or claims["q"] != quiz.pk:
+                return Response({"error":"session not found"}, status=404)
+            ser = SaveAnswersSerializer(data=request.data)
+            ser.is_valid(raise_exception=True)
+            question_ids = claims.get("ids")
+            selected = selected_by_id(key, ser.validated_data["answers"], question_ids)
+            pairs = [(qid, letters_mask(sel)) for qid, sel in selected.items()]
+            result = grade_masks(key, pairs, question_ids)
+            s, _ = persist_finished_session(session_id, quiz, key, selected, pairs, result, question_ids)
+            result = s.result
+        else:
+            # 1b) Calcula e persiste resultado (1ª correção também alimenta as estatísticas)
+            pairs = served_pairs(session_masks(s), s.question_ids)
+            result = grade_masks(key, pairs, s.question_ids)
+            record_result(s, result, key, pairs)
+        result = with_percentile(quiz.pk, result)
+        # token assinado: GetResult serve o resultado sem ler o banco (reemitido quando pago)
+        base = {"sessionId": str(s.pk), "result": result, "result_token": result_token(s, result)}
 
         # 2) Sem credencial → só devolve resultado
-        if not getattr(settings, "MP_ACCESS_TOKEN", None) or not sdk:
-            return Response({"sessionId": str(s.pk), "result": result})
-
-        # 3) Monta payload 100% serializável
-        price = getattr(settings, "QUIZ_PRICE", 0)
-        if isinstance(price, Decimal):
-            price = float(price)
-
-        payload = {
-            "items": [{
-                "title": f"Resultado do Quiz: {quiz.title}",
-                "quantity": 1,
-                "currency_id": str(getattr(settings, "CURRENCY", "BRL")),
-                "unit_price": float(price),
-            }],
-            "back_urls": {
-                "success": f"{settings.APP_BASE_URL}/quiz/sucesso",
-                "failure": f"{settings.APP_BASE_URL}/quiz/erro",
-                "pending": f"{settings.APP_BASE_URL}/quiz/aguardando",
-            },
-            "auto_return": "approved",
-            "notification_url": f"{settings.API_BASE_URL}/api/webhooks/mercadopago",
-            "external_reference": str(s.pk),   # 👈 UUID como string
-        }
+        gateway = get_gateway()
+        if gateway is None:
+            return Response(base)
 
-        try:
-            json.dumps(payload)
-        except TypeError as te:
-            return Response({"error": "payload_not_serializable", "detail": str(te), "payload": str(payload)}, status=500)
+        # 3) Preferência já criada (finish repetido ou criada no start) → reutiliza
+        if s.mp_pref_id:
+            return Response({**base, **preference_data(s)})
 
-        try:
-            mode = "prod" if str(getattr(settings, "MP_ACCESS_TOKEN","")).startswith("APP_USR-") else "sandbox"
-            print("[MP] mode:", mode, "APP_BASE_URL:", settings.APP_BASE_URL, "API_BASE_URL:", settings.API_BASE_URL)
-
-            resp = sdk.preference().create(payload)
-            pref = resp.get("response", {}) or {}
-
-            print("[MP PREF]", {
-                "status": resp.get("status"),
-                "id": pref.get("id"),
-                "init_point": pref.get("init_point"),
-                "sandbox_init_point": pref.get("sandbox_init_point"),
-                "collector_id": pref.get("collector_id"),
+        # 4) Modo assíncrono: responde já; o front consulta /payment até ficar pronta
+        if settings.MP_PREFERENCE_MODE != "sync":
+            status_ = request_preference(s)
+            return Response({
+                **base,
+                "preference": {"status": status_, "status_url": f"/api/quiz/{s.pk}/payment"},
             })
-            # pref = sdk.preference().create(payload)["response"]
 
-            s.mp_pref_id = pref.get("id")
-            s.save(update_fields=["mp_pref_id"])
-            init_point = pref.get("init_point") or pref.get("sandbox_init_point")    
+        try:
+            create_preference(s, quiz, gateway)
+            return Response({**base, **preference_data(s)})
+        except TypeError as te:
+            return Response({"error": "payload_not_serializable", "detail": str(te)}, status=500)
+        except GatewayUnavailable as e:
+            # MP instável (circuito aberto): degrada para só o resultado, sem esperar timeout
             return Response({
-                "sessionId": str(s.pk),
-                "result": result,
-                "preference_id": pref.get("id"),
-                "init_point": init_point,
-                "mode": "prod" if pref.get("init_point") else "sandbox",
+                **base,
+                "mp_error": str(e),
+                "payment_unavailable": True,
             })
         except Exception as e:
             # Não quebre o front: devolve resultado + erro do MP
             return Response({
-                "sessionId": str(s.pk),
-                "result": result,
+                **base,
                 "mp_error": str(e),
             }, status=502)
 
+class QuizAnalytics(APIView):
+    """Distribuição de escolhas e dificuldade por pergunta (GET /api/quiz/<slug>/analytics, staff)."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, req, slug):
+        try:
+            quiz = Quiz.objects.get(slug=slug)
+        except Quiz.DoesNotExist:
+            return Response({"error": "quiz not found"}, status=404)
+        return Response(quiz_analytics(quiz, get_answer_key(quiz), get_quiz_snapshot(quiz)))
+
+class ExportSessions(APIView):
+    """
+    GET /api/export/sessions?type=csv|ndjson&quiz=<slug>&since=YYYY-MM-DD&until=YYYY-MM-DD&gzip=1 (staff)
+    Streaming: memória constante independente do número de sessões.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, req):
+        fmt = req.query_params.get("type", "csv")
+        if fmt not in EXPORT_FORMATS:
+            return Response({"error": f"type deve ser um de {', '.join(EXPORT_FORMATS)}"}, status=400)
+        quiz = None
+        if req.query_params.get("quiz"):
+            quiz = Quiz.objects.filter(slug=req.query_params["quiz"]).first()
+            if quiz is None:
+                return Response({"error": "quiz not found"}, status=404)
+        compress = req.query_params.get("gzip") in ("1", "true")
+        try:
+            stream = export_stream(fmt, quiz, req.query_params.get("since"), req.query_params.get("until"), compress)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        filename = f"sessions-{quiz.slug if quiz else 'all'}.{fmt}" + (".gz" if compress else "")
+        content_type = "application/gzip" if compress else ("text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson")
+        response = StreamingHttpResponse(stream, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        response["Cache-Control"] = "no-store"
+        return response
+
+class PaymentStatus(APIView):
+    """Status da preferência de pagamento (GET /api/quiz/<session_id>/payment)"""
+    def get(self, req, session_id):
+        try:
+            s = QuizSession.objects.only(
+                "id", "quiz_id", "paid", "result", "mp_pref_id", "mp_pref_status", "mp_init_point"
+            ).get(pk=session_id)
+        except (QuizSession.DoesNotExist, ValidationError):
+            return Response({"error": "session not found"}, status=404)
+        status_ = QuizSession.PREF_READY if s.mp_pref_id else (s.mp_pref_status or None)
+        data = {"sessionId": str(s.pk), "status": status_, "paid": s.paid, **preference_data(s)}
+        if s.paid and s.result is not None:
+            # pagamento confirmado → token novo com p=True para o GetResult sem banco
+            data["result_token"] = result_token(s, with_percentile(s.quiz_id, s.result))
+        return Response(data)
+
 def verify_mp_signature(x_signature: str, x_request_id: str, payment_id: str) -> bool:
     secret = settings.MP_WEBHOOK_SECRET
     if not (secret and x_signature and x_request_id and payment_id): return False
@@ -398,30 +553,23 @@ class MPWebhook(APIView):
             pay_id
         )
 
-        if pay_id and settings.MP_ACCESS_TOKEN:
-            r = requests.get(
-                f"https://api.mercadopago.com/v1/payments/{pay_id}",
-                headers={"Authorization": f"Bearer {settings.MP_ACCESS_TOKEN}"}
-            )
-            payment = r.json()
-            if payment.get("status") == "approved":
-                ext = payment.get("external_reference")
-                if ext:
-                    try:
-                        s = QuizSession.objects.get(pk=ext)
-                        if not s.paid:
-                            s.paid = True
-                            s.mp_payment_id = s.mp_payment_id or str(pay_id)
-                            s.save(update_fields=["paid","mp_payment_id"])
-                    except QuizSession.DoesNotExist:
-                        pass
+        # só registra no outbox e responde; o run_payment_worker consulta o MP
+        if pay_id:
+            enqueue_payment(pay_id)
         return Response(status=200)
 
 class GetResult(APIView):
     def get(self, req, session_id):
+        # token válido de sessão paga → responde sem tocar no banco
+        token = read_result_token(token_from_request(req), session_id)
+        if token and token["p"]:
+            return Response({"result": token["r"]})
+
+        # fallback: sem token, expirado, revogado (chave trocada) ou pagamento ainda não visto no token
         try: s = QuizSession.objects.get(pk=session_id)
-        except QuizSession.DoesNotExist:
+        except (QuizSession.DoesNotExist, ValidationError):
             return Response({"error":"session not found"}, status=404)
         if not s.paid:
             return Response({"error":"payment_required"}, status=402)
-        return Response({"result": s.result})
+        result = with_percentile(s.quiz_id, s.result)
+        return Response({"result": result, "result_token": result_token(s, result)})